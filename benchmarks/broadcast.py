@@ -0,0 +1,108 @@
+"""
+Broadcast to many chats through a fake Bot API.
+
+Usage:
+    python benchmarks/broadcast.py [recipients] [latency ms]
+
+The fake bot answers send_message after the given latency, fails a few requests with a timeout and answers one
+request with a RetryAfter, as Telegram does under load. Compares the one-by-one loop the handlers used before
+with utils.broadcast and checks that the broadcaster stayed within the rate limits. Then broadcasts again while
+every recipient's chat deletes a few messages (utils.messages.delete_messages) and checks that sends and deletions
+together stay within the one limit of the bot and that the deletions let the sends go first.
+"""
+import asyncio
+import os
+import random
+import sys
+import time
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from telegram.error import Forbidden, RetryAfter, TimedOut  # noqa: E402
+
+from utils.broadcast import Broadcaster  # noqa: E402
+from utils.messages import delete_messages  # noqa: E402
+
+
+class FakeBot:
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.sent = []
+        self.deleted = []
+        self.flood_waited = False
+
+    async def send_message(self, chat_id: int, text: str, **kwargs):
+        await asyncio.sleep(self.latency)
+        if chat_id % 97 == 0:
+            raise Forbidden("Forbidden: bot was blocked by the user")
+        if random.random() < 0.02:
+            raise TimedOut()
+        if not self.flood_waited and len(self.sent) == 50:
+            self.flood_waited = True
+            raise RetryAfter(1)
+        self.sent.append((time.perf_counter(), chat_id))
+        return object()
+
+    async def delete_message(self, chat_id: int, message_id: int):
+        await asyncio.sleep(self.latency)
+        self.deleted.append((time.perf_counter(), chat_id))
+        return True
+
+
+async def sequential(bot: FakeBot, chat_ids):
+    for chat_id in chat_ids:
+        try:
+            await bot.send_message(chat_id=chat_id, text="Нова заявка")
+        except Exception:
+            # the old loops raised here and lost the rest, skipping only makes the comparison fair on time
+            continue
+
+
+def max_per_second(sent) -> int:
+    times = [moment for moment, _ in sent]
+    window, start = 0, 0
+    for end in range(len(times)):
+        while times[end] - times[start] >= 1:
+            start += 1
+        window = max(window, end - start + 1)
+    return window
+
+
+async def main(recipients: int = 200, latency_ms: int = 150):
+    random.seed(0)
+    chat_ids = range(1, recipients + 1)
+
+    bot = FakeBot(latency_ms / 1000)
+    started = time.perf_counter()
+    await sequential(bot, chat_ids)
+    print(f"one by one:  {time.perf_counter() - started:6.2f} s, delivered {len(bot.sent)}/{recipients}")
+
+    bot = FakeBot(latency_ms / 1000)
+    broadcaster = Broadcaster(backoff=0.2)
+    started = time.perf_counter()
+    deliveries = await broadcaster.broadcast(bot, chat_ids, text="Нова заявка")
+    elapsed = time.perf_counter() - started
+    failed = [delivery for delivery in deliveries if not delivery.ok]
+    print(f"broadcaster: {elapsed:6.2f} s, delivered {len(bot.sent)}/{recipients}, "
+          f"failed {len(failed)} ({', '.join(sorted({type(x.error).__name__ for x in failed}))}), "
+          f"retried {sum(delivery.attempts > 1 for delivery in deliveries)}")
+    limit = broadcaster.pacer.requests_per_second
+    print(f"max messages in one second: {max_per_second(bot.sent)} (limit {limit:g})")
+
+    bot = FakeBot(latency_ms / 1000)
+    context = SimpleNamespace(bot=bot)
+    started = time.perf_counter()
+    await asyncio.gather(broadcaster.broadcast(bot, chat_ids, text="Нова заявка"),
+                         *(delete_messages(context, chat_id, range(1, 4)) for chat_id in chat_ids))
+    elapsed = time.perf_counter() - started
+    # a deletion only goes when no send is waiting for its turn, only sends backing off after an error let them by
+    last_send = max(moment for moment, _ in bot.sent)
+    overtaken = sum(moment < last_send for moment, _ in bot.deleted)
+    print(f"with deletions: {elapsed:6.2f} s, {len(bot.sent)} sent and {len(bot.deleted)} deleted, "
+          f"{overtaken} deletions before the last send")
+    print(f"max requests in one second: {max_per_second(sorted(bot.sent + bot.deleted))} (limit {limit:g})")
+
+
+if __name__ == "__main__":
+    asyncio.run(main(*(int(arg) for arg in sys.argv[1:])))
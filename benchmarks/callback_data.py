@@ -0,0 +1,89 @@
+"""
+Packed callback data: correctness checks and speed.
+
+Usage:
+    python benchmarks/callback_data.py [fuzz cases]
+
+Checks that every registered action round-trips with random arguments (negative, zero, large, up to the 64 byte
+limit), that random and mutated strings either unpack to a registered action or raise ValueError and nothing
+else, and that every packed string is shorter than its plain form. Then times pack/unpack against the f-string
+and str.replace/int parsing of plain callback data. Exits with status 1 if a check fails.
+"""
+import os
+import random
+import string
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.callback_data import ACTIONS, MARKER, MAX_LENGTH, pack, unpack  # noqa: E402
+
+ALPHABET = string.ascii_letters + string.digits + "-_~=+/ é"
+
+
+def random_argument() -> int:
+    return random.choice([0, 1, -1, random.randint(0, 100), random.randint(0, 10 ** 6), random.randint(0, 2 ** 40),
+                          -random.randint(0, 10 ** 9), random.randint(0, 2 ** 62)])
+
+
+def check(cases: int) -> int:
+    failures = 0
+    for _ in range(cases):
+        action = random.choice(list(ACTIONS.values()))
+        arguments = tuple(random_argument() for _ in range(random.randint(0, 4)))
+        try:
+            data = pack(action, *arguments)
+        except ValueError:
+            # an action id and four arguments below 2 ** 63 pack into 56 characters at most
+            failures += 1
+            continue
+        failures += len(data) > MAX_LENGTH or unpack(data) != (action, arguments)
+        mutated = list(data)
+        mutated[random.randrange(len(mutated))] = random.choice(ALPHABET)
+        for garbage in ("".join(mutated), data[:random.randrange(len(data))],
+                        MARKER + "".join(random.choices(ALPHABET, k=random.randint(0, 20)))):
+            try:
+                unpacked = unpack(garbage)
+                failures += unpacked[0] not in ACTIONS.values()
+            except ValueError:
+                pass
+            except Exception as error:
+                print(f"{garbage!r}: {error!r}")
+                failures += 1
+    for action in ACTIONS.values():
+        failures += len(pack(action, 1375)) >= len(f"{action}1375")
+    return failures
+
+
+def timed(function, repeats: int) -> float:
+    # best of five rounds, the others are mostly noise of other processes
+    rounds = []
+    for _ in range(5):
+        started = time.perf_counter()
+        for _ in range(repeats):
+            function()
+        rounds.append((time.perf_counter() - started) / repeats)
+    return min(rounds)
+
+
+def main(cases: int = 20_000):
+    random.seed(0)
+    failures = check(cases)
+    print(f"{cases} fuzz cases, {failures} failures")
+
+    plain = "2_edit_menu_item_details_1375"
+    packed = pack("2_edit_menu_item_details_", 1375)
+    item_id = 1375
+    results = {"plain f-string": timed(lambda: f"2_edit_menu_item_details_{item_id}", 50_000),
+               "pack": timed(lambda: pack("2_edit_menu_item_details_", item_id), 50_000),
+               "plain str.replace + int": timed(lambda: int(plain.replace("2_edit_menu_item_details_", "")), 50_000),
+               "unpack": timed(lambda: unpack(packed), 50_000)}
+    print(f"{plain!r} ({len(plain)} bytes) -> {packed!r} ({len(packed)} bytes)")
+    for name, seconds in results.items():
+        print(f"{name:<24} {seconds * 1e9:7.0f} ns")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(*(int(arg) for arg in sys.argv[1:])))
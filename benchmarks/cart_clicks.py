@@ -0,0 +1,102 @@
+"""
+Concurrent add/remove clicks on the cart lose no updates.
+
+Usage:
+    python benchmarks/cart_clicks.py [clients] [clicks]
+
+Builds the bot like benchmarks/handlers.py does, with concurrent_updates on, and takes every client to the
+items of a category. Then it hands all the "add" and "remove" clicks of all clients to the update processor at
+once, `clicks` clicks per client on the same dish, every third one a remove, as if a client tapped faster than
+the bot answers. Exits with status 1 unless every cart ends with adds - removes of the dish and the last
+rendered button shows that quantity.
+"""
+import asyncio
+import logging
+import os
+import sys
+import tempfile
+import warnings
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from telegram.warnings import PTBUserWarning  # noqa: E402
+
+from handlers import BOT_ID, FakeBotAPI, click, client_steps, command, seed  # noqa: E402
+from utils.callback_data import pack  # noqa: E402
+
+
+async def run(clients: int, clicks: int, directory: str) -> int:
+    from main import build_application, post_init
+    from models.database import database
+    from models.migrations import migrate
+
+    database.configure(f"sqlite+aiosqlite:///{os.path.join(directory, 'cart.db')}")
+    logging.getLogger().setLevel(logging.WARNING)
+    warnings.filterwarnings("ignore", category=PTBUserWarning)
+    await migrate()
+    seeded = await seed(clients)
+    api = FakeBotAPI()
+    application = build_application({"token": f"{BOT_ID}:benchmark", "concurrent_updates": 64,
+                                     "persistence_file": os.path.join(directory, "persistence.db")}, request=api)
+    errors = []
+
+    async def record_error(update: object, context):
+        errors.append(context.error)
+
+    application.add_error_handler(record_error)
+    update_id = 0
+    failed = 0
+    async with application:
+        await post_init(application)
+        dishes = {}
+        for client_id in seeded["locations"]:
+            # up to the list of dishes, one update after another
+            steps = [step for step in client_steps(client_id, seeded, 0) if step[0] != "order_add_item"][:-1]
+            for handler, data in steps:
+                update_id += 1
+                if data is None:
+                    update = command(application.bot, update_id, client_id, "/start")
+                else:
+                    message_id = application.chat_data[client_id]["last_message"]
+                    update = click(application.bot, update_id, client_id, message_id, data)
+                await application.process_update(update)
+            _, categories = seeded["restaurants"][client_id % len(seeded["restaurants"])]
+            dishes[client_id] = categories[client_id % len(categories)][1][0]
+
+        updates = []
+        for index in range(clicks):
+            for client_id, dish in dishes.items():
+                update_id += 1
+                action = "order_remove_item_" if index % 3 == 2 else "order_add_item_"
+                message_id = application.chat_data[client_id]["order_message"]
+                updates.append(click(application.bot, update_id, client_id, message_id, pack(action, dish)))
+        processor = application.update_processor
+        await asyncio.gather(*(processor.process_update(update, application.process_update(update))
+                               for update in updates))
+
+        # every third click removes one
+        expected = clicks - 2 * (clicks // 3)
+        for client_id, dish in dishes.items():
+            quantity = application.chat_data[client_id]["order"]["cart"].quantity(dish)
+            if quantity != expected:
+                failed += 1
+                print(f"client {client_id}: {quantity} in the cart, {expected} expected")
+            shown = f"Прибрати ({expected})"
+            if shown not in str(api.screens[client_id].get("reply_markup")):
+                failed += 1
+                print(f"client {client_id}: the last screen doesn't show {shown!r}")
+    await database.dispose()
+
+    print(f"{clients} clients, {clicks} concurrent clicks each, {len(updates)} updates")
+    for error in errors[:5]:
+        print(f"handler failed: {error}")
+    print(f"{failed} carts wrong, {len(errors)} updates failed")
+    return failed + len(errors)
+
+
+def main(clients: int = 20, clicks: int = 30):
+    return 1 if asyncio.run(run(clients, clicks, tempfile.mkdtemp())) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(*(int(arg) for arg in sys.argv[1:])))
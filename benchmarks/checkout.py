@@ -0,0 +1,109 @@
+"""
+Checkout refuses carts of a restaurant that can't deliver any more.
+
+Usage:
+    python benchmarks/checkout.py [clients]
+
+Builds the bot like benchmarks/handlers.py does, rate limits of the broadcaster lifted, and takes every client
+through the order flow up to the checkout button. Then the restaurant of every other client loses its branches,
+as when an owner deletes them while clients are choosing, and all clients check out. Exits with status 1 unless
+exactly the clients whose restaurant still has a branch got an order, the others were told the restaurant can't
+deliver to them and nothing was written for them, and no handler raised.
+"""
+import asyncio
+import logging
+import os
+import sys
+import tempfile
+import warnings
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from telegram.warnings import PTBUserWarning  # noqa: E402
+
+from handlers import BOT_ID, FakeBotAPI, click, client_steps, command, seed  # noqa: E402
+
+REFUSAL = "цей ресторан більше не може доставити"
+
+
+async def run(clients: int, directory: str) -> int:
+    from sqlalchemy import func, select
+
+    from main import build_application, post_init
+    from models.base import OrderHeader
+    from models.database import database
+    from models.geo import restaurant_locations
+    from models.migrations import migrate
+    from utils.broadcast import broadcaster, pacer
+
+    database.configure(f"sqlite+aiosqlite:///{os.path.join(directory, 'checkout.db')}")
+    logging.getLogger().setLevel(logging.WARNING)
+    warnings.filterwarnings("ignore", category=PTBUserWarning)
+    await migrate()
+    seeded = await seed(clients)
+    pacer.requests_per_second = float("inf")
+    broadcaster.chat_interval = 0
+    api = FakeBotAPI()
+    application = build_application({"token": f"{BOT_ID}:benchmark",
+                                     "persistence_file": os.path.join(directory, "persistence.db")}, request=api)
+    errors = []
+
+    async def record_error(update: object, context):
+        errors.append(context.error)
+
+    application.add_error_handler(record_error)
+    update_id = 0
+    failed = 0
+
+    async def orders_of(client_id: int) -> int:
+        async with database.session() as session:
+            return await session.scalar(select(func.count(OrderHeader.id)).where(OrderHeader.client_id == client_id))
+
+    async with application:
+        await post_init(application)
+        closed = set()
+        for index, client_id in enumerate(seeded["locations"]):
+            *steps, _ = client_steps(client_id, seeded, 0)
+            for handler, data in steps:
+                update_id += 1
+                if data is None:
+                    update = command(application.bot, update_id, client_id, "/start")
+                else:
+                    message_id = application.chat_data[client_id]["last_message"]
+                    update = click(application.bot, update_id, client_id, message_id, data)
+                await application.process_update(update)
+            if index % 2:
+                closed.add(application.chat_data[client_id]["order"]["cart"].restaurant_id)
+        for restaurant_id in closed:
+            restaurant_locations.remove_restaurant(restaurant_id)
+
+        for client_id in seeded["locations"]:
+            update_id += 1
+            cart = application.chat_data[client_id]["order"]["cart"]
+            message_id = application.chat_data[client_id]["last_message"]
+            await application.process_update(click(application.bot, update_id, client_id, message_id,
+                                                   "finish_order"))
+            refused = REFUSAL in api.screens[client_id]["text"]
+            orders = await orders_of(client_id)
+            if cart.restaurant_id in closed and (not refused or orders):
+                failed += 1
+                print(f"client {client_id}: restaurant {cart.restaurant_id} has no branch, {orders} order(s) "
+                      f"placed, {'refused' if refused else 'not refused'}")
+            elif cart.restaurant_id not in closed and (refused or orders != 1):
+                failed += 1
+                print(f"client {client_id}: {orders} order(s) placed, {'refused' if refused else 'not refused'}")
+    await database.dispose()
+
+    print(f"{clients} clients, {len(closed)} of {len(seeded['restaurants'])} restaurants without branches")
+    for error in errors[:5]:
+        print(f"handler failed: {error!r}")
+    print(f"{failed} checkouts wrong, {len(errors)} updates failed")
+    return failed + len(errors)
+
+
+def main(clients: int = 16):
+    return 1 if asyncio.run(run(clients, tempfile.mkdtemp())) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(*(int(arg) for arg in sys.argv[1:])))
@@ -0,0 +1,170 @@
+"""
+Orders checked out at the same time are assigned to couriers without overbooking them.
+
+Usage:
+    python benchmarks/courier_dispatch.py [clients]
+
+Builds the bot like benchmarks/handlers.py does, with concurrent_updates on and rate limits of the broadcaster
+lifted, and takes every client through the order flow up to the checkout button. Then all clients check out at
+once, more of them than the couriers on shift can take, and one courier has blocked the bot. Exits with status 1
+unless the couriers' loads in the courier pool match the database and stay within the limit, every courier was
+told about exactly the orders the database gives them, the courier who blocked the bot has none, the orders nobody
+could take are the queued ones, and no handler raised. The pool of a second worker process, loaded before the
+checkouts and kept up to date only with the changes the first one published (see models.sync), has to end the same.
+"""
+import asyncio
+import json
+import logging
+import os
+import sys
+import tempfile
+import warnings
+from collections import Counter
+from typing import Set, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from telegram.warnings import PTBUserWarning  # noqa: E402
+
+from handlers import BOT_ID, COURIERS, FakeBotAPI, click, client_steps, command, seed  # noqa: E402
+
+NEW_ORDER = "Нове замовлення!"
+# the first courier of benchmarks/handlers.py
+BLOCKED = 20_000
+
+
+class CourierAPI(FakeBotAPI):
+    """Also counts the "new order" messages every courier got about every order. Messages to the `unreachable`
+    chats fail as they do when the user blocked the bot."""
+
+    def __init__(self, unreachable: Set[int]):
+        super().__init__()
+        self.unreachable = unreachable
+        self.notified = Counter()
+
+    async def do_request(self, url: str, method: str, request_data=None, **kwargs) -> Tuple[int, bytes]:
+        parameters = request_data.parameters if request_data else {}
+        if url.endswith("/sendMessage") and int(parameters["chat_id"]) in self.unreachable:
+            return 403, json.dumps({"ok": False, "error_code": 403,
+                                    "description": "Forbidden: bot was blocked by the user"}).encode()
+        code, payload = await super().do_request(url, method, request_data, **kwargs)
+        if url.endswith("/sendMessage") and parameters.get("text", "").startswith(NEW_ORDER):
+            markup = parameters["reply_markup"]
+            data = (json.loads(markup) if isinstance(markup, str) else markup)["inline_keyboard"][0][0]
+            self.notified[(int(parameters["chat_id"]), data["callback_data"])] += 1
+        return code, payload
+
+
+async def run(clients: int, directory: str) -> int:
+    from sqlalchemy import select
+
+    from main import build_application, post_init
+    from models.base import OrderHeader
+    from models.database import database
+    from models import sync
+    from models.dispatch import Dispatcher, dispatcher
+    from models.migrations import migrate
+    from utils.broadcast import broadcaster, pacer
+    from utils.callback_data import pack
+
+    database.configure(f"sqlite+aiosqlite:///{os.path.join(directory, 'dispatch.db')}")
+    logging.getLogger().setLevel(logging.WARNING)
+    # every checkout waits for the others to write, the slow handler warnings are expected here
+    logging.getLogger("utils.instrumentation").setLevel(logging.ERROR)
+    # and so are the failed messages to the courier who blocked the bot
+    logging.getLogger("utils.broadcast").setLevel(logging.ERROR)
+    warnings.filterwarnings("ignore", category=PTBUserWarning)
+    await migrate()
+    seeded = await seed(clients)
+    pacer.requests_per_second = float("inf")
+    broadcaster.chat_interval = 0
+    api = CourierAPI({BLOCKED})
+    application = build_application({"token": f"{BOT_ID}:benchmark", "concurrent_updates": 64,
+                                     "persistence_file": os.path.join(directory, "persistence.db")}, request=api)
+    errors = []
+
+    async def record_error(update: object, context):
+        errors.append(context.error)
+
+    application.add_error_handler(record_error)
+    update_id = 0
+    failed = 0
+    async with application:
+        await post_init(application)
+        replica = Dispatcher()
+        await replica.load()
+        published = []
+        sync.publisher = published.append
+        updates = []
+        for client_id in seeded["locations"]:
+            *steps, (_, checkout) = client_steps(client_id, seeded, 0)
+            for handler, data in steps:
+                update_id += 1
+                if data is None:
+                    update = command(application.bot, update_id, client_id, "/start")
+                else:
+                    message_id = application.chat_data[client_id]["last_message"]
+                    update = click(application.bot, update_id, client_id, message_id, data)
+                await application.process_update(update)
+            update_id += 1
+            updates.append(click(application.bot, update_id, client_id,
+                                 application.chat_data[client_id]["last_message"], checkout))
+        processor = application.update_processor
+        await asyncio.gather(*(processor.process_update(update, application.process_update(update))
+                               for update in updates))
+
+        sync.publisher = None
+        for target, method, args in published:
+            if target == "dispatcher":
+                getattr(replica, method)(*args)
+
+        async with database.session() as session:
+            assigned = dict((await session.execute(select(OrderHeader.id, OrderHeader.delivery_guy_id)
+                                                   .where(OrderHeader.delivery_guy_id.is_not(None)))).all())
+        loads = await OrderHeader.courier_loads()
+        for name, pool in (("courier pool", dispatcher), ("pool of the second worker", replica)):
+            pool_loads = {courier.id: courier.load for courier in pool.couriers.values() if courier.load}
+            if pool_loads != loads:
+                failed += 1
+                print(f"loads in the {name} {pool_loads} differ from the database {loads}")
+        overbooked = {courier_id: load for courier_id, load in loads.items() if load > dispatcher.max_load}
+        if overbooked:
+            failed += 1
+            print(f"couriers over the limit of {dispatcher.max_load} orders: {overbooked}")
+        expected = Counter({(courier_id, pack("order_delivered_", order_id)): 1
+                            for order_id, courier_id in assigned.items()})
+        if api.notified != expected:
+            failed += 1
+            print(f"{sum((api.notified - expected).values())} unexpected and "
+                  f"{sum((expected - api.notified).values())} missing order notifications")
+        waiting = sorted(order.id for order in await OrderHeader.list_unassigned())
+        for name, pool in (("courier pool", dispatcher), ("pool of the second worker", replica)):
+            queued = sorted(order.id for order in pool.pending)
+            if queued != waiting:
+                failed += 1
+                print(f"orders queued in the {name} {queued} differ from the database {waiting}")
+        if BLOCKED in assigned.values():
+            failed += 1
+            print("the courier who blocked the bot has orders "
+                  f"{[order_id for order_id, courier_id in assigned.items() if courier_id == BLOCKED]}")
+        places = (COURIERS - 1) * dispatcher.max_load
+        if len(assigned) != min(clients, places):
+            failed += 1
+            print(f"{len(assigned)} orders assigned, {min(clients, places)} expected")
+    await database.dispose()
+
+    print(f"{clients} clients checked out at once, {COURIERS} couriers taking up to {dispatcher.max_load} orders, "
+          f"one of them blocked the bot: "
+          f"{len(assigned)} orders assigned, {len(waiting)} waiting")
+    for error in errors[:5]:
+        print(f"handler failed: {error!r}")
+    print(f"{failed} checks failed, {len(errors)} updates failed")
+    return failed + len(errors)
+
+
+def main(clients: int = 40):
+    return 1 if asyncio.run(run(clients, tempfile.mkdtemp())) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(*(int(arg) for arg in sys.argv[1:])))
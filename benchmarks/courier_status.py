@@ -0,0 +1,102 @@
+"""
+Current courier status on a long status history.
+
+Usage:
+    python benchmarks/courier_status.py [history rows] [couriers]
+
+Fills a scratch SQLite database with a check in/out history (a million rows by default), then compares the
+ORDER BY id DESC scan of the history, with and without the (delivery_guy_id, id) index, against the maintained
+current status that DeliveryGuyStatus.last_status / list_active read now.
+"""
+import asyncio
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+HISTORY_QUERY = "SELECT * FROM delivery_guy_statuses WHERE delivery_guy_id = ? ORDER BY id DESC LIMIT 1"
+ACTIVE_QUERY = "SELECT * FROM delivery_guy_statuses WHERE active AND id IN " \
+               "(SELECT max(id) FROM delivery_guy_statuses GROUP BY delivery_guy_id)"
+CURRENT_QUERY = "SELECT s.* FROM delivery_guy_current_statuses c " \
+                "JOIN delivery_guy_statuses s ON s.id = c.status_id WHERE c.delivery_guy_id = ?"
+CURRENT_ACTIVE_QUERY = "SELECT s.* FROM delivery_guy_current_statuses c " \
+                       "JOIN delivery_guy_statuses s ON s.id = c.status_id WHERE c.active"
+
+
+def timed(function, repeat: int) -> float:
+    started = time.perf_counter()
+    for _ in range(repeat):
+        function()
+    return (time.perf_counter() - started) / repeat
+
+
+async def atimed(function, repeat: int) -> float:
+    started = time.perf_counter()
+    for _ in range(repeat):
+        await function()
+    return (time.perf_counter() - started) / repeat
+
+
+async def main(rows: int = 1_000_000, couriers: int = 1_000):
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, "bench.db")
+    from models.base import Base, DeliveryGuyStatus
+    from models.database import database
+
+    database.configure(f"sqlite+aiosqlite:///{path}")
+    async with database.engine.begin() as connection:
+        await connection.run_sync(Base.metadata.create_all)
+
+    random.seed(0)
+    started = datetime(2023, 1, 1)
+    connection = sqlite3.connect(path)
+    with connection:
+        connection.executemany("INSERT INTO users (telegram_id, phone_number, role) VALUES (?, ?, 'delivery_guy')",
+                               ((courier, str(courier)) for courier in range(couriers)))
+        active = {}
+        history = []
+        for row_id in range(1, rows + 1):
+            courier = random.randrange(couriers)
+            active[courier] = not active.get(courier, False)
+            history.append((row_id, courier, active[courier], started + timedelta(minutes=row_id)))
+        connection.executemany("INSERT INTO delivery_guy_statuses (id, delivery_guy_id, active, timestamp) "
+                               "VALUES (?, ?, ?, ?)", history)
+        latest = {courier: row_id for row_id, courier, _, _ in history}
+        connection.executemany("INSERT INTO delivery_guy_current_statuses (delivery_guy_id, status_id, active) "
+                               "VALUES (?, ?, ?)",
+                               ((courier, row_id, active[courier]) for courier, row_id in latest.items()))
+    print(f"{rows:,} status rows, {couriers:,} couriers, {sum(active.values())} on shift")
+
+    # couriers that have not checked in/out for the longest time are the worst case for a history scan
+    quiet = sorted(latest, key=latest.get)[:20]
+
+    def last_status(query):
+        return timed(lambda: [connection.execute(query, (courier,)).fetchone() for courier in quiet], 1) / len(quiet)
+
+    results = {"last status, current status": last_status(CURRENT_QUERY),
+               "last status, history with index": last_status(HISTORY_QUERY),
+               "active couriers, current status": timed(lambda: connection.execute(CURRENT_ACTIVE_QUERY).fetchall(), 3),
+               "active couriers, history with index": timed(lambda: connection.execute(ACTIVE_QUERY).fetchall(), 3)}
+    connection.execute("DROP INDEX ix_delivery_guy_statuses_delivery_guy_id_id")
+    results["last status, history without index"] = last_status(HISTORY_QUERY)
+    results["active couriers, history without index"] = timed(lambda: connection.execute(ACTIVE_QUERY).fetchall(), 3)
+    connection.close()
+    for name, seconds in sorted(results.items()):
+        print(f"{name:<40} {seconds * 1000:9.3f} ms")
+
+    # the same through the models, session and ORM overhead included
+    orm = {"DeliveryGuyStatus.last_status": await atimed(lambda: DeliveryGuyStatus.last_status(quiet[0]), 50),
+           "DeliveryGuyStatus.list_active": await atimed(DeliveryGuyStatus.list_active, 3)}
+    await database.dispose()
+    for name, seconds in orm.items():
+        print(f"{name:<40} {seconds * 1000:9.3f} ms")
+
+
+if __name__ == "__main__":
+    asyncio.run(main(*(int(arg) for arg in sys.argv[1:])))
@@ -0,0 +1,80 @@
+"""
+Courier dispatch on synthetic couriers and orders.
+
+Usage:
+    python benchmarks/dispatch.py [couriers] [orders per hour] [hours]
+
+Couriers start their shifts at random times, orders appear uniformly over the simulated hours with random
+restaurants and clients around Lviv, and every delivery takes 20-50 minutes. Prints how long one assignment
+takes and how the orders were spread.
+"""
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models.dispatch import Dispatcher, PendingOrder  # noqa: E402
+from models.geo import haversine  # noqa: E402
+
+CENTER = (49.8397, 24.0297)
+
+
+def point():
+    return CENTER[0] + random.uniform(-0.06, 0.06), CENTER[1] + random.uniform(-0.09, 0.09)
+
+
+def main(couriers: int = 300, orders_per_hour: int = 1_000, hours: int = 4):
+    random.seed(0)
+    start = datetime(2024, 1, 1, 10)
+    dispatcher = Dispatcher()
+    for courier_id in range(couriers):
+        dispatcher.check_in(courier_id, start - timedelta(minutes=random.randint(0, 240)))
+    # (delivered at, courier id), sorted by time
+    deliveries = []
+    timings = []
+    pickup_distances = []
+    orders = orders_per_hour * hours
+    for order_id in range(orders):
+        now = start + timedelta(hours=hours) * order_id / orders
+        while deliveries and deliveries[0][0] <= now:
+            dispatcher.release(deliveries.pop(0)[1])
+            # what assign_pending() does, with every assignment accepted by the database
+            while dispatcher.pending:
+                order = dispatcher.pending[0]
+                courier = dispatcher.choose(*order.pickup, now=now)
+                if courier is None:
+                    break
+                dispatcher.book(order.id, courier.id, order.destination)
+                deliveries.append((now + timedelta(minutes=random.randint(20, 50)), courier.id))
+            deliveries.sort()
+        order = PendingOrder(id=order_id, pickup=point(), destination=point())
+        started = time.perf_counter()
+        courier = dispatcher.choose(*order.pickup, now=now)
+        if courier is None:
+            dispatcher.enqueue(order)
+            timings.append(time.perf_counter() - started)
+            continue
+        position = (courier.latitude, courier.longitude)
+        dispatcher.book(order.id, courier.id, order.destination)
+        timings.append(time.perf_counter() - started)
+        if position[0] is not None:
+            pickup_distances.append(haversine(*position, *order.pickup))
+        deliveries.append((now + timedelta(minutes=random.randint(20, 50)), courier.id))
+        deliveries.sort()
+
+    timings.sort()
+    loads = [courier.load for courier in dispatcher.couriers.values()]
+    print(f"{couriers} couriers, {orders} orders over {hours} h")
+    print(f"assign: median {timings[len(timings) // 2] * 1e6:.0f} us, "
+          f"p99 {timings[int(len(timings) * 0.99)] * 1e6:.0f} us, "
+          f"{len(timings) / sum(timings):,.0f} orders/s")
+    print(f"waiting for a courier at the end: {len(dispatcher.pending)}, "
+          f"max load: {max(loads)}, "
+          f"mean distance to pickup: {sum(pickup_distances) / max(len(pickup_distances), 1):.2f} km")
+
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:]))
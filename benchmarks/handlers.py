@@ -0,0 +1,253 @@
+"""
+Latency of the real handlers, and the SQL and Bot API calls behind each update.
+
+Usage:
+    python benchmarks/handlers.py [clients] [rounds]
+
+Builds the bot with main.build_application against a scratch SQLite database seeded with restaurants, menus,
+couriers on shift and clients with a saved location, with a fake Bot API in place of the HTTP client: it
+answers every request at once and records it. Then every client goes through /start, the special actions menu
+and the whole order flow `rounds` times, the clients taking turns step by step like concurrent users do, each
+step a synthetic Update handed to Application.process_update. Prints latency percentiles per handler, and how
+many SQL statements and Bot API requests one update costs on average. Exits with status 1 if a handler raised or
+ran more statements than its QUERY_BUDGETS entry. Rate limits of the broadcaster are lifted, they measure
+Telegram and not the bot.
+"""
+import asyncio
+import json
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+import warnings
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from telegram import Bot, Update  # noqa: E402
+from telegram.request import BaseRequest, RequestData  # noqa: E402
+from telegram.warnings import PTBUserWarning  # noqa: E402
+
+from utils.callback_data import pack  # noqa: E402
+
+BOT_ID = 123456
+RESTAURANTS = 8
+CATEGORIES = 4
+ITEMS = 12
+COURIERS = 10
+# most SQL statements one update of the handler may run, the script fails if one runs more
+QUERY_BUDGETS = {"start_bot": 1, "special_actions_menu": 2, "back": 0, "start_ordering": 2, "choose_restaurant": 1,
+                 "order_choose_category": 0, "order_choose_item": 0, "order_add_item": 0, "finish_ordering": 8}
+# Lviv, restaurants and clients are spread over a few kilometres around it
+CENTRE = (49.84, 24.03)
+
+
+class FakeBotAPI(BaseRequest):
+    """Bot API that answers every request at once: sent and edited messages come back as messages with a
+    new message id per chat, everything else as True. Requests are recorded by method name, the parameters of
+    the last sent or edited message of every chat in `screens`."""
+
+    def __init__(self):
+        self.calls: List[str] = []
+        self.message_ids: Dict[int, int] = defaultdict(int)
+        self.screens: Dict[int, dict] = {}
+
+    @property
+    def read_timeout(self) -> Optional[float]:
+        return None
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    async def do_request(self, url: str, method: str, request_data: RequestData = None, read_timeout=None,
+                         write_timeout=None, connect_timeout=None, pool_timeout=None) -> Tuple[int, bytes]:
+        endpoint = url.rsplit("/", 1)[1]
+        parameters = request_data.parameters if request_data else {}
+        self.calls.append(endpoint)
+        if endpoint == "getMe":
+            result = {"id": BOT_ID, "is_bot": True, "first_name": "Benchmark", "username": "benchmark_bot"}
+        elif endpoint in ("sendMessage", "editMessageText"):
+            chat_id = int(parameters["chat_id"])
+            self.screens[chat_id] = parameters
+            if endpoint == "sendMessage":
+                self.message_ids[chat_id] += 1
+            message_id = int(parameters.get("message_id", self.message_ids[chat_id]))
+            result = {"message_id": message_id, "date": int(time.time()), "text": parameters.get("text", ""),
+                      "chat": {"id": chat_id, "type": "private"}}
+        else:
+            result = True
+        return 200, json.dumps({"ok": True, "result": result}).encode()
+
+
+def user_json(user_id: int) -> dict:
+    return {"id": user_id, "is_bot": False, "first_name": f"User {user_id}", "username": f"user{user_id}"}
+
+
+def command(bot: Bot, update_id: int, user_id: int, text: str) -> Update:
+    return Update.de_json({"update_id": update_id,
+                           "message": {"message_id": update_id, "date": int(time.time()),
+                                       "chat": {"id": user_id, "type": "private"}, "from": user_json(user_id),
+                                       "text": text,
+                                       "entities": [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]}},
+                          bot)
+
+
+def click(bot: Bot, update_id: int, user_id: int, message_id: int, data: str) -> Update:
+    return Update.de_json({"update_id": update_id,
+                           "callback_query": {"id": str(update_id), "from": user_json(user_id),
+                                              "chat_instance": str(user_id), "data": data,
+                                              "message": {"message_id": message_id, "date": int(time.time()),
+                                                          "chat": {"id": user_id, "type": "private"},
+                                                          "text": ""}}},
+                          bot)
+
+
+async def seed(clients: int) -> dict:
+    """Users, restaurants with menus and couriers on shift; returns the ids the clients click through."""
+    from models.base import User, Restaurant, MenuItem, PromotionApplication, DeliveryGuyStatus
+
+    restaurants = []
+    for index in range(RESTAURANTS):
+        owner_id = 10_000 + index
+        await User.register(owner_id, f"owner{index}", str(owner_id), f"Owner {index}")
+        await (await User.get(owner_id)).promote("restaurant_owner")
+        restaurant = await Restaurant.create(f"Restaurant {index}", "Lviv cuisine", owner_id)
+        await restaurant.add_location(f"Branch {index}", CENTRE[0] + index * 0.004, CENTRE[1] - index * 0.003)
+        categories = []
+        for category_index in range(CATEGORIES):
+            await restaurant.create_category(f"Category {category_index}")
+        for category in await restaurant.list_categories():
+            items = []
+            for item_index in range(ITEMS):
+                await MenuItem.create(f"Dish {item_index}", category.id, "tasty", 50 + item_index * 5)
+            for item in await category.list_items(category_id=category.id):
+                items.append(item.id)
+            categories.append((category.id, items))
+        restaurants.append((restaurant.id, categories))
+    for index in range(COURIERS):
+        courier_id = 20_000 + index
+        await User.register(courier_id, f"courier{index}", str(courier_id), f"Courier {index}")
+        await PromotionApplication.create(courier_id, "delivery_guy")
+        await PromotionApplication.promote(courier_id)
+        await DeliveryGuyStatus.check_in(courier_id, True)
+    locations = {}
+    for index in range(clients):
+        client_id = 30_000 + index
+        await User.register(client_id, f"client{index}", str(client_id), f"Client {index}")
+        client = await User.get(client_id)
+        await client.add_location("Home", CENTRE[1] + index % 7 * 0.002, CENTRE[0] + index % 5 * 0.002)
+        locations[client_id] = (await client.list_locations())[0].id
+    return {"restaurants": restaurants, "locations": locations}
+
+
+def client_steps(client_id: int, seeded: dict, round_index: int) -> List[Tuple[str, Optional[str]]]:
+    """(handler, callback data) of one pass of a client, None for /start."""
+    restaurant_id, categories = seeded["restaurants"][(client_id + round_index) % len(seeded["restaurants"])]
+    category_id, items = categories[client_id % len(categories)]
+    steps = [("start_bot", None),
+             ("special_actions_menu", "special_actions"),
+             ("back", "to_start_menu"),
+             ("start_ordering", "make_order"),
+             ("choose_restaurant", pack("order_choose_location_", seeded["locations"][client_id])),
+             ("order_choose_category", pack("choose_restaurant_", restaurant_id)),
+             ("order_choose_item", pack("order_choose_category_", category_id))]
+    steps += [("order_add_item", pack("order_add_item_", items[(client_id + n) % len(items)])) for n in range(3)]
+    steps.append(("finish_ordering", "finish_order"))
+    return steps
+
+
+def percentile(samples: List[float], fraction: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+async def run(clients: int, rounds: int, directory: str) -> int:
+    from main import build_application, post_init
+    from models.database import database
+    from models.migrations import migrate
+    from utils.broadcast import broadcaster, pacer
+    from utils.instrumentation import assert_max_queries
+
+    database.configure(f"sqlite+aiosqlite:///{os.path.join(directory, 'handlers.db')}")
+    logging.getLogger().setLevel(logging.WARNING)
+    # per_message warnings of the conversation handlers in main.py
+    warnings.filterwarnings("ignore", category=PTBUserWarning)
+    await migrate()
+    seeded = await seed(clients)
+    pacer.requests_per_second = float("inf")
+    broadcaster.chat_interval = 0
+
+    api = FakeBotAPI()
+    application = build_application({"token": f"{BOT_ID}:benchmark",
+                                     "persistence_file": os.path.join(directory, "persistence.db")}, request=api)
+    latencies: Dict[str, List[float]] = defaultdict(list)
+    costs: Dict[str, Counter] = defaultdict(Counter)
+    methods: Dict[str, Counter] = defaultdict(Counter)
+    errors = []
+
+    async def record_error(update: object, context):
+        errors.append(context.error)
+
+    application.add_error_handler(record_error)
+    update_id = 0
+    async with application:
+        await post_init(application)
+        for round_index in range(rounds):
+            passes = {client_id: client_steps(client_id, seeded, round_index) for client_id in seeded["locations"]}
+            for step in range(len(next(iter(passes.values())))):
+                for client_id, steps in passes.items():
+                    handler, data = steps[step]
+                    update_id += 1
+                    if data is None:
+                        update = command(application.bot, update_id, client_id, "/start")
+                    else:
+                        message_id = application.chat_data[client_id]["last_message"]
+                        update = click(application.bot, update_id, client_id, message_id, data)
+                    calls_before = len(api.calls)
+                    started = time.perf_counter()
+                    try:
+                        with assert_max_queries(QUERY_BUDGETS[handler], handler) as stats:
+                            await application.process_update(update)
+                    except AssertionError as error:
+                        errors.append(error)
+                    latencies[handler].append(time.perf_counter() - started)
+                    costs[handler]["queries"] += stats.count
+                    costs[handler]["calls"] += len(api.calls) - calls_before
+                    methods[handler].update(api.calls[calls_before:])
+    await database.dispose()
+
+    print(f"{clients} clients, {rounds} rounds, {update_id} updates, {RESTAURANTS} restaurants "
+          f"of {CATEGORIES}x{ITEMS} dishes, {COURIERS} couriers on shift")
+    print(f"{'handler':<22} {'updates':>7} {'p50 ms':>7} {'p90 ms':>7} {'p99 ms':>7} {'max ms':>7} "
+          f"{'SQL/upd':>7} {'API/upd':>7}  Bot API methods")
+    for handler, samples in latencies.items():
+        n = len(samples)
+        print(f"{handler:<22} {n:>7} {percentile(samples, 0.5) * 1e3:7.2f} {percentile(samples, 0.9) * 1e3:7.2f} "
+              f"{percentile(samples, 0.99) * 1e3:7.2f} {max(samples) * 1e3:7.2f} "
+              f"{costs[handler]['queries'] / n:7.2f} {costs[handler]['calls'] / n:7.2f}  "
+              + ", ".join(f"{method} {calls / n:.2f}" for method, calls in methods[handler].most_common()))
+    everything = [sample for samples in latencies.values() for sample in samples]
+    print(f"{'all':<22} {len(everything):>7} {statistics.median(everything) * 1e3:7.2f} "
+          f"{percentile(everything, 0.9) * 1e3:7.2f} {percentile(everything, 0.99) * 1e3:7.2f} "
+          f"{max(everything) * 1e3:7.2f} {sum(c['queries'] for c in costs.values()) / len(everything):7.2f} "
+          f"{sum(c['calls'] for c in costs.values()) / len(everything):7.2f}")
+    for error in errors[:5]:
+        print(f"handler failed: {error}")
+    return len(errors)
+
+
+def main(clients: int = 50, rounds: int = 3):
+    directory = tempfile.mkdtemp()
+    errors = asyncio.run(run(clients, rounds, directory))
+    print(f"{errors} updates failed")
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(*(int(arg) for arg in sys.argv[1:])))
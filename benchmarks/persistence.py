@@ -0,0 +1,66 @@
+"""
+Flush time of the chat_data persistence versus the number of chats.
+
+Usage:
+    python benchmarks/persistence.py
+
+Every chat holds chat_data shaped like the one of a client in the middle of an order. For each size the bot knows
+`chats` chats and `active` of them changed since the previous flush, which is what Application hands to the
+persistence on every update interval. PicklePersistence is measured as the baseline: it rewrites the whole file.
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from telegram.ext import PicklePersistence, PersistenceInput  # noqa: E402
+
+from utils.persistence import SQLitePersistence  # noqa: E402
+
+SIZES = ((1_000, 10), (1_000, 100), (10_000, 100), (10_000, 1_000), (100_000, 1_000))
+
+
+def chat_data(chat_id: int) -> dict:
+    return {"last_message": chat_id + 1,
+            "order_message": chat_id + 1,
+            "order": {"location_id": "3", "restaurant_id": "7", "header_id": chat_id, "browse": (12, 1)},
+            "ephemeral": {"client_locations": {i: chat_id + i for i in range(5)}},
+            "views": {chat_id + 1: hash(chat_id)}}
+
+
+async def flush(persistence, active: int):
+    # Application calls update_chat_data concurrently for every chat touched since the last run
+    started = time.perf_counter()
+    await asyncio.gather(*(persistence.update_chat_data(chat_id, chat_data(chat_id)) for chat_id in range(active)))
+    if isinstance(persistence, PicklePersistence):
+        await persistence.flush()
+    return time.perf_counter() - started
+
+
+async def main():
+    print(f"{'chats':>8} {'active':>8} {'sqlite, ms':>12} {'pickle, ms':>12} {'db size, KiB':>13}")
+    for chats, active in SIZES:
+        with tempfile.TemporaryDirectory() as directory:
+            sqlite = SQLitePersistence(os.path.join(directory, "state.db"))
+            await asyncio.gather(*(sqlite.update_chat_data(chat_id, chat_data(chat_id)) for chat_id in range(chats)))
+            sqlite_time = await flush(sqlite, active)
+            await sqlite.flush()
+
+            pickle = PicklePersistence(os.path.join(directory, "state.pickle"),
+                                       store_data=PersistenceInput(bot_data=False, user_data=False,
+                                                                   callback_data=False),
+                                       on_flush=True)
+            await pickle.get_chat_data()
+            for chat_id in range(chats):
+                await pickle.update_chat_data(chat_id, chat_data(chat_id))
+            pickle_time = await flush(pickle, active)
+
+            size = os.path.getsize(os.path.join(directory, "state.db")) / 1024
+            print(f"{chats:>8} {active:>8} {sqlite_time * 1000:>12.1f} {pickle_time * 1000:>12.1f} {size:>13.0f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
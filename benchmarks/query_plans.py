@@ -0,0 +1,119 @@
+"""
+Checks that the hot queries of the models use indexes.
+
+Usage:
+    python benchmarks/query_plans.py
+
+Runs the model methods behind every click of the order, courier and admin flows against a scratch SQLite
+database upgraded by models.migrations, records the SQL they emit and prints EXPLAIN QUERY PLAN for each
+statement. Exits with status 1 if a statement scans a whole table that is expected to grow, except for the
+queries that list a table on purpose (ALLOWED_SCANS).
+"""
+import asyncio
+import os
+import re
+import sqlite3
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# tables that are read whole on purpose: the menu catalog and the location index load them on startup
+ALLOWED_SCANS = {"restaurants", "restaurant_locations", "delivery_guy_current_statuses"}
+SCAN = re.compile(r"\bSCAN (\w+)(?! USING (?:COVERING )?INDEX)")
+
+
+async def exercise():
+    from models.base import (User, Restaurant, MenuCategory, MenuItem, OrderHeader, DeliveryGuyStatus,
+                             PromotionApplication, ClientSavedLocation)
+    from models.cart import Cart
+    from models.dispatch import PendingOrder
+
+    await User.register(1, "owner", "1", "Owner")
+    await User.register(2, "courier", "2", "Courier")
+    await User.register(3, "client", "3", "Client")
+    owner = await User.get(1)
+    await owner.promote("restaurant_owner")
+    await PromotionApplication.create(2, "delivery_guy")
+    await PromotionApplication.promote(2)
+    await Restaurant.create("Restaurant", "description", 1)
+    restaurant = await Restaurant.find(owner_id=1)
+    await restaurant.create_category("Category")
+    await restaurant.add_location("Branch", 49.84, 24.03)
+    category = (await restaurant.list_categories())[0]
+    await MenuItem.create("Item", category.id, "description", 10)
+    client = await User.get(3)
+    await client.add_location("Home", 24.03, 49.84)
+    location = (await client.list_locations())[0]
+
+    yield "record"
+    await User.get(3)
+    await User.find("delivery_guy")
+    await Restaurant.find(owner_id=1)
+    await Restaurant.get(restaurant_id=restaurant.id)
+    await restaurant.list_categories()
+    await restaurant.list_locations()
+    await MenuCategory.list_items(category_id=category.id)
+    await MenuItem.find(item_id=1)
+    await ClientSavedLocation.find(location_id=location.id)
+    await client.list_locations()
+    await PromotionApplication.find(user_id=2)
+    await DeliveryGuyStatus.check_in(2, True)
+    await DeliveryGuyStatus.last_status(2)
+    await DeliveryGuyStatus.list_active()
+    cart = Cart(client_location_id=location.id, restaurant_id=restaurant.id, latitude=49.84, longitude=24.03)
+    cart.add(1)
+    header = await cart.checkout(client_id=3)
+    await OrderHeader.get_summary(header.id)
+    order = PendingOrder.of(header)
+    await OrderHeader.assign(order, 2)
+    await OrderHeader.unassign(order, 2)
+    await OrderHeader.assign(order, 2)
+    await OrderHeader.courier_loads()
+    await OrderHeader.list_unassigned()
+    await OrderHeader.deliver(header.id)
+    yield "done"
+
+
+async def main() -> int:
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, "plans.db")
+    from sqlalchemy import event
+    from models.database import database
+    from models.migrations import migrate
+
+    database.configure(f"sqlite+aiosqlite:///{path}")
+
+    await migrate()
+    statements = []
+    recording = False
+
+    def record(connection, cursor, statement, parameters, context, executemany):
+        if recording and not executemany:
+            statements.append((statement, parameters))
+
+    event.listen(database.engine.sync_engine, "before_cursor_execute", record)
+    async for stage in exercise():
+        recording = stage == "record"
+    await database.dispose()
+
+    connection = sqlite3.connect(path)
+    failures = 0
+    seen = set()
+    for statement, parameters in statements:
+        if statement in seen or not statement.lstrip().upper().startswith(("SELECT", "UPDATE", "DELETE", "INSERT")):
+            continue
+        seen.add(statement)
+        plan = [row[-1] for row in connection.execute(f"EXPLAIN QUERY PLAN {statement}", parameters)]
+        scans = {table for line in plan for table in SCAN.findall(line)} - ALLOWED_SCANS
+        failures += bool(scans)
+        print(("FULL SCAN of " + ", ".join(sorted(scans)) if scans else "ok"), "|", " ".join(statement.split())[:150])
+        for line in plan:
+            print("    ", line)
+    connection.close()
+    print(f"{len(seen)} statements, {failures} with full scans")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,147 @@
+"""
+Mixed read/write load on a SQLite file with the default engine and with the sqlite_wal profile.
+
+Usage:
+    python benchmarks/sqlite_profile.py [seconds] [tasks] [write percent]
+
+Each profile runs in a fresh interpreter, the database is configured once per process, on its own scratch file
+seeded with the menus, couriers and clients of benchmarks/handlers.py. `tasks` concurrent tasks then call model
+methods for `seconds` seconds: reads (User.get, MenuCategory.list_items, MenuItem.find, OrderHeader.get_summary)
+and, `write percent` of the time, writes (OrderHeader.place, DeliveryGuyStatus.check_in). Prints operations per
+second, latency percentiles of reads and writes and the failed operations, e.g. "database is locked".
+"""
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from typing import List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [ROOT, os.path.join(ROOT, "benchmarks")]
+
+PROFILES = ("default", "sqlite_wal")
+CLIENTS = 50
+
+CHILD = """
+import asyncio, json, sys
+sys.path.insert(0, {benchmarks!r})
+import sqlite_profile
+print(json.dumps(asyncio.run(sqlite_profile.load(*{arguments!r}))))
+"""
+
+
+def percentile(latencies: List[float], fraction: float) -> float:
+    if not latencies:
+        return 0.0
+    return sorted(latencies)[min(int(len(latencies) * fraction), len(latencies) - 1)] * 1000
+
+
+async def load(profile: str, seconds: float, tasks: int, write_percent: int) -> dict:
+    import logging
+    logging.disable(logging.WARNING)
+    from handlers import COURIERS, seed
+    from models.base import Base, DeliveryGuyStatus, MenuCategory, MenuItem, OrderHeader, User
+    from models.database import database
+
+    path = os.path.join(tempfile.mkdtemp(), "bench.db")
+    database.configure(f"sqlite+aiosqlite:///{path}", profile=None if profile == "default" else profile)
+    async with database.engine.begin() as connection:
+        await connection.run_sync(Base.metadata.create_all)
+    seeded = await seed(CLIENTS)
+    clients = list(seeded["locations"])
+    restaurant_location = 1
+    on_shift = {20_000 + index: True for index in range(COURIERS)}
+    orders = [(await OrderHeader.place(client_id, seeded["locations"][client_id], restaurant_location,
+                                       {seeded["restaurants"][0][1][0][1][0]: 1})).id for client_id in clients]
+
+    async def read(rng: random.Random):
+        _, categories = rng.choice(seeded["restaurants"])
+        category_id, items = rng.choice(categories)
+        match rng.randrange(4):
+            case 0:
+                await User.get(rng.choice(clients))
+            case 1:
+                await MenuCategory.list_items(category_id)
+            case 2:
+                await MenuItem.find(rng.choice(items))
+            case 3:
+                await OrderHeader.get_summary(rng.choice(orders))
+
+    async def write(rng: random.Random):
+        free = [courier for courier in on_shift if courier not in busy]
+        if rng.randrange(2) or not free:
+            client_id = rng.choice(clients)
+            _, categories = seeded["restaurants"][0]
+            _, items = rng.choice(categories)
+            order = await OrderHeader.place(client_id, seeded["locations"][client_id], restaurant_location,
+                                            {item: 1 for item in rng.sample(items, 3)})
+            orders.append(order.id)
+        else:
+            courier_id = rng.choice(free)
+            busy.add(courier_id)
+            try:
+                on_shift[courier_id] = not on_shift[courier_id]
+                await DeliveryGuyStatus.check_in(courier_id, on_shift[courier_id])
+            finally:
+                busy.discard(courier_id)
+
+    # a courier checks in or out once at a time, check_in refuses a status the courier already has
+    busy = set()
+    latencies = {"read": [], "write": []}
+    errors = {}
+    deadline = time.perf_counter() + seconds
+
+    async def worker(index: int):
+        rng = random.Random(index)
+        while time.perf_counter() < deadline:
+            kind = "write" if rng.randrange(100) < write_percent else "read"
+            started = time.perf_counter()
+            try:
+                await (write if kind == "write" else read)(rng)
+            except Exception as error:
+                key = f"{kind}: {type(error).__name__}: {str(error).splitlines()[0][:80]}"
+                errors[key] = errors.get(key, 0) + 1
+                continue
+            latencies[kind].append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(index) for index in range(tasks)))
+    elapsed = time.perf_counter() - started
+    await database.dispose()
+    return {"operations per second": sum(map(len, latencies.values())) / elapsed,
+            "reads per second": len(latencies["read"]) / elapsed,
+            "writes per second": len(latencies["write"]) / elapsed,
+            "read p50 ms": percentile(latencies["read"], 0.5),
+            "read p99 ms": percentile(latencies["read"], 0.99),
+            "write p50 ms": percentile(latencies["write"], 0.5),
+            "write p99 ms": percentile(latencies["write"], 0.99),
+            "errors": errors}
+
+
+def run(profile: str, seconds: float, tasks: int, write_percent: int) -> dict:
+    code = CHILD.format(benchmarks=os.path.join(ROOT, "benchmarks"),
+                        arguments=(profile, seconds, tasks, write_percent))
+    return json.loads(subprocess.run([sys.executable, "-c", code], capture_output=True, text=True,
+                                     check=True).stdout)
+
+
+def main(seconds: int = 10, tasks: int = 32, write_percent: int = 20):
+    results = {profile: run(profile, seconds, tasks, write_percent) for profile in PROFILES}
+    print(f"{tasks} tasks for {seconds} s, {write_percent}% writes")
+    print(f"{'':<24}" + "".join(f"{profile:>14}" for profile in PROFILES))
+    for metric in results[PROFILES[0]]:
+        if metric != "errors":
+            print(f"{metric:<24}" + "".join(f"{results[profile][metric]:14.1f}" for profile in PROFILES))
+    gain = results["sqlite_wal"]["operations per second"] / (results["default"]["operations per second"] or 1)
+    print(f"\nthroughput of sqlite_wal: {gain:.2f}x the default")
+    for profile in PROFILES:
+        for error, count in results[profile]["errors"].items():
+            print(f"{profile}: {count} x {error}")
+
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:]))
@@ -0,0 +1,103 @@
+"""
+Startup time of the bot and where it goes.
+
+Usage:
+    python benchmarks/startup.py [runs]
+
+Starts fresh interpreters in an empty directory, without config.yml, so importing the bot must not need one.
+They import main, configure an in-memory SQLite database, build the application with a fake Bot API (see
+benchmarks/handlers.py) and run post_init: migrations, cache warm-up and the static keyboards. Prints the best
+time of each phase over the runs and the slowest imports from python -X importtime. Exits with status 1 if the
+bot takes longer than STARTUP_TARGET seconds to be ready to handle updates.
+"""
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# from interpreter start to ready, on a laptop; imports of telegram and SQLAlchemy are most of it
+STARTUP_TARGET = 2.0
+
+CHILD = """
+import time
+started = time.perf_counter()
+import asyncio, json, sys, warnings
+sys.path[:0] = [{root!r}, {benchmarks!r}]
+from telegram.warnings import PTBUserWarning
+warnings.filterwarnings("ignore", category=PTBUserWarning)
+import main
+imported = time.perf_counter()
+import logging
+logging.getLogger().setLevel(logging.WARNING)
+from handlers import FakeBotAPI
+from models.database import database
+database.configure("sqlite+aiosqlite://")
+application = main.build_application({{"token": "123456:benchmark", "persistence_file": "persistence.db"}},
+                                     request=FakeBotAPI())
+built = time.perf_counter()
+
+async def ready():
+    await application.initialize()
+    await main.post_init(application)
+    finished = time.perf_counter()
+    await application.shutdown()
+    # the connection thread of aiosqlite would keep the interpreter alive
+    await database.dispose()
+    return finished
+
+print(json.dumps([started, imported, built, asyncio.run(ready())]))
+"""
+PHASES = ("interpreter", "import main", "build_application", "initialize + post_init")
+
+
+def child(directory: str, *options: str) -> subprocess.CompletedProcess:
+    code = CHILD.format(root=ROOT, benchmarks=os.path.join(ROOT, "benchmarks"))
+    return subprocess.run([sys.executable, *options, "-c", code], cwd=directory, capture_output=True, text=True,
+                          check=True)
+
+
+def timed_start(directory: str) -> dict:
+    # time.perf_counter is system-wide on Linux, so the timestamps of the child count from the same origin
+    spawned = time.perf_counter()
+    timestamps = [spawned] + json.loads(child(directory).stdout)
+    phases = {phase: timestamps[index + 1] - timestamps[index] for index, phase in enumerate(PHASES)}
+    phases["total"] = timestamps[-1] - spawned
+    return phases
+
+
+def slowest_imports(stderr: str, top: int = 12):
+    """(cumulative µs, module) of the slowest top-level packages and of the bot's own modules."""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        rows.append((int(cumulative), name.strip()))
+    own = [row for row in rows if row[1].split(".")[0] in ("main", "callbacks", "models", "utils")]
+    packages = [row for row in rows if "." not in row[1] and row not in own]
+    return sorted(packages, reverse=True)[:top], sorted(own, reverse=True)[:top]
+
+
+def main(runs: int = 3) -> int:
+    directory = tempfile.mkdtemp()
+    results = [timed_start(directory) for _ in range(runs)]
+    best = {phase: min(result[phase] for result in results) for phase in results[0]}
+    print(f"best of {runs} runs, target {STARTUP_TARGET:.1f} s to ready")
+    for phase, seconds in best.items():
+        print(f"{phase:<24} {seconds * 1000:8.0f} ms")
+
+    packages, own = slowest_imports(child(directory, "-X", "importtime").stderr)
+    print("\nslowest packages, imports included:")
+    for microseconds, name in packages:
+        print(f"{microseconds / 1000:8.1f} ms  {name}")
+    print("\nslowest modules of the bot, imports included:")
+    for microseconds, name in own:
+        print(f"{microseconds / 1000:8.1f} ms  {name}")
+    return 1 if best["total"] > STARTUP_TARGET else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(*(int(arg) for arg in sys.argv[1:])))
@@ -0,0 +1,60 @@
+"""
+An order receipt costs one query, whatever the number of items.
+
+Usage:
+    python benchmarks/summary_queries.py [items]
+
+Places an order with one item and one with `items` items on a scratch SQLite database seeded like
+benchmarks/handlers.py, then loads and renders both receipts (OrderHeader.get_summary and str()) under
+assert_max_queries. Exits with status 1 if a receipt takes more than one statement or the two orders don't take
+the same number of statements, e.g. because of a lazy load per item.
+"""
+import asyncio
+import logging
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from handlers import seed  # noqa: E402
+
+
+async def run(items: int, directory: str) -> int:
+    from models.base import OrderHeader
+    from models.database import database
+    from models.migrations import migrate
+    from utils.instrumentation import assert_max_queries
+
+    database.configure(f"sqlite+aiosqlite:///{os.path.join(directory, 'summary.db')}")
+    logging.getLogger().setLevel(logging.WARNING)
+    await migrate()
+    seeded = await seed(1)
+    client_id, location_id = next(iter(seeded["locations"].items()))
+    menu = [item for _, categories in seeded["restaurants"] for _, category_items in categories
+            for item in category_items]
+    counts = {}
+    failed = 0
+    for size in (1, items):
+        header = await OrderHeader.place(client_id, location_id, 1, {item: 2 for item in menu[:size]})
+        try:
+            with assert_max_queries(1, f"receipt of {size} item(s)") as stats:
+                receipt = str(await OrderHeader.get_summary(header.id))
+        except AssertionError as error:
+            print(error)
+            failed += 1
+        counts[size] = stats.count
+        print(f"{size:>4} item(s): {stats.count} statement(s), {receipt.count(chr(10)) + 1} receipt lines")
+    await database.dispose()
+    if counts[1] != counts[items]:
+        print(f"receipts of 1 and {items} items take {counts[1]} and {counts[items]} statements")
+        failed += 1
+    return failed
+
+
+def main(items: int = 50):
+    return 1 if asyncio.run(run(items, tempfile.mkdtemp())) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(*(int(arg) for arg in sys.argv[1:])))
@@ -0,0 +1,112 @@
+"""
+Updates of one chat stay in order while updates of different chats run concurrently.
+
+Usage:
+    python benchmarks/update_order.py [chats] [updates per chat]
+
+Hands interleaved updates of `chats` private chats to ChatOrderedUpdateProcessor at once, every update a
+handler that sleeps a random few milliseconds, as handlers waiting for the database and the Bot API do. Exits
+with status 1 if the updates of a chat ran in another order than they arrived or two of them overlapped, or if
+updates of different chats never ran at the same time, or if the processor's count of updates waiting for their
+chat (the bot_updates_waiting_for_chat metric) never saw them or doesn't end at 0. Then one chat gets many more
+updates than can run at once, followed by one update of another chat, which has to run before most of them.
+Prints the wall time against handling them one by one.
+"""
+import asyncio
+import os
+import random
+import sys
+import time
+from collections import defaultdict
+from typing import Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from telegram import Update  # noqa: E402
+
+from utils.update_processor import ChatOrderedUpdateProcessor  # noqa: E402
+
+
+def message(update_id: int, chat_id: int) -> Update:
+    return Update.de_json({"update_id": update_id,
+                           "message": {"message_id": update_id, "date": int(time.time()),
+                                       "chat": {"id": chat_id, "type": "private"},
+                                       "from": {"id": chat_id, "is_bot": False, "first_name": "User"},
+                                       "text": "hello"}},
+                          None)
+
+
+async def run(chats: int, per_chat: int) -> int:
+    processor = ChatOrderedUpdateProcessor(max_concurrent_updates=chats)
+    await processor.initialize()
+    rng = random.Random(0)
+    handled: Dict[int, List[int]] = defaultdict(list)
+    running: Dict[int, int] = defaultdict(int)
+    in_flight = 0
+    most_in_flight = 0
+    overlaps = 0
+    most_waiting = 0
+
+    async def handle(update: Update, delay: float):
+        nonlocal in_flight, most_in_flight, overlaps, most_waiting
+        chat_id = update.effective_chat.id
+        running[chat_id] += 1
+        in_flight += 1
+        most_in_flight = max(most_in_flight, in_flight)
+        most_waiting = max(most_waiting, processor.waiting_updates)
+        if running[chat_id] > 1:
+            overlaps += 1
+        await asyncio.sleep(delay)
+        handled[chat_id].append(update.update_id)
+        running[chat_id] -= 1
+        in_flight -= 1
+
+    updates = [message(index * chats + chat_id, chat_id)
+               for index in range(per_chat) for chat_id in range(1, chats + 1)]
+    delays = [rng.uniform(0.001, 0.005) for _ in updates]
+    slept = sum(delays)
+    started = time.perf_counter()
+    await asyncio.gather(*(processor.process_update(update, handle(update, delay))
+                           for update, delay in zip(updates, delays)))
+    elapsed = time.perf_counter() - started
+    waiting = processor.waiting_updates
+
+    # updates waiting for their busy chat must not take the places of other chats' updates
+    busy = [message(len(updates) + index + 1, 1) for index in range(chats * 4)]
+    other = message(len(updates) + len(busy) + 1, 2)
+    finished: List[int] = []
+
+    async def note(update: Update):
+        await asyncio.sleep(0.002)
+        finished.append(update.update_id)
+
+    await asyncio.gather(*(processor.process_update(update, note(update)) for update in busy + [other]))
+    overtaken = finished.index(other.update_id)
+    await processor.shutdown()
+
+    arrived: Dict[int, List[int]] = defaultdict(list)
+    for update in updates:
+        arrived[update.effective_chat.id].append(update.update_id)
+    reordered = [chat_id for chat_id in arrived if handled[chat_id] != arrived[chat_id]]
+    print(f"{chats} chats, {per_chat} updates each: {elapsed * 1000:.0f} ms, "
+          f"{slept * 1000:.0f} ms one by one, up to {most_in_flight} updates at once")
+    print(f"{len(reordered)} chats out of order, {overlaps} overlapping updates of one chat")
+    failed = len(reordered) + overlaps
+    if most_in_flight < 2:
+        print("updates of different chats never ran concurrently")
+        failed += 1
+    print(f"up to {most_waiting} updates waiting for their chat, {waiting} at the end")
+    if not most_waiting or waiting:
+        failed += 1
+    print(f"an update of another chat ran after {overtaken} of {len(busy)} queued updates of a busy chat")
+    if overtaken > 1:
+        failed += 1
+    return failed
+
+
+def main(chats: int = 20, per_chat: int = 25):
+    return 1 if asyncio.run(run(chats, per_chat)) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(*(int(arg) for arg in sys.argv[1:])))
@@ -0,0 +1,155 @@
+"""
+Update delivery by webhook against long polling.
+
+Usage:
+    python benchmarks/webhook.py [updates] [updates per second] [round trip ms]
+
+Needs the webhook extra of python-telegram-bot (tornado, see requirements.txt).
+
+A fake Bot API stands in for Telegram: recorded callback query updates appear at the given rate and reach the
+bot either as answers to getUpdates long polls (every request and answer takes half a round trip) or as JSON
+POSTed to the webhook listener the same way Telegram does it, secret token included. Both runs go through
+the same Application, so the numbers show what the transport adds: latency from an update appearing to its
+handler running, and the throughput of a burst sent all at once.
+"""
+import asyncio
+import json
+import os
+import socket
+import sys
+import time
+from typing import Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx  # noqa: E402
+from telegram import Bot, Update, User  # noqa: E402
+from telegram.ext import Application, TypeHandler  # noqa: E402
+
+SECRET_TOKEN = "benchmark-secret"
+PATH = "telegram"
+
+
+def recorded_update(update_id: int) -> dict:
+    chat_id = 1000 + update_id % 50
+    return {"update_id": update_id,
+            "callback_query": {"id": str(update_id),
+                               "from": {"id": chat_id, "is_bot": False, "first_name": "Client"},
+                               "chat_instance": str(chat_id),
+                               "data": "order_add_item_1",
+                               "message": {"message_id": 1,
+                                           "date": 0,
+                                           "chat": {"id": chat_id, "type": "private"},
+                                           "text": "Меню"}}}
+
+
+class FakeTelegram(Bot):
+    """Serves getUpdates from a local queue with a simulated round trip, the webhook calls succeed at once."""
+
+    def __init__(self, round_trip: float):
+        super().__init__("123456:benchmark")
+        # telegram objects are read-only once created
+        with self._unfrozen():
+            self.round_trip = round_trip
+            self.queue: List[dict] = []
+            self.arrived = asyncio.Event()
+
+    def publish(self, data: dict):
+        self.queue.append(data)
+        self.arrived.set()
+
+    async def get_me(self, *args, **kwargs):
+        self._bot_user = User(id=123456, first_name="Benchmark", is_bot=True, username="benchmark_bot")
+        return self._bot_user
+
+    async def set_webhook(self, *args, **kwargs):
+        return True
+
+    async def delete_webhook(self, *args, **kwargs):
+        return True
+
+    async def get_updates(self, offset=None, limit=100, timeout=None, **kwargs):
+        await asyncio.sleep(self.round_trip / 2)
+        if not self.queue:
+            self.arrived.clear()
+            try:
+                await asyncio.wait_for(self.arrived.wait(), timeout or 0)
+            except asyncio.TimeoutError:
+                pass
+        batch = self.queue[:limit]
+        del self.queue[:limit]
+        await asyncio.sleep(self.round_trip / 2)
+        return [Update.de_json(data, self) for data in batch]
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def run(mode: str, updates: int, rate: float, round_trip: float) -> Dict[str, float]:
+    bot = FakeTelegram(round_trip)
+    application = Application.builder().bot(bot).build()
+    produced: Dict[int, float] = {}
+    handled: Dict[int, float] = {}
+    done = asyncio.Event()
+
+    async def handle(update: Update, context):
+        handled[update.update_id] = time.perf_counter()
+        if len(handled) == updates:
+            done.set()
+
+    application.add_handler(TypeHandler(Update, handle))
+    port = free_port()
+    async with application, httpx.AsyncClient(limits=httpx.Limits(max_connections=40)) as client:
+        if mode == "webhook":
+            await application.updater.start_webhook(listen="127.0.0.1", port=port, url_path=PATH,
+                                                    webhook_url=f"http://127.0.0.1:{port}/{PATH}",
+                                                    secret_token=SECRET_TOKEN, max_connections=40)
+        else:
+            await application.updater.start_polling(poll_interval=0, timeout=10)
+        await application.start()
+
+        async def push(data: dict):
+            # Telegram to the bot is half a round trip either way
+            await asyncio.sleep(round_trip / 2)
+            response = await client.post(f"http://127.0.0.1:{port}/{PATH}", content=json.dumps(data),
+                                         headers={"Content-Type": "application/json",
+                                                  "X-Telegram-Bot-Api-Secret-Token": SECRET_TOKEN})
+            response.raise_for_status()
+
+        pushes = []
+        started = time.perf_counter()
+        for update_id in range(1, updates + 1):
+            if rate:
+                await asyncio.sleep(max(0.0, started + update_id / rate - time.perf_counter()))
+            data = recorded_update(update_id)
+            produced[update_id] = time.perf_counter()
+            if mode == "webhook":
+                pushes.append(asyncio.create_task(push(data)))
+            else:
+                bot.publish(data)
+        await asyncio.wait_for(done.wait(), 60)
+        elapsed = max(handled.values()) - started
+        await asyncio.gather(*pushes)
+        await application.updater.stop()
+        await application.stop()
+
+    latencies = sorted(handled[update_id] - produced[update_id] for update_id in produced)
+    return {"median latency, ms": latencies[len(latencies) // 2] * 1000,
+            "p95 latency, ms": latencies[int(len(latencies) * 0.95)] * 1000,
+            "updates/s": updates / elapsed}
+
+
+async def main(updates: int = 1_000, rate: float = 100, round_trip_ms: int = 60):
+    round_trip = round_trip_ms / 1000
+    print(f"{updates} updates, round trip to Telegram {round_trip_ms} ms")
+    for name, arrival_rate in ((f"paced at {rate:g}/s", rate), ("burst", 0)):
+        for mode in ("polling", "webhook"):
+            result = await run(mode, updates, arrival_rate, round_trip)
+            print(f"{name:<16} {mode:<8} " + ", ".join(f"{key} {value:8.1f}" for key, value in result.items()))
+
+
+if __name__ == "__main__":
+    asyncio.run(main(*(int(arg) for arg in sys.argv[1:])))
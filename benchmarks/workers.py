@@ -0,0 +1,109 @@
+"""
+Throughput of the multi-process worker mode by number of workers.
+
+Usage:
+    python benchmarks/workers.py [updates] [handler cpu ms] [max workers]
+
+Spawns 1, 2, 4, ... worker processes through utils.workers with a fake Bot API, hands them callback query
+updates from 500 chats sharded by chat id exactly like the front process does, and measures how many updates
+per second they handle together. The handler renders a keyboard screen through utils.views and then keeps the
+CPU busy for the given time, standing in for the ORM and rendering work of a real handler.
+"""
+import multiprocessing
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from telegram import Bot, Update, User  # noqa: E402
+from telegram.ext import Application, CallbackQueryHandler  # noqa: E402
+
+from utils.views import keyboard, render  # noqa: E402
+from utils.workers import UPDATE, shard_of, worker_main  # noqa: E402
+
+CHATS = 500
+
+
+class FakeBot(Bot):
+    async def get_me(self, *args, **kwargs):
+        self._bot_user = User(id=123456, first_name="Benchmark", is_bot=True, username="benchmark_bot")
+        return self._bot_user
+
+    async def edit_message_text(self, *args, **kwargs):
+        return True
+
+
+def recorded_update(update_id: int) -> Update:
+    chat_id = 1000 + update_id % CHATS
+    return Update.de_json({"update_id": update_id,
+                           "callback_query": {"id": str(update_id),
+                                              "from": {"id": chat_id, "is_bot": False, "first_name": "Client"},
+                                              "chat_instance": str(chat_id),
+                                              "data": f"order_add_item_{update_id % 20}",
+                                              "message": {"message_id": 1,
+                                                          "date": 0,
+                                                          "chat": {"id": chat_id, "type": "private"},
+                                                          "text": "Меню"}}}, None)
+
+
+def build(config: dict, shard=None) -> Application:
+    stats = {"handled": 0, "first": None, "last": None}
+
+    async def handle(update: Update, context):
+        stats["first"] = stats["first"] or time.perf_counter()
+        item = int(update.callback_query.data.rsplit("_", 1)[1])
+        buttons = [{"text": f"Страва {x} - {x * 10} грн", "callback_data": f"order_add_item_{x}"}
+                   for x in range(item, item + 10)]
+        await render(context, chat_id=update.effective_chat.id, message_id=update.update_id,
+                     text=f"Кошик: {item} страв", reply_markup=keyboard(buttons))
+        deadline = time.perf_counter() + config["cpu_ms"] / 1000
+        while time.perf_counter() < deadline:
+            pass
+        stats["handled"] += 1
+        stats["last"] = time.perf_counter()
+
+    async def report(application: Application):
+        config["results"].put((stats["handled"], stats["first"], stats["last"]))
+
+    application = Application.builder().bot(FakeBot("123456:benchmark")).updater(None).post_stop(report).build()
+    application.add_handler(CallbackQueryHandler(handle))
+    return application
+
+
+def run(workers: int, updates: int, cpu_ms: float) -> float:
+    context = multiprocessing.get_context("spawn")
+    config = {"cpu_ms": cpu_ms, "results": context.Queue()}
+    inboxes = [context.Queue() for _ in range(workers)]
+    outbox = context.Queue()
+    for update_id in range(1, updates + 1):
+        update = recorded_update(update_id)
+        inboxes[shard_of(update, workers)].put((UPDATE, update.to_json()))
+    for inbox in inboxes:
+        inbox.put(None)
+    processes = [context.Process(target=worker_main, args=(index, workers, config, inboxes[index], outbox, build))
+                 for index in range(workers)]
+    for process in processes:
+        process.start()
+    results = [config["results"].get() for _ in processes]
+    for process in processes:
+        process.join()
+    handled = sum(result[0] for result in results)
+    assert handled == updates, handled
+    # time.perf_counter is system-wide on Linux, so the timestamps of the workers are comparable
+    return handled / (max(result[2] for result in results) - min(result[1] for result in results))
+
+
+def main(updates: int = 4_000, cpu_ms: float = 2, max_workers: int = os.cpu_count()):
+    print(f"{updates} updates, {cpu_ms} ms of CPU per update, {os.cpu_count()} CPUs")
+    baseline = None
+    workers = 1
+    while workers <= max_workers:
+        throughput = run(workers, updates, cpu_ms)
+        baseline = baseline or throughput
+        print(f"{workers:>2} workers: {throughput:8,.0f} updates/s, x{throughput / baseline:.2f}")
+        workers *= 2
+
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:]))
@@ -1,101 +1,143 @@
-from sqlalchemy import Update
-from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+import asyncio
+import time
+
+from telegram import Bot, InlineKeyboardButton, InlineKeyboardMarkup, Update
 from telegram.ext import CallbackContext
 
 from models.base import PromotionApplication, User
+from utils.callback_data import pack
+from utils.messages import remember, screen_messages, clear_screen
+from utils.profiler import profiler
+from utils.views import render
+
+# a profile by number of updates ends after this many seconds even if fewer updates came
+MAX_PROFILE_SECONDS = 600
+PROFILE_USAGE = "Використання: /profile <секунди> або /profile <кількість> calls"
 
 
-async def check_applications(update: Update, context: CallbackContext):
-    applications = PromotionApplication.all_open(update.callback_query.data.replace("check_applications_", ""))
+async def check_applications(update: Update, context: CallbackContext, role: str):
+    applications = await PromotionApplication.all_open(role)
     await context.bot.delete_message(chat_id=update.effective_user.id,
                                      message_id=context.chat_data["last_message"])
-    context.chat_data["application"] = {}
+    await clear_screen(context, update.effective_user.id, "application")
     for application in applications:
         text = str(application)
         reply_markup = InlineKeyboardMarkup([[InlineKeyboardButton(text="Прийняти",
-                                                                   callback_data=f"accept_promotion_{application.user_id}"),
+                                                                   callback_data=pack("accept_promotion_", application.user_id)),
                                               InlineKeyboardButton(text="Відхилити",
-                                                                   callback_data=f"reject_promotion_{application.user_id}")]])
+                                                                   callback_data=pack("reject_promotion_", application.user_id))]])
         message = await context.bot.send_message(chat_id=update.effective_user.id,
                                                  text=text,
                                                  reply_markup=reply_markup)
-        context.chat_data["application"][application.user_id] = message.message_id
+        remember(context, "application", application.user_id, message.message_id)
 
 
-async def remove_promotions(update: Update, context: CallbackContext):
-    promotions = User.find(update.callback_query.data.replace("remove_promotions_", ""))
-    context.chat_data["promotion"] = {}
+async def remove_promotions(update: Update, context: CallbackContext, role: str):
+    promotions = await User.find(role)
+    await clear_screen(context, update.effective_user.id, "promotion")
     for promotion in promotions:
-        text = str(promotion)
+        text = await promotion.describe()
         reply_markup = InlineKeyboardMarkup([[InlineKeyboardButton(text="Видалити",
-                                                                   callback_data=f"downgrade_{promotion.telegram_id}")]])
+                                                                   callback_data=pack("downgrade_", promotion.telegram_id))]])
         message = await context.bot.send_message(chat_id=update.effective_user.id,
                                                  text=text,
                                                  reply_markup=reply_markup)
-        context.chat_data["promotion"][promotion.telegram_id] = message.message_id
-
-
-async def confirm_remove_promotion(update: Update, context: CallbackContext):
-    promotion = User.get(int(update.callback_query.data.replace("downgrade_", "")))
-    for user_id in context.chat_data["promotion"]:
-        if int(user_id) == promotion.telegram_id:
-            text = f"Ви впевнені?\n{str(promotion)}"
-            reply_markup = InlineKeyboardMarkup([[InlineKeyboardButton(text="Підтвердити видалення",
-                                                                       callback_data=f"confirm_downgrade_{promotion.telegram_id}"),
-                                                  InlineKeyboardButton(text="Відмінити",
-                                                                       callback_data=f"to_start_menu")
-                                                  ]])
-            await context.bot.edit_message_text(chat_id=update.effective_user.id,
-                                                message_id=context.chat_data["promotion"][user_id],
-                                                text=text)
-            await context.bot.edit_message_reply_markup(chat_id=update.effective_user.id,
-                                                        message_id=context.chat_data["promotion"][user_id],
-                                                        reply_markup=reply_markup)
-            context.chat_data["last_message"] = context.chat_data["promotion"][user_id]
-        else:
-            await context.bot.delete_message(chat_id=update.effective_user.id,
-                                             message_id=context.chat_data["promotion"][user_id])
-    context.chat_data.pop("promotion")
-
-
-async def remove_promotion_final(update: Update, context: CallbackContext):
-    user_id = int(update.callback_query.data.replace("confirm_downgrade_", ""))
-    User.get(user_id).promote("client")
+        remember(context, "promotion", promotion.telegram_id, message.message_id)
+
+
+async def confirm_remove_promotion(update: Update, context: CallbackContext, user_id: int):
+    promotion = await User.get(user_id)
+    await clear_screen(context, update.effective_user.id, "promotion", keep=promotion.telegram_id)
+    message_id = update.callback_query.message.message_id
+    text = f"Ви впевнені?\n{await promotion.describe()}"
+    reply_markup = InlineKeyboardMarkup([[InlineKeyboardButton(text="Підтвердити видалення",
+                                                               callback_data=pack("confirm_downgrade_", promotion.telegram_id)),
+                                          InlineKeyboardButton(text="Відмінити",
+                                                               callback_data=f"to_start_menu")
+                                          ]])
+    await render(context,
+                 chat_id=update.effective_user.id,
+                 message_id=message_id,
+                 text=text,
+                 reply_markup=reply_markup)
+    context.chat_data["last_message"] = message_id
+
+
+async def remove_promotion_final(update: Update, context: CallbackContext, user_id: int):
+    user = await User.get(user_id)
+    await user.promote("client")
     text = "Успішно!"
     reply_markup = InlineKeyboardMarkup([[InlineKeyboardButton(text="Назад",
                                                                callback_data=f"to_start_menu")
                                           ]])
-    await context.bot.edit_message_text(chat_id=update.effective_user.id,
-                                        message_id=context.chat_data["last_message"],
-                                        text=text)
-    await context.bot.edit_message_reply_markup(chat_id=update.effective_user.id,
-                                                message_id=context.chat_data["last_message"],
-                                                reply_markup=reply_markup)
+    await render(context,
+                 chat_id=update.effective_user.id,
+                 message_id=context.chat_data["last_message"],
+                 text=text,
+                 reply_markup=reply_markup)
     await context.bot.send_message(chat_id=user_id,
                                    text="Вас підвищили до клієнта!")
 
 
-async def accept_application(update: Update, context: CallbackContext):
-    user_id = int(update.callback_query.data.replace("accept_promotion_", ""))
-    role_to_promote = PromotionApplication.promote(user_id)
-    user = User.get(user_id)
-    text = f"Ви успішно підтвердили заявку!\n{str(user)}"
-    await context.bot.edit_message_text(chat_id=update.effective_user.id,
-                                        message_id=context.chat_data["application"][user_id],
-                                        text=text)
+async def accept_application(update: Update, context: CallbackContext, user_id: int):
+    role_to_promote = await PromotionApplication.promote(user_id)
+    user = await User.get(user_id)
+    text = f"Ви успішно підтвердили заявку!\n{await user.describe()}"
+    await render(context,
+                 chat_id=update.effective_user.id,
+                 message_id=screen_messages(context, "application")[user_id],
+                 text=text)
     text_to_client = f"Вас підвищили до {'кур`єра' if role_to_promote == 'delivery_guy' else 'менеджера ресторану'}!"
     await context.bot.send_message(chat_id=user_id,
                                    text=text_to_client)
 
 
-async def cancel_application(update: Update, context: CallbackContext):
-    user_id = int(update.callback_query.data.replace("reject_promotion_", ""))
-    PromotionApplication.close(user_id)
-    user = User.get(user_id)
-    text = f"Ви відмінили заявку.\n{str(user)}"
-    await context.bot.edit_message_text(chat_id=update.effective_user.id,
-                                        message_id=context.chat_data["application"][user_id],
-                                        text=text)
+async def cancel_application(update: Update, context: CallbackContext, user_id: int):
+    await PromotionApplication.close(user_id)
+    user = await User.get(user_id)
+    text = f"Ви відмінили заявку.\n{await user.describe()}"
+    await render(context,
+                 chat_id=update.effective_user.id,
+                 message_id=screen_messages(context, "application")[user_id],
+                 text=text)
     text_to_client = f"Ваша заявку була відхилена."
     await context.bot.send_message(chat_id=user_id,
                                    text=text_to_client)
+
+
+async def profile(update: Update, context: CallbackContext):
+    """/profile 30 samples the bot for 30 seconds, /profile 200 calls for the next 200 handler calls; admins only."""
+    user = await User.get(update.effective_user.id)
+    if not user or user.role != "admin":
+        return
+    try:
+        amount = int(context.args[0])
+    except (IndexError, ValueError):
+        await context.bot.send_message(chat_id=update.effective_user.id, text=PROFILE_USAGE)
+        return
+    calls = amount if context.args[1:2] == ["calls"] else None
+    if amount <= 0 or (calls is None and amount > MAX_PROFILE_SECONDS):
+        await context.bot.send_message(chat_id=update.effective_user.id, text=PROFILE_USAGE)
+        return
+    if profiler.running:
+        await context.bot.send_message(chat_id=update.effective_user.id, text="Профілювання вже триває.")
+        return
+    profiler.start()
+    unit = "викликів обробників" if calls else "секунд"
+    await context.bot.send_message(chat_id=update.effective_user.id, text=f"Профілювання запущено: {amount} {unit}.")
+    context.application.create_task(finish_profiling(context.bot, update.effective_user.id,
+                                                     seconds=MAX_PROFILE_SECONDS if calls else amount,
+                                                     calls=calls))
+
+
+async def finish_profiling(bot: Bot, chat_id: int, seconds: float, calls: int = None):
+    deadline = time.monotonic() + seconds
+    try:
+        while time.monotonic() < deadline and (calls is None or profiler.handler_calls < calls):
+            await asyncio.sleep(min(0.5, max(deadline - time.monotonic(), 0)))
+    finally:
+        profiler.stop()
+    await bot.send_document(chat_id=chat_id, document=profiler.report().encode(), filename="profile.txt",
+                            caption="Найдовші функції за обробниками")
+    await bot.send_document(chat_id=chat_id, document=profiler.collapsed().encode(), filename="profile.folded",
+                            caption="Стеки для flamegraph.pl або speedscope.app")
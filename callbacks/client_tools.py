@@ -2,8 +2,19 @@ from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import CallbackContext, ConversationHandler
 
 from callbacks import conversation_states
-from callbacks.general import get_start_menu
-from models.base import User, ClientSavedLocation, Restaurant, OrderHeader, MenuCategory, MenuItem, OrderItem
+from callbacks.delivery_guy_tools import dispatch_order
+from callbacks.general import get_start_menu, paginate, page_navigation
+from callbacks.special_actions import BACK_BUTTONS
+from models.base import User, ClientSavedLocation, OrderHeader
+from models.cart import Cart, NoBranchError
+from models.catalog import catalog
+from models.geo import restaurant_locations
+from utils.callback_data import pack
+from utils.messages import remember, clear_screen
+from utils.views import render, static_keyboard
+
+RESTAURANTS_PAGE_SIZE = 5
+ITEMS_PAGE_SIZE = 5
 
 
 async def client_saved_location_manager(update: Update, context: CallbackContext):
@@ -13,17 +24,24 @@ async def client_saved_location_manager(update: Update, context: CallbackContext
                                      callback_data="add_сlient_location")],
                [InlineKeyboardButton(text="Назад",
                                      callback_data="special_actions")]]
-    if User.get(telegram_id=update.effective_user.id).list_locations():
+    user = await User.get(telegram_id=update.effective_user.id)
+    if await user.list_locations():
         buttons[0].append(InlineKeyboardButton(text="Редагувати локацію",
                                                callback_data="edit_client_locations"))
     reply_markup = InlineKeyboardMarkup(buttons)
-    await update.callback_query.message.edit_text(text=text,
-                                                  reply_markup=reply_markup)
+    await render(context,
+                 chat_id=update.effective_user.id,
+                 message_id=update.callback_query.message.message_id,
+                 text=text,
+                 reply_markup=reply_markup)
 
 
 async def add_client_location_name(update: Update, context: CallbackContext):
     text = "Введіть назву для вашої локації: дім, робота і т.д.:"
-    await update.callback_query.message.edit_text(text=text)
+    await render(context,
+                 chat_id=update.effective_user.id,
+                 message_id=update.callback_query.message.message_id,
+                 text=text)
     return conversation_states.ADD_CLIENT_LOCATION_NAME
 
 
@@ -38,7 +56,8 @@ async def add_client_location_location(update: Update, context: CallbackContext)
 async def add_client_location_finish(update: Update, context: CallbackContext):
     context.chat_data["client_location"]["latitude"] = update.message.location.latitude
     context.chat_data["client_location"]["longitude"] = update.message.location.longitude
-    User.get(telegram_id=update.effective_user.id).add_location(**context.chat_data["client_location"])
+    user = await User.get(telegram_id=update.effective_user.id)
+    await user.add_location(**context.chat_data["client_location"])
     text = "Успішно! Локація була додана."
     await context.bot.send_message(chat_id=update.effective_user.id,
                                    text=text,
@@ -48,8 +67,9 @@ async def add_client_location_finish(update: Update, context: CallbackContext):
 
 async def edit_client_locations(update: Update, context: CallbackContext):
     await update.callback_query.message.delete()
-    context.chat_data["client_locations"] = {}
-    for location in User.get(telegram_id=update.effective_user.id).list_locations():
+    await clear_screen(context, update.effective_user.id, "client_locations")
+    user = await User.get(telegram_id=update.effective_user.id)
+    for location in await user.list_locations():
         text = str(location)
         reply_markup = InlineKeyboardMarkup([[InlineKeyboardButton(text="Змінити назву",
                                                                    callback_data=f"client_location_change_name_{location.id}"),
@@ -58,23 +78,23 @@ async def edit_client_locations(update: Update, context: CallbackContext):
         message = await context.bot.send_message(chat_id=update.effective_user.id,
                                                  text=text,
                                                  reply_markup=reply_markup)
-        context.chat_data["client_locations"][location.id] = message
+        remember(context, "client_locations", location.id, message.message_id)
 
 
 async def edit_client_location_name(update: Update, context: CallbackContext):
     context.chat_data["change_location_id"] = int(update.callback_query.data.replace("client_location_change_name_", ""))
-    for location_id, message in context.chat_data["client_locations"].items():
-        if location_id == context.chat_data["change_location_id"]:
-            text = f"Введіть нову назву для {message.text}:"
-            await message.edit_text(text=text)
-        else:
-            await message.delete()
-    context.chat_data.pop("client_locations")
+    await clear_screen(context, update.effective_user.id, "client_locations", keep=context.chat_data["change_location_id"])
+    text = f"Введіть нову назву для {update.callback_query.message.text}:"
+    await render(context,
+                 chat_id=update.effective_user.id,
+                 message_id=update.callback_query.message.message_id,
+                 text=text)
     return conversation_states.EDIT_CLIENT_LOCATION_NAME
 
 
 async def edit_client_location_finish(update: Update, context: CallbackContext):
-    location = ClientSavedLocation.find(location_id=context.chat_data["change_location_id"]).edit(name=update.message.text)
+    location = await ClientSavedLocation.find(location_id=context.chat_data["change_location_id"])
+    await location.edit(name=update.message.text)
     text = f"Успішно перейменовано в {str(location)}"
     reply_markup = get_start_menu()
     message = await context.bot.send_message(chat_id=update.effective_user.id,
@@ -86,11 +106,12 @@ async def edit_client_location_finish(update: Update, context: CallbackContext):
 
 
 async def start_ordering(update: Update, context: CallbackContext):
-    locations = User.get(update.effective_user.id).list_locations()
+    user = await User.get(update.effective_user.id)
+    locations = await user.list_locations()
     if locations:
         text = "Виберіть, куди варто доставити замовлення:"
         buttons = [[InlineKeyboardButton(text=str(location),
-                                         callback_data=f"order_choose_location_{location.id}")]
+                                         callback_data=pack("order_choose_location_", location.id))]
                    for location in locations]
         buttons.append([InlineKeyboardButton(text="Назад",
                                             callback_data=f"to_start_menu")])
@@ -98,133 +119,153 @@ async def start_ordering(update: Update, context: CallbackContext):
     else:
         text = "Для початку, варто добавити локацію, куди доставити замовлення (Менеджер локацій)"
         reply_markup = get_start_menu()
-    message = await update.callback_query.message.edit_text(text=text,
-                                                            reply_markup=reply_markup)
-    context.chat_data["order_message"] = message
-
-
-async def choose_restaurant(update: Update, context: CallbackContext):
-    context.chat_data["order"] = {"location_id": update.callback_query.data.replace("order_choose_location_", "")}
-    context.chat_data["restaurant_choose"] = {}
-    for restaurant in Restaurant.list_all():
-        text = str(restaurant)
-        reply_markup = InlineKeyboardMarkup([[InlineKeyboardButton(text="Вибрати цей заклад",
-                                                                   callback_data=f"choose_restaurant_{restaurant.id}")]])
-        message = await update.effective_user.send_message(text=text,
-                                                           reply_markup=reply_markup)
-        context.chat_data["restaurant_choose"][restaurant.id] = message
-
-
-async def order_choose_category(update: Update, context: CallbackContext):
-    context.chat_data["order"]["restaurant_id"] = update.callback_query.data.replace("choose_restaurant_", "")
-    restaurant_location = Restaurant.get(restaurant_id=context.chat_data["order"]["restaurant_id"]).list_locations()[0]
-    if not context.chat_data["order"].get("header"):
-        context.chat_data["order"]["header"] = OrderHeader.create(client_id=update.effective_user.id,
-                                                                  restaurant_location_id=restaurant_location.id,
-                                                                  client_location_id=context.chat_data["order"]["location_id"])
-        for restaurant_id, message in context.chat_data["restaurant_choose"].items():
-            await message.delete()
-        if context.chat_data.get("order_menu_items"):
-            for item_id, message in context.chat_data["order_menu_items"].items():
-                await message.delete()
-            context.chat_data.pop("order_menu_items")
-        context.chat_data.pop("restaurant_choose")
-    text = f"Ваше замовлення:\n{str(context.chat_data['order']['header'])}"
-    buttons = [[InlineKeyboardButton(text=str(category),
-                                     callback_data=f"order_choose_category_{category.id}")]
-               for category in Restaurant.get(restaurant_id=context.chat_data["order"]["restaurant_id"]).list_categories()]
-    reply_markup = InlineKeyboardMarkup(buttons)
-    message = await context.chat_data["order_message"].edit_text(text=text,
-                                                                 reply_markup=reply_markup)
-    context.chat_data["order_message"] = message
-
-
-async def order_choose_item(update: Update, context: CallbackContext):
-    buttons = [[InlineKeyboardButton(text="Назад",
-                                     callback_data=f"choose_restaurant_{context.chat_data['order']['restaurant_id']}")]]
-    context.chat_data["order"]["header"] = context.chat_data["order"]["header"].update()
-    if context.chat_data["order"]["header"].list_items():
-        buttons.insert(0, [InlineKeyboardButton(text="Оформити замовлення",
-                                                callback_data="finish_order")])
-    reply_markup = InlineKeyboardMarkup(buttons)
-    await context.chat_data["order_message"].edit_reply_markup(reply_markup=reply_markup)
-    context.chat_data["order_menu_items"] = {}
-    category_id = int(update.callback_query.data.replace("order_choose_category_", ""))
-    for item in MenuCategory.list_items(category_id=category_id):
-        text = str(item)
-        buttons = [[InlineKeyboardButton(text="Добавити",
-                                         callback_data=f"order_add_item_{item.id}")]]
-        context.chat_data["order"]["header"] = context.chat_data["order"]["header"].update()
-        if context.chat_data["order"]["header"].has_item(item):
-            buttons[0].append(InlineKeyboardButton(text="Прибрати",
-                                                   callback_data=f"order_remove_item_{item.id}"))
-        reply_markup = InlineKeyboardMarkup(buttons)
-        message = await update.effective_user.send_message(text=text, reply_markup=reply_markup)
-        context.chat_data["order_menu_items"][item.id] = message
+    await render(context,
+                 chat_id=update.effective_user.id,
+                 message_id=update.callback_query.message.message_id,
+                 text=text,
+                 reply_markup=reply_markup)
+    context.chat_data["order_message"] = update.callback_query.message.message_id
+
 
+async def choose_restaurant(update: Update, context: CallbackContext, location_id: int):
+    location = await ClientSavedLocation.find(location_id=location_id)
+    context.chat_data["order"] = {"location_id": location.id,
+                                  "coordinates": (location.latitude, location.longitude)}
+    await show_restaurants_page(update, context, page=0)
 
-async def order_add_item(update: Update, context: CallbackContext):
-    menu_item_id = int(update.callback_query.data.replace("order_add_item_", ""))
-    menu_item = MenuItem.find(item_id=menu_item_id)
-    context.chat_data["order"]["header"] = context.chat_data["order"]["header"].update()
-    order_item = context.chat_data["order"]["header"].has_item(menu_item)
-    if order_item:
-        order_item.change_quantity(1)
+
+async def order_restaurants_page(update: Update, context: CallbackContext, page: int):
+    await show_restaurants_page(update, context, page=page)
+
+
+async def show_restaurants_page(update: Update, context: CallbackContext, page: int):
+    await restaurant_locations.ensure_loaded()
+    # closest first, restaurants without a location can't deliver and are not listed
+    distances = dict(restaurant_locations.restaurants_near(*context.chat_data["order"]["coordinates"]))
+    restaurants = sorted((restaurant for restaurant in await catalog.restaurants() if restaurant.id in distances),
+                         key=lambda restaurant: distances[restaurant.id])
+    restaurants, page, pages = paginate(restaurants, page, RESTAURANTS_PAGE_SIZE)
+    if restaurants:
+        text = "Виберіть заклад:\n\n" + "\n".join(restaurant.text for restaurant in restaurants)
     else:
-        OrderItem.create(header=context.chat_data["order"]["header"],
-                         menu_item=menu_item)
-    text = f"Ваше замовлення:\n{str(context.chat_data['order']['header'])}"
-    buttons = [[InlineKeyboardButton(text="Назад",
-                                     callback_data=f"choose_restaurant_{context.chat_data['order']['restaurant_id']}")]]
-    context.chat_data["order"]["header"] = context.chat_data["order"]["header"].update()
-    if context.chat_data["order"]["header"].list_items():
-        buttons.insert(0, [InlineKeyboardButton(text="Оформити замовлення",
-                                                callback_data="finish_order")])
-    reply_markup = InlineKeyboardMarkup(buttons)
-    await context.chat_data["order_message"].edit_text(text=text,
-                                                       reply_markup=reply_markup)
-    buttons = [[InlineKeyboardButton(text="Добавити",
-                                     callback_data=f"order_add_item_{menu_item_id}"),
-                InlineKeyboardButton(text="Прибрати",
-                                     callback_data=f"order_remove_item_{menu_item_id}")]]
+        text = "Поки що немає жодного закладу."
+    buttons = [[InlineKeyboardButton(text=f"{restaurant.name} ({distances[restaurant.id]:.1f} км)",
+                                     callback_data=pack("choose_restaurant_", restaurant.id))]
+               for restaurant in restaurants]
+    navigation = page_navigation("order_restaurants_page_", page, pages)
+    if navigation:
+        buttons.append(navigation)
+    buttons.append([InlineKeyboardButton(text="Назад",
+                                         callback_data="make_order")])
+    await render(context,
+                 chat_id=update.effective_user.id,
+                 message_id=update.callback_query.message.message_id,
+                 text=text,
+                 reply_markup=InlineKeyboardMarkup(buttons))
+    context.chat_data["order_message"] = update.callback_query.message.message_id
+
+
+async def order_choose_category(update: Update, context: CallbackContext, restaurant_id: int):
+    cart = context.chat_data["order"].get("cart")
+    if not cart or cart.restaurant_id != restaurant_id:
+        cart = Cart(client_location_id=context.chat_data["order"]["location_id"],
+                    restaurant_id=restaurant_id,
+                    latitude=context.chat_data["order"]["coordinates"][0],
+                    longitude=context.chat_data["order"]["coordinates"][1])
+        context.chat_data["order"]["cart"] = cart
+    text = f"Ваше замовлення:\n{await cart.describe()}"
+    buttons = [[InlineKeyboardButton(text=str(category),
+                                     callback_data=pack("order_choose_category_", category.id))]
+               for category in await catalog.categories(restaurant_id)]
     reply_markup = InlineKeyboardMarkup(buttons)
-    await update.callback_query.message.edit_reply_markup(reply_markup=reply_markup)
+    await render(context,
+                 chat_id=update.effective_user.id,
+                 message_id=context.chat_data["order_message"],
+                 text=text,
+                 reply_markup=reply_markup)
 
 
-async def order_remove_item(update: Update, context: CallbackContext):
-    menu_item_id = int(update.callback_query.data.replace("order_remove_item_", ""))
-    menu_item = MenuItem.find(item_id=menu_item_id)
-    context.chat_data["order"]["header"] = context.chat_data["order"]["header"].update()
-    order_item = context.chat_data["order"]["header"].has_item(menu_item)
-    quantity = order_item.change_quantity(-1)
-    buttons = [[InlineKeyboardButton(text="Добавити",
-                                     callback_data=f"order_add_item_{menu_item_id}")]]
-    if quantity > 0:
-        buttons[0].append(InlineKeyboardButton(text="Прибрати",
-                                               callback_data=f"order_remove_item_{menu_item_id}"))
+async def order_choose_item(update: Update, context: CallbackContext, category_id: int):
+    await show_items_page(update, context, category_id=category_id, page=0)
 
-    reply_markup = InlineKeyboardMarkup(buttons)
-    await update.callback_query.message.edit_reply_markup(reply_markup=reply_markup)
-
-    context.chat_data['order']['header'] = context.chat_data['order']['header'].update()
-    text = f"Ваше замовлення:\n{str(context.chat_data['order']['header'])}"
-    buttons = [[InlineKeyboardButton(text="Назад",
-                                     callback_data=f"choose_restaurant_{context.chat_data['order']['restaurant_id']}")]]
-    context.chat_data["order"]["header"] = context.chat_data["order"]["header"].update()
-    if context.chat_data["order"]["header"].list_items():
-        buttons.insert(0, [InlineKeyboardButton(text="Оформити замовлення",
-                                                callback_data="finish_order")])
-    reply_markup = InlineKeyboardMarkup(buttons)
-    await context.chat_data["order_message"].edit_text(text=text,
-                                                       reply_markup=reply_markup)
+
+async def order_items_page(update: Update, context: CallbackContext, category_id: int, page: int):
+    await show_items_page(update, context, category_id=category_id, page=page)
+
+
+async def show_items_page(update: Update, context: CallbackContext, category_id: int, page: int):
+    cart = context.chat_data["order"]["cart"]
+    items, page, pages = paginate(await catalog.items(category_id), page, ITEMS_PAGE_SIZE)
+    context.chat_data["order"]["browse"] = (category_id, page)
+    text = f"Ваше замовлення:\n{await cart.describe()}\n\n" + "\n\n".join(item.text for item in items)
+    buttons = []
+    for item in items:
+        row = [InlineKeyboardButton(text=f"Добавити {item.name}",
+                                    callback_data=pack("order_add_item_", item.id))]
+        if cart.quantity(item.id):
+            row.append(InlineKeyboardButton(text=f"Прибрати ({cart.quantity(item.id)})",
+                                            callback_data=pack("order_remove_item_", item.id)))
+        buttons.append(row)
+    navigation = page_navigation("order_items_page_", page, pages, category_id)
+    if navigation:
+        buttons.append(navigation)
+    if cart.items:
+        buttons.append([InlineKeyboardButton(text="Оформити замовлення",
+                                             callback_data="finish_order")])
+    buttons.append([InlineKeyboardButton(text="Назад",
+                                         callback_data=pack("choose_restaurant_", cart.restaurant_id))])
+    await render(context,
+                 chat_id=update.effective_user.id,
+                 message_id=update.callback_query.message.message_id,
+                 text=text,
+                 reply_markup=InlineKeyboardMarkup(buttons))
+    context.chat_data["order_message"] = update.callback_query.message.message_id
+
+
+async def order_add_item(update: Update, context: CallbackContext, menu_item_id: int):
+    context.chat_data["order"]["cart"].add(menu_item_id)
+    category_id, page = context.chat_data["order"]["browse"]
+    await show_items_page(update, context, category_id=category_id, page=page)
+
+
+async def order_remove_item(update: Update, context: CallbackContext, menu_item_id: int):
+    context.chat_data["order"]["cart"].remove(menu_item_id)
+    category_id, page = context.chat_data["order"]["browse"]
+    await show_items_page(update, context, category_id=category_id, page=page)
 
 
 async def finish_ordering(update: Update, context: CallbackContext):
-    if context.chat_data.get("order_menu_items"):
-        for item_id, message in context.chat_data["order_menu_items"].items():
-            await message.delete()
-        context.chat_data.pop("order_menu_items")
-    context.chat_data["order"]["header"].publish()
-    await update.callback_query.message.edit_text(f"Ваше замовлення оформлене!\n{str(context.chat_data['order']['header'])}")
+    order = context.chat_data.get("order")
+    if order is None:
+        # another tap on the button of an order that is placed already shows its receipt again
+        placed = context.chat_data.get("placed_order")
+        if placed:
+            await render(context,
+                         chat_id=update.effective_user.id,
+                         message_id=update.callback_query.message.message_id,
+                         text=f"Ваше замовлення оформлене!\n{await OrderHeader.get_summary(placed)}")
+        return
+    try:
+        header = await order["cart"].checkout(client_id=update.effective_user.id)
+    except NoBranchError:
+        context.chat_data.pop("order")
+        context.chat_data.pop("order_message", None)
+        await render(context,
+                     chat_id=update.effective_user.id,
+                     message_id=update.callback_query.message.message_id,
+                     text="На жаль, цей ресторан більше не може доставити вам замовлення.\n"
+                          "Оберіть, будь ласка, інший.",
+                     reply_markup=static_keyboard(BACK_BUTTONS))
+        return
+    if header is None:
+        # everything in the cart was taken off the menu meanwhile, the client picks again
+        category_id, page = order["browse"]
+        return await show_items_page(update, context, category_id=category_id, page=page)
+    await render(context,
+                 chat_id=update.effective_user.id,
+                 message_id=update.callback_query.message.message_id,
+                 text=f"Ваше замовлення оформлене!\n{header}")
     context.chat_data.pop("order")
     context.chat_data.pop("order_message")
+    context.chat_data["placed_order"] = header.id
+    await dispatch_order(context, header)
@@ -1,33 +1,66 @@
-from sqlalchemy import Update
-from telegram import InlineKeyboardMarkup, InlineKeyboardButton
+from typing import List, Tuple
+
+from telegram import InlineKeyboardMarkup, InlineKeyboardButton, Update
 from telegram.ext import CallbackContext
 
-from models.base import DeliveryGuyStatus
+from callbacks.special_actions import COURIER_OFF_SHIFT_BUTTONS, COURIER_ON_SHIFT_BUTTONS
+from models.base import DeliveryGuyStatus, OrderHeader
+from models.dispatch import dispatcher, PendingOrder
+from utils.broadcast import broadcaster
+from utils.callback_data import pack
+from utils.views import render, static_keyboard
+
+
+async def notify_couriers(context: CallbackContext, assignments: List[Tuple[PendingOrder, int]]):
+    messages = []
+    for order, delivery_guy_id in assignments:
+        header = await OrderHeader.get_summary(order.id)
+        reply_markup = InlineKeyboardMarkup([[InlineKeyboardButton(text="Доставлено",
+                                                                   callback_data=pack("order_delivered_", order.id))]])
+        messages.append((delivery_guy_id, {"text": f"Нове замовлення!\n{header}", "reply_markup": reply_markup}))
+    deliveries = await broadcaster.send(context.bot, messages)
+    for (order, delivery_guy_id), delivery in zip(assignments, deliveries):
+        # the courier will never see the order (blocked the bot, or Telegram kept failing), somebody else takes it
+        if not delivery.ok:
+            await OrderHeader.unassign(order, delivery_guy_id)
+
+
+async def dispatch_order(context: CallbackContext, header: OrderHeader):
+    """Gives a just placed order, queued by OrderHeader.place, to the best courier on shift."""
+    # loading the pool queues the order together with the other unassigned ones
+    await dispatcher.ensure_loaded()
+    await notify_couriers(context, await dispatcher.assign_pending())
 
 
 async def activate_delivery_status(update: Update, context: CallbackContext):
-    DeliveryGuyStatus.check_in(delivery_guy_id=update.effective_user.id, status=True)
+    await dispatcher.ensure_loaded()
+    await DeliveryGuyStatus.check_in(delivery_guy_id=update.effective_user.id, status=True)
     text = "Готово! Ви розпочали роботу.\nМеню кур'єра.\nЗараз ви працюєте. Коли появиться нове замовлення, ви отримаєте сповіщення."
-    buttons = ({"text": "Закінчити роботу", "callback_data": "end_delivery_job"},
-               {"text": "Назад", "callback_data": "to_start_menu"})
-    reply_markup = InlineKeyboardMarkup([[InlineKeyboardButton(**x)] for x in buttons])
-    await context.bot.edit_message_text(chat_id=update.effective_user.id,
-                                        message_id=context.chat_data['last_message'],
-                                        text=text)
-    await context.bot.edit_message_reply_markup(chat_id=update.effective_user.id,
-                                                message_id=context.chat_data['last_message'],
-                                                reply_markup=reply_markup)
+    reply_markup = static_keyboard(COURIER_ON_SHIFT_BUTTONS)
+    await render(context,
+                 chat_id=update.effective_user.id,
+                 message_id=context.chat_data['last_message'],
+                 text=text,
+                 reply_markup=reply_markup)
+    await notify_couriers(context, await dispatcher.assign_pending())
 
 
 async def deactivate_delivery_status(update: Update, context: CallbackContext):
-    timediff = DeliveryGuyStatus.check_in(delivery_guy_id=update.effective_user.id, status=False)
+    timediff = await DeliveryGuyStatus.check_in(delivery_guy_id=update.effective_user.id, status=False)
     text = f"Ти пропрацював {str(timediff).split('.')[0]}. До насупних зустрічей!\nМеню кур'єра.\nЗараз ви не працюєте. Щоб розпочати роботу, натисніть клавішу знизу."
-    buttons = ({"text": "Розпочати роботу", "callback_data": "start_delivery_job"},
-               {"text": "Назад", "callback_data": "to_start_menu"})
-    reply_markup = InlineKeyboardMarkup([[InlineKeyboardButton(**x)] for x in buttons])
-    await context.bot.edit_message_text(chat_id=update.effective_user.id,
-                                        message_id=context.chat_data['last_message'],
-                                        text=text)
-    await context.bot.edit_message_reply_markup(chat_id=update.effective_user.id,
-                                                message_id=context.chat_data['last_message'],
-                                                reply_markup=reply_markup)
+    reply_markup = static_keyboard(COURIER_OFF_SHIFT_BUTTONS)
+    await render(context,
+                 chat_id=update.effective_user.id,
+                 message_id=context.chat_data['last_message'],
+                 text=text,
+                 reply_markup=reply_markup)
+
+
+async def order_delivered(update: Update, context: CallbackContext, order_id: int):
+    await dispatcher.ensure_loaded()
+    await OrderHeader.deliver(order_id)
+    await render(context,
+                 chat_id=update.effective_user.id,
+                 message_id=update.callback_query.message.message_id,
+                 text=f"Доставлено!\n{update.callback_query.message.text}")
+    await notify_couriers(context, await dispatcher.assign_pending())
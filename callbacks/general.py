@@ -6,6 +6,8 @@ from telegram.ext import CallbackContext
 
 from callbacks import conversation_states
 from models.base import User, DeliveryGuyStatus
+from utils.callback_data import pack
+from utils.views import keyboard, render
 
 
 def menu_builder(buttons: List[KeyboardButton] | List[InlineKeyboardButton],
@@ -20,27 +22,48 @@ def menu_builder(buttons: List[KeyboardButton] | List[InlineKeyboardButton],
     return menu
 
 
+def paginate(items, page: int, page_size: int):
+    pages = max(1, -(-len(items) // page_size))
+    page = min(max(page, 0), pages - 1)
+    return items[page * page_size:(page + 1) * page_size], page, pages
+
+
+def page_navigation(action: str, page: int, pages: int, *arguments: int) -> List[InlineKeyboardButton]:
+    """Previous/next page buttons for `action`, called with the arguments and the page number."""
+    if pages <= 1:
+        return []
+    buttons = [InlineKeyboardButton(text=f"{page + 1}/{pages}", callback_data="noop")]
+    if page > 0:
+        buttons.insert(0, InlineKeyboardButton(text="⬅️", callback_data=pack(action, *arguments, page - 1)))
+    if page < pages - 1:
+        buttons.append(InlineKeyboardButton(text="➡️", callback_data=pack(action, *arguments, page + 1)))
+    return buttons
+
+
+START_MENU = keyboard(({"text": "Зробити замовлення", "callback_data": "make_order"},
+                       {"text": "Менеджер локацій", "callback_data": "location_manager"},
+                       {"text": "Повідомити про проблему", "callback_data": "report_issue"},
+                       {"text": "Особливі дії", "callback_data": "special_actions"}))
+
+START_MENU_TEXT = "Давай розпочнемо працювати!\n" \
+                  "Якщо ти ще не добавив свій розташування свого дому, можеш зробити це в \"Менеджер локацій\"\n" \
+                  "Якщо ж все готово, і ти зголоднів, то нумо відкривай список ресторанів!\n" \
+                  "А якщо ж у тебе є якісь зауваження, повідом їх за допомогою третьої кнопки."
+
+
 def get_start_menu():
-    menu = InlineKeyboardMarkup([[InlineKeyboardButton(**x)] for x in (
-        {"text": "Зробити замовлення", "callback_data": "make_order"},
-        {"text": "Менеджер локацій", "callback_data": "location_manager"},
-        {"text": "Повідомити про проблему", "callback_data": "report_issue"},
-        {"text": "Особливі дії", "callback_data": "special_actions"})])
-    return menu
+    return START_MENU
 
 
 async def start_menu(update: Update, context: CallbackContext):
     last_message = await context.bot.send_message(chat_id=update.effective_user.id,
-                                                  text="Давай розпочнемо працювати!\n"
-                                                       "Якщо ти ще не добавив свій розташування свого дому, можеш зробити це в \"Менеджер локацій\"\n"
-                                                       "Якщо ж все готово, і ти зголоднів, то нумо відкривай список ресторанів!\n"
-                                                       "А якщо ж у тебе є якісь зауваження, повідом їх за допомогою третьої кнопки.",
+                                                  text=START_MENU_TEXT,
                                                   reply_markup=get_start_menu())
     context.chat_data['last_message'] = last_message.message_id
 
 
 async def start_bot(update: Update, context: CallbackContext):
-    if not User.get(update.effective_user.id):
+    if not await User.get(update.effective_user.id):
         reply_markup = ReplyKeyboardMarkup([[KeyboardButton(text="Зареєструватися", request_contact=True)]])
         await context.bot.send_message(chat_id=update.effective_user.id,
                                        text="Вітаю! Дякую, що доєдналися до нашого сервісу \"Хавка на хатку!\""
@@ -56,18 +79,18 @@ async def registration(update: Update, context: CallbackContext):
                          f"{update.message.contact.last_name if update.message.contact.last_name else ''}",
             "username": update.effective_user.username,
             "phone_number": update.message.contact.phone_number}
-    User.register(**data)
+    await User.register(**data)
     await update.message.reply_text(text="Реєстрація пройшла успішно!", reply_markup=ReplyKeyboardRemove())
     return await start_menu(update, context)
 
 
 async def back(update: Update, context: CallbackContext):
-    await context.bot.edit_message_text(chat_id=update.effective_user.id,
-                                        message_id=context.chat_data["last_message"],
-                                        text="Давай розпочнемо працювати!\n"
-                                              "Якщо ти ще не добавив свій розташування свого дому, можеш зробити це в \"Менеджер локацій\"\n"
-                                              "Якщо ж все готово, і ти зголоднів, то нумо відкривай список ресторанів!\n"
-                                              "А якщо ж у тебе є якісь зауваження, повідом їх за допомогою третьої кнопки.",)
-    await context.bot.edit_message_reply_markup(chat_id=update.effective_user.id,
-                                                message_id=context.chat_data["last_message"],
-                                                reply_markup=get_start_menu())
+    await render(context,
+                 chat_id=update.effective_user.id,
+                 message_id=context.chat_data["last_message"],
+                 text=START_MENU_TEXT,
+                 reply_markup=get_start_menu())
+
+
+async def noop(update: Update, context: CallbackContext):
+    await update.callback_query.answer()
@@ -2,6 +2,8 @@ from telegram import Update, InlineKeyboardMarkup, InlineKeyboardButton
 from telegram.ext import CallbackContext
 
 from models.base import User, DeliveryGuyStatus, PromotionApplication
+from utils.broadcast import broadcaster
+from utils.views import render, static_keyboard
 
 
 ADMIN_BUTTONS = ({"text": "Добавити рестораторів", "callback_data": "check_applications_restaurant_owner"},
@@ -22,33 +24,46 @@ RESTAURANT_OWNER_BUTTONS = ({"text": "Менеджер категорій", "cal
 FREE_RESTAURANT_OWNER_BUTTONS = ({"text": "Зареєструвати ресторан", "callback_data": "create_restaurant"},
                                  {"text": "Назад", "callback_data": "to_start_menu"})
 
+CLIENT_BUTTONS = ({"text": "Подати заявку на роботу", "callback_data": "apply_for_delivery_guy"},
+                  {"text": "Зареєструвати заклад", "callback_data": "apply_for_restaurant_owner"},
+                  {"text": "Назад", "callback_data": "to_start_menu"})
+
+BACK_BUTTONS = ({"text": "Назад", "callback_data": "to_start_menu"},)
+
+COURIER_ON_SHIFT_BUTTONS = ({"text": "Закінчити роботу", "callback_data": "end_delivery_job"},
+                            {"text": "Назад", "callback_data": "to_start_menu"})
+
+COURIER_OFF_SHIFT_BUTTONS = ({"text": "Розпочати роботу", "callback_data": "start_delivery_job"},
+                             {"text": "Назад", "callback_data": "to_start_menu"})
+
+STATIC_MENUS = (ADMIN_BUTTONS, RESTAURANT_OWNER_BUTTONS, FREE_RESTAURANT_OWNER_BUTTONS, CLIENT_BUTTONS, BACK_BUTTONS,
+                COURIER_ON_SHIFT_BUTTONS, COURIER_OFF_SHIFT_BUTTONS)
+
 
 async def special_actions_menu(update: Update, context: CallbackContext):
-    user = User.get(update.effective_user.id)
+    user = await User.get(update.effective_user.id)
     text = ""
     buttons = ()
     match user.role:
         case "client":
-            if not PromotionApplication.find(user_id=update.effective_user.id):
+            if not await PromotionApplication.find(user_id=update.effective_user.id):
                 text = "Тут ви можете подати заявку на роботу або ж зареєструвати свій заклад.\n" \
                        "Якщо ви залишете свою заявку, наш менеджер зв'яжеться з вами незабаром."
-                buttons = ({"text": "Подати заявку на роботу", "callback_data": "apply_for_delivery_guy"},
-                           {"text": "Зареєструвати заклад", "callback_data": "apply_for_restaurant_owner"},
-                           {"text": "Назад", "callback_data": "to_start_menu"})
+                buttons = CLIENT_BUTTONS
             else:
                 text = "Зачекайте, будь ласка, ваша заявка опрацьовується."
-                buttons = [{"text": "Назад", "callback_data": "to_start_menu"}]
+                buttons = BACK_BUTTONS
         case "delivery_guy":
-            if DeliveryGuyStatus.last_status(update.effective_user.id).active:
+            # a courier who never started a shift has no status yet
+            status = await DeliveryGuyStatus.last_status(update.effective_user.id)
+            if status and status.active:
                 text = "Меню кур'єра.\nЗараз ви працюєте. Коли появиться нове замовлення, ви отримаєте сповіщення."
-                buttons = ({"text": "Закінчити роботу", "callback_data": "end_delivery_job"},
-                           {"text": "Назад", "callback_data": "to_start_menu"})
+                buttons = COURIER_ON_SHIFT_BUTTONS
             else:
                 text = "Меню кур'єра.\nЗараз ви не працюєте. Щоб розпочати роботу, натисніть клавішу знизу."
-                buttons = ({"text": "Розпочати роботу", "callback_data": "start_delivery_job"},
-                           {"text": "Назад", "callback_data": "to_start_menu"})
+                buttons = COURIER_OFF_SHIFT_BUTTONS
         case "restaurant_owner":
-            restaurant = user.get_restaurant()
+            restaurant = await user.get_restaurant()
             if restaurant:
                 text = f"Меню ресторатора.\nВаш ресторан: {restaurant.name}.\nТут можна працювати зі всім," \
                        f" що пов'язано з вашим закладом"
@@ -61,30 +76,24 @@ async def special_actions_menu(update: Update, context: CallbackContext):
             text = "Меню адміністратора."
             buttons = ADMIN_BUTTONS
 
-    reply_markup = InlineKeyboardMarkup([[InlineKeyboardButton(**x)] for x in buttons])
-    await context.bot.edit_message_text(chat_id=update.effective_user.id,
-                                        message_id=context.chat_data['last_message'],
-                                        text=text)
-    await context.bot.edit_message_reply_markup(chat_id=update.effective_user.id,
-                                                message_id=context.chat_data['last_message'],
-                                                reply_markup=reply_markup)
+    reply_markup = static_keyboard(buttons)
+    await render(context,
+                 chat_id=update.effective_user.id,
+                 message_id=context.chat_data['last_message'],
+                 text=text,
+                 reply_markup=reply_markup)
 
 
-async def apply_for_promotion(update: Update, context: CallbackContext):
-    role_to_promote = update.callback_query.data.replace("apply_for_", "")
-    PromotionApplication.create(user_id=update.effective_user.id, role_to_promote=role_to_promote)
+async def apply_for_promotion(update: Update, context: CallbackContext, role_to_promote: str):
+    await PromotionApplication.create(user_id=update.effective_user.id, role_to_promote=role_to_promote)
     reply_markup = InlineKeyboardMarkup([[InlineKeyboardButton(text="Назад", callback_data="to_start_menu")]])
-    await context.bot.edit_message_text(chat_id=update.effective_user.id,
-                                        message_id=context.chat_data['last_message'],
-                                        text="Заявку подано! Лишилося зачекати, щоб її оглянув адміністратор.\n"
-                                             "Адміністратор зв'яжеться з вами незабаром.")
-    await context.bot.edit_message_reply_markup(chat_id=update.effective_user.id,
-                                                message_id=context.chat_data['last_message'],
-                                                reply_markup=reply_markup)
-    admins = User.find("admin")
+    await render(context,
+                 chat_id=update.effective_user.id,
+                 message_id=context.chat_data['last_message'],
+                 text="Заявку подано! Лишилося зачекати, щоб її оглянув адміністратор.\n"
+                      "Адміністратор зв'яжеться з вами незабаром.",
+                 reply_markup=reply_markup)
+    admins = await User.find("admin")
     text_to_admin = f"{'Нова заявка на посаду кур`єра' if role_to_promote=='delivery_guy' else 'Заявка на новий заклад'}" \
                     f". Перевірте її в панелі Адміністратора (Особливі дії)"
-    if admins:
-        for admin in admins:
-            await context.bot.send_message(chat_id=admin.telegram_id,
-                                           text=text_to_admin)
+    await broadcaster.broadcast(context.bot, (admin.telegram_id for admin in admins), text=text_to_admin)
@@ -14,13 +14,16 @@ Basic inline bot example. Applies different text transformations.
 Press Ctrl-C on the command line or send a signal to the process to stop the
 bot.
 """
+import asyncio
 import logging
+from typing import Tuple
 
 import yaml
 from telegram import Update
 from telegram.constants import ParseMode
 from telegram.ext import Application, CommandHandler, ContextTypes, InlineQueryHandler, MessageHandler, filters, \
-    CallbackQueryHandler, ConversationHandler, PicklePersistence
+    CallbackQueryHandler, ConversationHandler, Updater
+from telegram.request import BaseRequest, HTTPXRequest
 
 from callbacks import conversation_states
 from callbacks.admin_tools import (
@@ -29,13 +32,14 @@ from callbacks.admin_tools import (
     confirm_remove_promotion, 
     remove_promotion_final,
     accept_application,
-    cancel_application)
+    cancel_application,
+    profile)
 from callbacks.client_tools import client_saved_location_manager, add_client_location_name, \
     add_client_location_location, add_client_location_finish, edit_client_location_name, edit_client_location_finish, \
     edit_client_locations, start_ordering, choose_restaurant, order_choose_category, order_choose_item, order_add_item, \
-    order_remove_item, finish_ordering
-from callbacks.delivery_guy_tools import activate_delivery_status, deactivate_delivery_status
-from callbacks.general import start_bot, registration, back
+    order_remove_item, finish_ordering, order_restaurants_page, order_items_page
+from callbacks.delivery_guy_tools import activate_delivery_status, deactivate_delivery_status, order_delivered
+from callbacks.general import start_bot, registration, back, noop
 from callbacks.restaurant_owner_tools import register_restaurant, added_name, added_description, category_manager, \
     add_category, category_added, edit_categories, change_category_name, choose_menu_category, \
     choose_menu_add_or_delete, add_menu_item_start, add_menu_item_add_description, add_menu_item_add_price, \
@@ -43,8 +47,20 @@ from callbacks.restaurant_owner_tools import register_restaurant, added_name, ad
     delete_menu_item_confirmation, delete_menu_item, edit_menu_item_choose, menu_item_edit_choose, \
     menu_item_edit_finish, menu_item_edit, delete_restaurant_confirmation, delete_restaurant_final, \
     restaurant_location_manager, add_restaurant_location_name, add_restaurant_location_location, \
-    add_restaurant_location_finish
-from callbacks.special_actions import special_actions_menu, apply_for_promotion
+    add_restaurant_location_finish, CATEGORY_MENU_BUTTONS
+from callbacks.special_actions import special_actions_menu, apply_for_promotion, STATIC_MENUS
+from models.catalog import catalog
+from models.database import database
+from models.dispatch import dispatcher
+from models.geo import restaurant_locations
+from models.migrations import migrate
+from utils.instrumentation import QueryBudget, instrument
+from utils.metrics import MeasuredRequest, serve as serve_metrics
+from utils.persistence import SQLitePersistence
+from utils.router import CallbackRouter
+from utils.update_processor import ChatOrderedUpdateProcessor
+from utils.views import static_keyboard
+from utils.workers import run_workers
 
 # Enable logging
 logging.basicConfig(
@@ -56,69 +72,150 @@ logging.getLogger("httpx").setLevel(logging.WARNING)
 logger = logging.getLogger(__name__)
 
 
-def main() -> None:
-    """Run the bot."""
-    # Create the Application and pass it your bot's token.
-    with open("config.yml", "r") as file:
-        config = yaml.safe_load(file)
-    persistence = PicklePersistence(filepath=config["persistence_file"])
+async def prepare_database() -> None:
+    applied = await migrate()
+    if applied:
+        logger.info("Applied database migrations: %s", applied)
+
+
+async def prepare_workers() -> None:
+    await prepare_database()
+    # the front process needs no database after this, its connections must not outlive the event loop
+    await database.dispose()
+
+
+async def load_caches(application: Application) -> None:
+    for menu in STATIC_MENUS + (CATEGORY_MENU_BUTTONS,):
+        static_keyboard(menu)
+    await catalog.warm_up()
+    logger.info("Menu catalog warmed up: %s", catalog.stats)
+    await restaurant_locations.load()
+    logger.info("Restaurant locations indexed: %s", len(restaurant_locations))
+    await dispatcher.load()
+    logger.info("Couriers on shift: %s, orders waiting for one: %s", len(dispatcher.couriers), len(dispatcher.pending))
+
+
+async def post_init(application: Application) -> None:
+    await prepare_database()
+    await load_caches(application)
+
+
+def configure(config: dict) -> None:
+    """Applies the model settings of config.yml. Without `database` the models use the database configured
+    before, benchmarks inject theirs that way (see models.database)."""
+    if "database" in config:
+        # database must use an async driver, e.g. "sqlite+aiosqlite:///sample.db";
+        # database_pool is passed as is to the engine (pool_size, max_overflow, pool_timeout, pool_recycle, ...),
+        # database_profile: "sqlite_wal" with database_readers splits reads and writes (see models.database)
+        database.configure_from(config)
+    catalog.max_entries = config.get("catalog_cache_size", catalog.max_entries)
+    dispatcher.max_load = config.get("courier_max_load", dispatcher.max_load)
+
 
-    application = Application.builder().token(config["token"]).build()
+def webhook_options(webhook: dict) -> dict:
+    # Telegram pushes updates to `url`, a reverse proxy in front of the bot forwards them to listen:port/path
+    return {"listen": webhook.get("listen", "127.0.0.1"),
+            "port": webhook.get("port", 8443),
+            "url_path": webhook.get("path", ""),
+            "webhook_url": webhook["url"],
+            "secret_token": webhook.get("secret_token"),
+            "max_connections": webhook.get("max_connections", 40)}
+
+
+async def start_updater(updater: Updater, config: dict) -> None:
+    if config.get("webhook"):
+        await updater.start_webhook(**webhook_options(config["webhook"]), allowed_updates=Update.ALL_TYPES)
+    else:
+        await updater.start_polling(allowed_updates=Update.ALL_TYPES)
+
+
+def build_application(config: dict, shard: Tuple[int, int] = None, request: BaseRequest = None) -> Application:
+    """The bot with all its handlers. A worker process (see utils.workers) gets the updates of its shard of
+    chats from the front process, so it has no updater of its own and leaves migrations to the front.
+    `request` replaces the HTTP client of the Bot API, benchmarks pass a fake one."""
+    configure(config)
+    # only chats changed since the last flush are written, every `persistence_interval` seconds
+    persistence = SQLitePersistence(filepath=config["persistence_file"],
+                                    update_interval=config.get("persistence_interval", 60),
+                                    shard=shard or (0, 1))
+
+    # Bot API requests are counted and timed per method; 256 connections is what PTB gives the bot by default
+    request = MeasuredRequest(request or HTTPXRequest(connection_pool_size=256))
+    builder = Application.builder().token(config["token"]).persistence(persistence).request(request)
+    if shard:
+        builder.updater(None).post_init(load_caches)
+    else:
+        builder.post_init(post_init)
+    if config.get("concurrent_updates"):
+        # updates of different chats run in parallel, updates of one chat stay ordered
+        builder.concurrent_updates(ChatOrderedUpdateProcessor(config["concurrent_updates"]))
+    application = builder.build()
 
     # on different commands - answer in Telegram
     application.add_handler(CommandHandler("start", start_bot))
+    application.add_handler(CommandHandler("profile", profile))
     application.add_handler(MessageHandler(filters.CONTACT, registration))
-    application.add_handler(CallbackQueryHandler(special_actions_menu, "special_actions"))
-    application.add_handler(CallbackQueryHandler(back, "to_start_menu"))
-    application.add_handler(CallbackQueryHandler(activate_delivery_status, "start_delivery_job"))
-    application.add_handler(CallbackQueryHandler(deactivate_delivery_status, "end_delivery_job"))
-    application.add_handler(CallbackQueryHandler(apply_for_promotion, "apply_for_.+"))
-    application.add_handler(CallbackQueryHandler(check_applications, "check_applications_.+"))
-    application.add_handler(CallbackQueryHandler(remove_promotions, "remove_promotions_.+"))
-    application.add_handler(CallbackQueryHandler(confirm_remove_promotion, "downgrade_.+"))
-    application.add_handler(CallbackQueryHandler(remove_promotion_final, "confirm_downgrade_.+"))
-    application.add_handler(CallbackQueryHandler(accept_application, "accept_promotion_.+"))
-    application.add_handler(CallbackQueryHandler(cancel_application, "reject_promotion_.+"))
-    application.add_handler(CallbackQueryHandler(category_manager, "category_manager"))
-    application.add_handler(CallbackQueryHandler(edit_categories, "edit_menu_category"))
-    application.add_handler(CallbackQueryHandler(choose_menu_category, "menu_items_manager"))
-    application.add_handler(CallbackQueryHandler(choose_menu_add_or_delete, "menu_item_category_.+"))
-    application.add_handler(CallbackQueryHandler(delete_category_confirmation, "menu_category_delete_.+"))
-    application.add_handler(CallbackQueryHandler(delete_category, "confirm_category_delete_.+"))
-    application.add_handler(CallbackQueryHandler(edit_menu_item_choose, "1_edit_menu_item_.+"))
-    application.add_handler(CallbackQueryHandler(delete_menu_item_confirmation, "delete_menu_item_.+"))
-    application.add_handler(CallbackQueryHandler(delete_menu_item, "confirm_item_delete_.+"))
-    application.add_handler(CallbackQueryHandler(menu_item_edit_choose, "2_edit_menu_item_details_.+"))
-    application.add_handler(CallbackQueryHandler(delete_restaurant_confirmation, "delete_restaurant"))
-    application.add_handler(CallbackQueryHandler(delete_restaurant_final, "restaurant_confirm_delete"))
-    application.add_handler(CallbackQueryHandler(restaurant_location_manager, "restaurant_locations_manager"))
-    application.add_handler(CallbackQueryHandler(client_saved_location_manager, "location_manager"))
-    application.add_handler(CallbackQueryHandler(edit_client_locations, "edit_client_locations"))
-
-    application.add_handler(CallbackQueryHandler(start_ordering, "make_order"))
-    application.add_handler(CallbackQueryHandler(choose_restaurant, "order_choose_location_.+"))
-    application.add_handler(CallbackQueryHandler(order_choose_category, "choose_restaurant_.+"))
-    application.add_handler(CallbackQueryHandler(order_choose_item, "order_choose_category_.+"))
-    application.add_handler(CallbackQueryHandler(order_add_item, "order_add_item_.+"))
-    application.add_handler(CallbackQueryHandler(order_remove_item, "order_remove_item_.+"))
-    application.add_handler(CallbackQueryHandler(finish_ordering, "finish_order"))
+    # plain callback queries are routed by their data, conversation entry points are separate handlers
+    router = CallbackRouter()
+    router.add("special_actions", special_actions_menu)
+    router.add("to_start_menu", back)
+    router.add("noop", noop)
+    router.add("start_delivery_job", activate_delivery_status)
+    router.add("end_delivery_job", deactivate_delivery_status)
+    router.add("order_delivered_", order_delivered, int)
+    router.add("apply_for_", apply_for_promotion, str)
+    router.add("check_applications_", check_applications, str)
+    router.add("remove_promotions_", remove_promotions, str)
+    router.add("downgrade_", confirm_remove_promotion, int)
+    router.add("confirm_downgrade_", remove_promotion_final, int)
+    router.add("accept_promotion_", accept_application, int)
+    router.add("reject_promotion_", cancel_application, int)
+    router.add("category_manager", category_manager)
+    router.add("edit_menu_category", edit_categories)
+    router.add("menu_items_manager", choose_menu_category)
+    router.add("menu_item_category_", choose_menu_add_or_delete, int)
+    router.add("menu_category_delete_", delete_category_confirmation, int)
+    router.add("confirm_category_delete_", delete_category, int)
+    router.add("1_edit_menu_item_", edit_menu_item_choose, int)
+    router.add("delete_menu_item_", delete_menu_item_confirmation, int)
+    router.add("confirm_item_delete_", delete_menu_item, int)
+    router.add("2_edit_menu_item_details_", menu_item_edit_choose, int)
+    router.add("delete_restaurant", delete_restaurant_confirmation)
+    router.add("restaurant_confirm_delete", delete_restaurant_final)
+    router.add("restaurant_locations_manager", restaurant_location_manager)
+    router.add("location_manager", client_saved_location_manager)
+    router.add("edit_client_locations", edit_client_locations)
+
+    router.add("make_order", start_ordering)
+    router.add("order_choose_location_", choose_restaurant, int)
+    router.add("order_restaurants_page_", order_restaurants_page, int)
+    router.add("choose_restaurant_", order_choose_category, int)
+    router.add("order_choose_category_", order_choose_item, int)
+    router.add("order_items_page_", order_items_page, int, int)
+    router.add("order_add_item_", order_add_item, int)
+    router.add("order_remove_item_", order_remove_item, int)
+    router.add("finish_order", finish_ordering)
+    application.add_handler(router)
 
     application.add_handler(ConversationHandler(entry_points=[CallbackQueryHandler(register_restaurant, "create_restaurant")],
                                                 states={conversation_states.ENTER_RESTAURANT_NAME: [
                                                         MessageHandler(filters.TEXT, added_name)],
                                                         conversation_states.ENTER_RESTAURANT_DESCRIPTION: [
                                                         MessageHandler(filters.TEXT, added_description)]},
-                                                fallbacks=[CommandHandler("start", start_bot)]))
+                                                fallbacks=[CommandHandler("start", start_bot)],
+                                                name="register_restaurant", persistent=True))
 
     application.add_handler(ConversationHandler(entry_points=[CallbackQueryHandler(add_category, "add_menu_category")],
                                                 states={conversation_states.ENTER_CATEGORY_NAME: [
                                                     MessageHandler(filters.TEXT, category_added)]},
-                                                fallbacks=[CommandHandler("start", start_bot)]))
+                                                fallbacks=[CommandHandler("start", start_bot)],
+                                                name="add_category", persistent=True))
 
     application.add_handler(ConversationHandler(entry_points=[CallbackQueryHandler(change_category_name, "menu_category_change_.+")],
                                                 states={conversation_states.CHANGE_CATEGORY_NAME: [
                                                     MessageHandler(filters.TEXT, changed_category_name)]},
-                                                fallbacks=[CommandHandler("start", start_bot)]))
+                                                fallbacks=[CommandHandler("start", start_bot)],
+                                                name="change_category_name", persistent=True))
 
     application.add_handler(ConversationHandler(entry_points=[CallbackQueryHandler(add_menu_item_start, "add_menu_item_.+")],
                                                 states={conversation_states.ADD_MENU_ITEM_NAME: [
@@ -127,19 +224,22 @@ def main() -> None:
                                                         MessageHandler(filters.TEXT, add_menu_item_add_price)],
                                                         conversation_states.ADD_MENU_ITEM_PRICE: [
                                                         MessageHandler(filters.TEXT, add_menu_item_finish)]},
-                                                fallbacks=[CommandHandler("start", start_bot)]))
+                                                fallbacks=[CommandHandler("start", start_bot)],
+                                                name="add_menu_item", persistent=True))
 
     application.add_handler(ConversationHandler(entry_points=[CallbackQueryHandler(menu_item_edit, "3_edit_menu_item_.+")],
                                                 states={conversation_states.EDIT_MENU_ITEM_DETAILS: [
                                                     MessageHandler(filters.TEXT, menu_item_edit_finish)]},
-                                                fallbacks=[CommandHandler("start", start_bot)]))
+                                                fallbacks=[CommandHandler("start", start_bot)],
+                                                name="edit_menu_item", persistent=True))
 
     application.add_handler(ConversationHandler(entry_points=[CallbackQueryHandler(add_restaurant_location_name, "add_restaurant_location")],
                                                 states={conversation_states.ADD_RESTAURANT_LOCATION_NAME: [
                                                         MessageHandler(filters.TEXT, add_restaurant_location_location)],
                                                         conversation_states.ADD_RESTAURANT_LOCATION_LOCATION: [
                                                         MessageHandler(filters.LOCATION, add_restaurant_location_finish)]},
-                                                fallbacks=[CommandHandler("start", start_bot)]))
+                                                fallbacks=[CommandHandler("start", start_bot)],
+                                                name="add_restaurant_location", persistent=True))
 
     application.add_handler(ConversationHandler(
         entry_points=[CallbackQueryHandler(add_client_location_name, "add_сlient_location")],
@@ -147,16 +247,41 @@ def main() -> None:
             MessageHandler(filters.TEXT, add_client_location_location)],
             conversation_states.ADD_CLIENT_LOCATION_LOCATION: [
                 MessageHandler(filters.LOCATION, add_client_location_finish)]},
-        fallbacks=[CommandHandler("start", start_bot)]))
+        fallbacks=[CommandHandler("start", start_bot)],
+        name="add_client_location", persistent=True))
 
     application.add_handler(ConversationHandler(
         entry_points=[CallbackQueryHandler(edit_client_location_name, "client_location_change_name_.+")],
         states={conversation_states.EDIT_CLIENT_LOCATION_NAME: [
             MessageHandler(filters.TEXT, edit_client_location_finish)]},
-        fallbacks=[CommandHandler("start", start_bot)]))
+        fallbacks=[CommandHandler("start", start_bot)],
+        name="edit_client_location_name", persistent=True))
+
+    # handlers over `query_budget` (SQL statements and milliseconds per update) are logged with their slowest query
+    instrument(application, QueryBudget(**config.get("query_budget", {})))
+    if config.get("metrics"):
+        serve_metrics(application, config["metrics"], worker=shard[0] if shard else 0)
+    return application
+
+
+def main() -> None:
+    """Run the bot."""
+    with open("config.yml", "r") as file:
+        config = yaml.safe_load(file)
+    workers = config.get("workers", 1)
+    if workers > 1:
+        # one process receives updates, `workers` processes handle them, sharded by chat id
+        configure(config)
+        asyncio.run(prepare_workers())
+        return run_workers(config, workers, build_application, start_updater)
+    application = build_application(config)
 
     # Run the bot until the user presses Ctrl-C
-    application.run_polling(allowed_updates=Update.ALL_TYPES)
+    webhook = config.get("webhook")
+    if webhook:
+        application.run_webhook(**webhook_options(webhook), allowed_updates=Update.ALL_TYPES)
+    else:
+        application.run_polling(allowed_updates=Update.ALL_TYPES)
 
 
 if __name__ == "__main__":
@@ -1,18 +1,80 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
 from datetime import datetime, timedelta
-from typing import List
+from typing import Iterator, List, Optional, Tuple
 
-import yaml
-from sqlalchemy import create_engine, CheckConstraint, select, ForeignKey, desc, and_, func
+from sqlalchemy import CheckConstraint, select, ForeignKey, desc, and_, func, update, Index, event
 from sqlalchemy.exc import IntegrityError
-from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship, Session
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import AsyncAttrs
+from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship, selectinload, joinedload
 
+from models.catalog import catalog
+from models.database import database
+from models.dispatch import dispatcher, PendingOrder
+from models.geo import restaurant_locations
+from models.sync import publish
 
-class Base(DeclarativeBase):
+
+class Base(AsyncAttrs, DeclarativeBase):
     pass
 
-with open("config.yml", "r") as file:
-    config = yaml.safe_load(file)
-engine = create_engine(config["database"])
+# a new session of the database configured in models.database, created on first use; methods that only read use
+# read_session, which the sqlite_wal profile runs on a pool of reader connections
+async_session = database.session
+read_session = database.read_session
+
+
+@dataclass(slots=True)
+class QueryStats:
+    """SQL statements run inside one measure_queries block."""
+    name: str
+    count: int = 0
+    seconds: float = 0.0
+    slowest: float = 0.0
+    slowest_statement: str = ""
+    # every statement, only when asked for, e.g. to show an N+1 in a failed assertion
+    statements: Optional[List[str]] = None
+
+    def add(self, statement: str, seconds: float):
+        self.count += 1
+        self.seconds += seconds
+        if seconds >= self.slowest:
+            self.slowest, self.slowest_statement = seconds, statement
+        if self.statements is not None:
+            self.statements.append(statement)
+
+
+# the measure_queries blocks the running task is in, innermost last; a statement counts for all of them
+_measured: ContextVar[Tuple[QueryStats, ...]] = ContextVar("measured_queries", default=())
+
+
+@contextmanager
+def measure_queries(name: str, record: bool = False) -> Iterator[QueryStats]:
+    """Counts and times the statements the current task runs inside the block. Lazy loads and the sessions
+    opened by model methods count too, so this is what one handler really costs the database."""
+    stats = QueryStats(name, statements=[] if record else None)
+    token = _measured.set(_measured.get() + (stats,))
+    try:
+        yield stats
+    finally:
+        _measured.reset(token)
+
+
+# on the Engine class, so they also hook engines injected through database.configure
+@event.listens_for(Engine, "before_cursor_execute")
+def _statement_started(connection, cursor, statement, parameters, context, executemany):
+    # a connection runs one statement at a time
+    connection.info["statement_started"] = time.perf_counter()
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _statement_finished(connection, cursor, statement, parameters, context, executemany):
+    seconds = time.perf_counter() - connection.info["statement_started"]
+    for stats in _measured.get():
+        stats.add(statement, seconds)
 
 
 class User(Base):
@@ -22,7 +84,7 @@ class User(Base):
     phone_number: Mapped[str] = mapped_column(unique=True)
     full_name: Mapped[str] = mapped_column(nullable=True)
     role: Mapped[str] = mapped_column(CheckConstraint("role IN ('client', 'restaurant_owner', 'delivery_guy', 'admin')"),
-                                      default="client", nullable=False)
+                                      default="client", nullable=False, index=True)
     saved_locations: Mapped[List["ClientSavedLocation"]] = relationship(back_populates='user')
     restaurant: Mapped["Restaurant"] = relationship(back_populates="owner")
     orders: Mapped[List["OrderHeader"]] = relationship(back_populates="client", foreign_keys="[OrderHeader.client_id]")
@@ -33,8 +95,8 @@ class User(Base):
     def __repr__(self):
         return f"<User {self.role} - {self.full_name}>"
 
-    def __str__(self):
-        with Session(engine) as session:
+    async def describe(self):
+        async with read_session() as session:
             session.add(self)
             match self.role:
                 case "admin":
@@ -42,68 +104,69 @@ class User(Base):
                     details = ""
                 case "delivery_guy":
                     role_ua = "Кур`єр"
-                    details = f"{len(self.deliveries)} доставок\n"
+                    details = f"{len(await self.awaitable_attrs.deliveries)} доставок\n"
                 case "restaurant_owner":
                     role_ua = "Менеджер ресторану"
-                    details = f"Ресторан: {self.restaurant.name if self.restaurant else 'немає'}\n"
+                    restaurant = await self.awaitable_attrs.restaurant
+                    details = f"Ресторан: {restaurant.name if restaurant else 'немає'}\n"
                 case _:
                     role_ua = "Клієнт"
                     details = ""
             return f"{self.full_name} (@{self.username})\n" \
                    f"{role_ua}\n" \
                    f"{details}" \
-                   f"{len(self.orders)} замовлень"
+                   f"{len(await self.awaitable_attrs.orders)} замовлень"
 
     @classmethod
-    def register(cls, telegram_id: int, username: str, phone_number: str, full_name: str = None):
-        with Session(engine) as session:
-            if not session.get(cls, telegram_id):
+    async def register(cls, telegram_id: int, username: str, phone_number: str, full_name: str = None):
+        async with async_session() as session:
+            if not await session.get(cls, telegram_id):
                 session.add(cls(telegram_id=telegram_id,
                                 username=username,
                                 phone_number=phone_number,
                                 full_name=full_name))
-                session.commit()
+                await session.commit()
             else:
                 raise IntegrityError
 
     @classmethod
-    def find(cls, role=None):
-        with Session(engine) as session:
-            return session.scalars(select(cls).where(cls.role == role)).all()
+    async def find(cls, role=None):
+        async with read_session() as session:
+            return (await session.scalars(select(cls).where(cls.role == role))).all()
 
     @classmethod
-    def get(cls, telegram_id: int):
-        with Session(engine) as session:
-            return session.scalar(select(cls).where(cls.telegram_id == telegram_id))
+    async def get(cls, telegram_id: int):
+        async with read_session() as session:
+            return await session.scalar(select(cls).where(cls.telegram_id == telegram_id))
 
-    def promote(self, role: str):
-        with Session(engine) as session:
+    async def promote(self, role: str):
+        async with async_session() as session:
+            session.add(self)
             if self.role != role:
                 self.role = role
-                session.commit()
+                await session.commit()
             else:
                 raise IntegrityError
 
-    def get_restaurant(self):
-        with Session(engine) as session:
+    async def get_restaurant(self):
+        async with read_session() as session:
             session.add(self)
-            return self.restaurant
+            return await self.awaitable_attrs.restaurant
 
-    def add_location(self, name: str, longitude: float, latitude: float):
-        with Session(engine) as session:
-            session.add(self)
+    async def add_location(self, name: str, longitude: float, latitude: float):
+        async with async_session() as session:
             location = ClientSavedLocation(location_name=name,
                                            longitude=longitude,
                                            latitude=latitude,
-                                           user=self)
+                                           user_id=self.telegram_id)
             session.add(location)
-            session.commit()
+            await session.commit()
         return location
 
-    def list_locations(self):
-        with Session(engine) as session:
+    async def list_locations(self):
+        async with read_session() as session:
             session.add(self)
-            return self.saved_locations
+            return await self.awaitable_attrs.saved_locations
 
 
 class DeliveryGuyStatus(Base):
@@ -113,17 +176,22 @@ class DeliveryGuyStatus(Base):
     active: Mapped[bool] = mapped_column(nullable=False)
     timestamp: Mapped[datetime] = mapped_column(nullable=False)
     delivery_guy: Mapped["User"] = relationship(back_populates="delivery_guy_statuses")
+    __table_args__ = (Index("ix_delivery_guy_statuses_delivery_guy_id_id", "delivery_guy_id", "id"),)
 
 
     @classmethod
-    def last_status(cls, delivery_guy_id):
-        with Session(engine) as session:
-            return session.scalars(select(cls).where(cls.delivery_guy_id == delivery_guy_id).order_by(desc(cls.id))).first()
+    async def last_status(cls, delivery_guy_id):
+        async with read_session() as session:
+            return (await session.scalars(select(cls)
+                                          .join(DeliveryGuyCurrentStatus, DeliveryGuyCurrentStatus.status_id == cls.id)
+                                          .where(DeliveryGuyCurrentStatus.delivery_guy_id == delivery_guy_id))).first()
 
     @classmethod
-    def check_in(cls, delivery_guy_id: int, status: bool):
-        with Session(engine) as session:
-            last_status = session.scalars(select(cls).where(cls.delivery_guy_id == delivery_guy_id).order_by(desc(cls.id))).first()
+    async def check_in(cls, delivery_guy_id: int, status: bool):
+        async with async_session() as session:
+            current = await session.get(DeliveryGuyCurrentStatus, delivery_guy_id,
+                                        options=[joinedload(DeliveryGuyCurrentStatus.status)])
+            last_status = current.status if current else None
             if last_status and last_status.active == status:
                 raise IntegrityError
             else:
@@ -131,15 +199,49 @@ class DeliveryGuyStatus(Base):
                                  active=status,
                                  timestamp=datetime.now())
                 session.add(new_status)
-                session.commit()
+                await session.flush()
+                if current:
+                    current.status_id = new_status.id
+                    current.active = status
+                else:
+                    session.add(DeliveryGuyCurrentStatus(delivery_guy_id=delivery_guy_id,
+                                                         status_id=new_status.id,
+                                                         active=status))
+                await session.commit()
+                if status:
+                    # orders a courier took before the end of the last shift and still hasn't delivered
+                    load = (await OrderHeader.courier_loads(delivery_guy_id)).get(delivery_guy_id, 0)
+                    dispatcher.check_in(delivery_guy_id, new_status.timestamp, load)
+                    publish("dispatcher", "check_in", delivery_guy_id, new_status.timestamp, load)
+                else:
+                    dispatcher.check_out(delivery_guy_id)
+                    publish("dispatcher", "check_out", delivery_guy_id)
             if last_status:
                 return new_status.timestamp - last_status.timestamp
 
+    @classmethod
+    async def list_active(cls):
+        """Latest status of every courier that is on shift now."""
+        async with read_session() as session:
+            return (await session.scalars(select(cls)
+                                          .join(DeliveryGuyCurrentStatus, DeliveryGuyCurrentStatus.status_id == cls.id)
+                                          .where(DeliveryGuyCurrentStatus.active.is_(True)))).all()
+
+
+class DeliveryGuyCurrentStatus(Base):
+    # latest row of delivery_guy_statuses of every courier, written in the same transaction as the history,
+    # so the current status is a primary key lookup instead of a scan of the history
+    __tablename__ = "delivery_guy_current_statuses"
+    delivery_guy_id: Mapped[int] = mapped_column(ForeignKey("users.telegram_id"), primary_key=True)
+    status_id: Mapped[int] = mapped_column(ForeignKey("delivery_guy_statuses.id"))
+    active: Mapped[bool] = mapped_column(nullable=False, index=True)
+    status: Mapped["DeliveryGuyStatus"] = relationship()
+
 
 class PromotionApplication(Base):
     __tablename__ = "user_promotion_applications"
     id: Mapped[int] = mapped_column(primary_key=True)
-    user_id: Mapped[int] = mapped_column(ForeignKey("users.telegram_id"))
+    user_id: Mapped[int] = mapped_column(ForeignKey("users.telegram_id"), index=True)
     role_to_promote: Mapped[str] = mapped_column(CheckConstraint("role_to_promote IN ('restaurant_owner', 'delivery_guy')"),
                                       nullable=False)
     timestamp: Mapped[datetime] = mapped_column(nullable=False)
@@ -151,10 +253,10 @@ class PromotionApplication(Base):
                f" Closed={self.closed}>"
 
     @classmethod
-    def create(cls, user_id: int, role_to_promote: str):
-        with Session(engine) as session:
-            user = User.get(user_id)
-            if not session.scalars(select(cls).where(cls.user == user)).first():
+    async def create(cls, user_id: int, role_to_promote: str):
+        async with async_session() as session:
+            user = await User.get(user_id)
+            if not (await session.scalars(select(cls).where(cls.user == user))).first():
                 session.add(cls(user_id=user.telegram_id,
                                 role_to_promote=role_to_promote,
                                 timestamp=datetime.now()))
@@ -162,52 +264,54 @@ class PromotionApplication(Base):
                     DeliveryGuyStatus(delivery_guy_id=user.telegram_id,
                                       active=False,
                                       timestamp=datetime.now())
-                session.commit()
+                await session.commit()
             else:
                 raise IntegrityError
 
     @classmethod
-    def find(cls, user_id: int):
-        with Session(engine) as session:
-            return session.scalars(select(cls).where(cls.user_id == user_id and not cls.closed)).first()
+    async def find(cls, user_id: int):
+        async with read_session() as session:
+            return (await session.scalars(select(cls).where(cls.user_id == user_id and not cls.closed)
+                                          .options(selectinload(cls.user)))).first()
 
     @classmethod
-    def all_open(cls, role):
-        with Session(engine) as session:
-            return session.scalars(select(cls).where(and_(cls.role_to_promote == role, cls.closed is False))).all()
+    async def all_open(cls, role):
+        async with read_session() as session:
+            return (await session.scalars(select(cls).where(and_(cls.role_to_promote == role, cls.closed is False))
+                                          .options(selectinload(cls.user)))).all()
 
     @classmethod
-    def close(cls, appl_id: int):
-        with Session(engine) as session:
-            appl = session.get(cls, appl_id)
+    async def close(cls, appl_id: int):
+        async with async_session() as session:
+            appl = await session.get(cls, appl_id)
             appl.closed = True
-            session.commit()
+            await session.commit()
 
     @classmethod
-    def promote(cls, user_id: int):
-        with Session(engine) as session:
-            appl = session.scalars(select(cls).where(cls.user_id == user_id and not cls.closed)).first()
-            appl.user.promote(appl.role_to_promote)
+    async def promote(cls, user_id: int):
+        async with async_session() as session:
+            appl = (await session.scalars(select(cls).where(cls.user_id == user_id and not cls.closed))).first()
+            user = await appl.awaitable_attrs.user
+            if user.role == appl.role_to_promote:
+                raise IntegrityError
+            user.role = appl.role_to_promote
             appl.closed = True
             role_to_promote = appl.role_to_promote
-            session.commit()
+            await session.commit()
         if role_to_promote == "delivery_guy":
-            DeliveryGuyStatus.check_in(delivery_guy_id=user_id, status=False)
+            await DeliveryGuyStatus.check_in(delivery_guy_id=user_id, status=False)
         return role_to_promote
 
     def __str__(self):
-        with Session(engine) as session:
-            session.add(self)
-            _str = f"{self.user.full_name} (@{self.user.username})\n" \
-                   f"{'Кур`єр' if self.role_to_promote == 'delivery_guy' else 'Власник ресторану'}\n" \
-                   f"{self.timestamp}"
-        return _str
+        return f"{self.user.full_name} (@{self.user.username})\n" \
+               f"{'Кур`єр' if self.role_to_promote == 'delivery_guy' else 'Власник ресторану'}\n" \
+               f"{self.timestamp}"
 
 
 class ClientSavedLocation(Base):
     __tablename__ = "client_saved_locations"
     id: Mapped[int] = mapped_column(primary_key=True)
-    user_id: Mapped[int] = mapped_column(ForeignKey('users.telegram_id'), nullable=False)
+    user_id: Mapped[int] = mapped_column(ForeignKey('users.telegram_id'), nullable=False, index=True)
     location_name: Mapped[str] = mapped_column(nullable=False)
     longitude: Mapped[float] = mapped_column(nullable=False)
     latitude: Mapped[float] = mapped_column(nullable=False)
@@ -218,38 +322,36 @@ class ClientSavedLocation(Base):
         return f"<{self.user}'s location - {self.location_name}>"
 
     def __str__(self):
-        with Session(engine) as session:
-            session.add(self)
-            return f"{self.location_name}"
+        return f"{self.location_name}"
 
     @classmethod
-    def create(cls, user: User, location_name, longitude, latitude):
-        with Session(engine) as session:
-            if not location_name in session.execute(select(cls).where(cls.user == user)):
-                session.add(cls(user=user,
+    async def create(cls, user: User, location_name, longitude, latitude):
+        async with async_session() as session:
+            if not location_name in await session.execute(select(cls).where(cls.user == user)):
+                session.add(cls(user_id=user.telegram_id,
                                 location_name=location_name,
                                 longitude=longitude,
                                 latitude=latitude))
-                session.commit()
+                await session.commit()
             else:
                 raise IntegrityError
 
-    def delete(self):
-        with Session(engine) as session:
-            session.delete(self)
-            session.commit()
+    async def delete(self):
+        async with async_session() as session:
+            await session.delete(self)
+            await session.commit()
 
     @classmethod
-    def find(cls, location_id: int) -> "ClientSavedLocation":
-        with Session(engine) as session:
-            location = session.scalars(select(cls).where(cls.id == location_id)).first()
+    async def find(cls, location_id: int) -> "ClientSavedLocation":
+        async with read_session() as session:
+            location = (await session.scalars(select(cls).where(cls.id == location_id))).first()
             return location
 
-    def edit(self, name):
-        with Session(engine) as session:
+    async def edit(self, name):
+        async with async_session() as session:
             session.add(self)
             self.location_name = name
-            session.commit()
+            await session.commit()
         return self
 
 
@@ -258,7 +360,7 @@ class Restaurant(Base):
     id: Mapped[int] = mapped_column(primary_key=True)
     name: Mapped[str] = mapped_column(unique=True)
     description: Mapped[str] = mapped_column(nullable=True)
-    owner_id: Mapped[int] = mapped_column(ForeignKey("users.telegram_id"), nullable=True)
+    owner_id: Mapped[int] = mapped_column(ForeignKey("users.telegram_id"), nullable=True, index=True)
     deleted: Mapped[bool] = mapped_column(default=False)
     tags: Mapped[List["RestaurantTag"]] = relationship(back_populates="restaurant")
     locations: Mapped[List["RestaurantLocation"]] = relationship(back_populates="restaurant")
@@ -270,85 +372,94 @@ class Restaurant(Base):
         return f"<Restaurant '{self.name}'>"
 
     def __str__(self):
-        with Session(engine) as session:
-            session.add(self)
-            _str = f"Заклад '{self.name}\n" \
-                   f"{', '.join(str(x) for x in self.tags) if self.tags else ''}\n'" \
-                   f"{self.description}\n"
-        return _str
+        return f"Заклад '{self.name}\n" \
+               f"{', '.join(str(x) for x in self.tags) if self.tags else ''}\n'" \
+               f"{self.description}\n"
 
     @classmethod
-    def create(cls, name: str, description: str, owner_id: int) -> "Restaurant":
-        with Session(engine) as session:
-            owner = User.get(owner_id)
+    async def create(cls, name: str, description: str, owner_id: int) -> "Restaurant":
+        async with async_session() as session:
+            owner = await User.get(owner_id)
             session.add(owner)
-            if owner.restaurant:
+            if await owner.awaitable_attrs.restaurant:
                 raise IntegrityError
             elif owner.role != "restaurant_owner":
                 raise IntegrityError
-            elif session.execute(select(cls).where(cls.name == name)).all():
+            elif (await session.execute(select(cls).where(cls.name == name))).all():
                 raise IntegrityError
             else:
                 restaurant = cls(name=name,
                                  description=description,
-                                 owner=owner)
+                                 owner_id=owner.telegram_id,
+                                 tags=[])
                 session.add(restaurant)
-                session.commit()
+                await session.commit()
+                catalog.invalidate_restaurants()
+                publish("catalog", "invalidate_restaurants")
             return restaurant
 
     @classmethod
-    def find(cls, owner_id: int) -> "Restaurant":
-        with Session(engine) as session:
-            return session.scalars(select(cls).where(cls.owner_id == owner_id)).first()
+    async def find(cls, owner_id: int) -> "Restaurant":
+        async with read_session() as session:
+            return (await session.scalars(select(cls).where(cls.owner_id == owner_id)
+                                          .options(selectinload(cls.tags)))).first()
 
-    def list_categories(self):
-        with Session(engine) as session:
+    async def list_categories(self):
+        async with read_session() as session:
             session.add(self)
-            return [*self.menu_categories]
+            return [*await self.awaitable_attrs.menu_categories]
 
-    def list_locations(self):
-        with Session(engine) as session:
+    async def list_locations(self):
+        async with read_session() as session:
             session.add(self)
-            return [*self.locations]
+            return [*await self.awaitable_attrs.locations]
 
-    def create_category(self, category_name):
-        with Session(engine) as session:
-            session.add(self)
-            session.add(MenuCategory(name=category_name, restaurant=self))
-            session.commit()
+    async def create_category(self, category_name):
+        async with async_session() as session:
+            session.add(MenuCategory(name=category_name, restaurant_id=self.id))
+            await session.commit()
+        catalog.invalidate_categories(self.id)
+        publish("catalog", "invalidate_categories", self.id)
 
-    def delete(self):
-        with Session(engine) as session:
+    async def delete(self):
+        async with async_session() as session:
             session.add(self)
             self.deleted = True
             self.owner_id = None
-            session.commit()
-
-    def add_location(self, location_description, latitude, longitude):
-        with Session(engine) as session:
-            session.add(self)
-            session.add(RestaurantLocation(location_description=location_description,
-                                           latitude=latitude,
-                                           longitude=longitude,
-                                           restaurant=self))
-            session.commit()
+            await session.commit()
+        catalog.invalidate_restaurant(self.id)
+        publish("catalog", "invalidate_restaurant", self.id)
+        restaurant_locations.remove_restaurant(self.id)
+        publish("restaurant_locations", "remove_restaurant", self.id)
+
+    async def add_location(self, location_description, latitude, longitude):
+        async with async_session() as session:
+            location = RestaurantLocation(location_description=location_description,
+                                          latitude=latitude,
+                                          longitude=longitude,
+                                          restaurant_id=self.id)
+            session.add(location)
+            await session.commit()
+        restaurant_locations.add(location.id, self.id, latitude, longitude)
+        publish("restaurant_locations", "add", location.id, self.id, latitude, longitude)
 
     @classmethod
-    def list_all(cls):
-        with Session(engine) as session:
-            return session.scalars(select(cls)).all()
+    async def list_all(cls):
+        async with read_session() as session:
+            return (await session.scalars(select(cls).options(selectinload(cls.tags)))).all()
 
     @classmethod
-    def get(cls, restaurant_id):
-        with Session(engine) as session:
-            return session.scalars(select(cls).where(cls.id == restaurant_id)).first()
+    async def get(cls, restaurant_id):
+        async with read_session() as session:
+            return (await session.scalars(select(cls).where(cls.id == restaurant_id)
+                                          .options(selectinload(cls.tags)))).first()
 
 
 class RestaurantTag(Base):
     __tablename__ = "restaurant_tags"
     id: Mapped[int] = mapped_column(primary_key=True)
     tag: Mapped[str] = mapped_column(nullable=False)
-    restaurant_id: Mapped[int] = mapped_column(ForeignKey("restaurants.id"))
+    restaurant_id: Mapped[int] = mapped_column(ForeignKey("restaurants.id"), index=True)
     restaurant: Mapped["Restaurant"] = relationship(back_populates="tags")
 
     def __repr__(self):
@@ -358,7 +469,7 @@ class RestaurantTag(Base):
 class RestaurantLocation(Base):
     __tablename__ = "restaurant_locations"
     id: Mapped[int] = mapped_column(primary_key=True)
-    restaurant_id: Mapped[int] = mapped_column(ForeignKey("restaurants.id"))
+    restaurant_id: Mapped[int] = mapped_column(ForeignKey("restaurants.id"), index=True)
     location_description: Mapped[str] = mapped_column(nullable=False)
     longitude: Mapped[float] = mapped_column(nullable=False)
     latitude: Mapped[float] = mapped_column(nullable=False)
@@ -368,17 +479,21 @@ class RestaurantLocation(Base):
     def __repr__(self):
         return f"<Restaurant '{self.restaurant.__repr__()}' at {self.location_description}>"
 
+    @classmethod
+    async def list_active(cls):
+        async with read_session() as session:
+            return (await session.scalars(select(cls).join(cls.restaurant)
+                                          .where(Restaurant.deleted.is_not(True)))).all()
+
     def __str__(self):
-        with Session(engine) as session:
-            session.add(self)
-            return f"Заклад {self.restaurant.name}\n{self.location_description}"
+        return f"Заклад {self.restaurant.name}\n{self.location_description}"
 
 
 class MenuCategory(Base):
     __tablename__ = "menu_categories"
     id: Mapped[int] = mapped_column(primary_key=True)
     name: Mapped[str] = mapped_column(nullable=False)
-    restaurant_id: Mapped[int] = mapped_column(ForeignKey("restaurants.id"), nullable=False)
+    restaurant_id: Mapped[int] = mapped_column(ForeignKey("restaurants.id"), nullable=False, index=True)
     restaurant: Mapped["Restaurant"] = relationship(back_populates="menu_categories")
     items: Mapped[List["MenuItem"]] = relationship(back_populates="category")
 
@@ -389,40 +504,46 @@ class MenuCategory(Base):
         return self.name
 
     @classmethod
-    def get(cls, category_id):
-        with Session(engine) as session:
-            return session.scalars(select(cls).where(cls.id == category_id)).first()
+    async def get(cls, category_id):
+        async with read_session() as session:
+            return (await session.scalars(select(cls).where(cls.id == category_id))).first()
 
-    def change_name(self, name):
-        with Session(engine) as session:
+    async def change_name(self, name):
+        async with async_session() as session:
             session.add(self)
             self.name = name
-            session.commit()
+            await session.commit()
+        catalog.invalidate_categories(self.restaurant_id)
+        publish("catalog", "invalidate_categories", self.restaurant_id)
 
     @classmethod
-    def list_items(cls, category_id):
-        with Session(engine) as session:
-            category = session.scalars(select(cls).where(cls.id == category_id)).first()
-            return category.items
+    async def list_items(cls, category_id):
+        async with read_session() as session:
+            category = (await session.scalars(select(cls).where(cls.id == category_id))).first()
+            return await category.awaitable_attrs.items
 
-    def delete(self):
-        with Session(engine) as session:
-            session.delete(self)
-            session.commit()
+    async def delete(self):
+        async with async_session() as session:
+            await session.delete(self)
+            await session.commit()
+        catalog.invalidate_categories(self.restaurant_id)
+        publish("catalog", "invalidate_categories", self.restaurant_id)
+        catalog.invalidate_items(self.id)
+        publish("catalog", "invalidate_items", self.id)
 
 
 class MenuItemTagToMenuItem(Base):
     __tablename__ = "menu_item_tag_to_menu_items"
     id: Mapped[int] = mapped_column(primary_key=True)
-    item_id: Mapped[int] = mapped_column(ForeignKey('menu_items.id'))
-    tag_id: Mapped[int] = mapped_column(ForeignKey('menu_item_tags.id'))
+    item_id: Mapped[int] = mapped_column(ForeignKey('menu_items.id'), index=True)
+    tag_id: Mapped[int] = mapped_column(ForeignKey('menu_item_tags.id'), index=True)
 
 
 class MenuItem(Base):
     __tablename__ = "menu_items"
     id: Mapped[int] = mapped_column(primary_key=True)
     name: Mapped[str] = mapped_column(nullable=False)
-    category_id: Mapped[int] = mapped_column(ForeignKey("menu_categories.id"))
+    category_id: Mapped[int] = mapped_column(ForeignKey("menu_categories.id"), index=True)
     description: Mapped[str] = mapped_column(nullable=True)
     price: Mapped[float] = mapped_column(nullable=False)
     category: Mapped[MenuCategory] = relationship(back_populates="items")
@@ -430,57 +551,59 @@ class MenuItem(Base):
     orders: Mapped[List["OrderItem"]] = relationship(back_populates="menu_item")
 
     def __repr__(self):
-        with Session(engine) as session:
-            session.add(self)
-            return f"<Item '{self.name}' from '{self.category.restaurant.__repr__()}'>"
+        return f"<Item '{self.name}' from '{self.category.restaurant.__repr__()}'>"
 
     def __str__(self):
-        with Session(engine) as session:
-            session.add(self)
-            return f"{self.name}\n{self.description}\n\n{self.price}₴"
+        return f"{self.name}\n{self.description}\n\n{self.price}₴"
 
     @classmethod
-    def create(cls, name, category_id, description, price):
-        with Session(engine) as session:
+    async def create(cls, name, category_id, description, price):
+        async with async_session() as session:
             menu_item = cls(name=name,
                             category_id=category_id,
                             description=description,
                             price=price)
             session.add(menu_item)
-            session.commit()
+            await session.commit()
+        catalog.invalidate_items(category_id)
+        publish("catalog", "invalidate_items", category_id)
         return menu_item
 
     @classmethod
-    def delete(cls, menu_item_id: int):
-        with Session(engine) as session:
-            menu_item = session.scalars(select(cls).where(cls.id == menu_item_id)).first()
-            session.delete(menu_item)
-            session.commit()
+    async def delete(cls, menu_item_id: int):
+        async with async_session() as session:
+            menu_item = (await session.scalars(select(cls).where(cls.id == menu_item_id))).first()
+            await session.delete(menu_item)
+            await session.commit()
+        catalog.invalidate_items(menu_item.category_id)
+        publish("catalog", "invalidate_items", menu_item.category_id)
 
     @classmethod
-    def edit(cls, menu_item_id: int, name: str = None, desctiption: str = None, price: str = None):
-        with Session(engine) as session:
-            menu_item = session.scalars(select(cls).where(cls.id == menu_item_id)).first()
+    async def edit(cls, menu_item_id: int, name: str = None, desctiption: str = None, price: str = None):
+        async with async_session() as session:
+            menu_item = (await session.scalars(select(cls).where(cls.id == menu_item_id))).first()
             if name:
                 menu_item.name = name
             if desctiption:
                 menu_item.description = desctiption
             if price:
                 menu_item.price = price
-            session.commit()
-            return menu_item
+            await session.commit()
+        catalog.invalidate_items(menu_item.category_id)
+        publish("catalog", "invalidate_items", menu_item.category_id)
+        return menu_item
 
     @classmethod
-    def find(cls, item_id: int):
-        with Session(engine) as session:
-            return session.scalars(select(cls).where(cls.id == item_id)).first()
+    async def find(cls, item_id: int):
+        async with read_session() as session:
+            return (await session.scalars(select(cls).where(cls.id == item_id))).first()
 
 
 class MenuItemTag(Base):
     __tablename__ = "menu_item_tags"
     id: Mapped[int] = mapped_column(primary_key=True)
     name: Mapped[str] = mapped_column(nullable=False)
-    restaurant_id: Mapped[int] = mapped_column(ForeignKey("restaurants.id"))
+    restaurant_id: Mapped[int] = mapped_column(ForeignKey("restaurants.id"), index=True)
     items: Mapped[List["MenuItem"]] = relationship(back_populates="tags", secondary="menu_item_tag_to_menu_items")
     restaurant: Mapped["Restaurant"] = relationship(back_populates="item_tags")
 
@@ -491,10 +614,10 @@ class MenuItemTag(Base):
 class OrderHeader(Base):
     __tablename__ = "order_headers"
     id: Mapped[int] = mapped_column(primary_key=True)
-    client_id: Mapped[int] = mapped_column(ForeignKey("users.telegram_id"))
+    client_id: Mapped[int] = mapped_column(ForeignKey("users.telegram_id"), index=True)
     restaurant_location_id: Mapped[int] = mapped_column(ForeignKey("restaurant_locations.id"))
     client_location_id: Mapped[int] = mapped_column(ForeignKey("client_saved_locations.id"))
-    delivery_guy_id: Mapped[int] = mapped_column(ForeignKey("users.telegram_id"), nullable=True)
+    delivery_guy_id: Mapped[int] = mapped_column(ForeignKey("users.telegram_id"), nullable=True, index=True)
     comment: Mapped[str] = mapped_column(nullable=True)
     paid: Mapped[bool] = mapped_column(default=False)
     client: Mapped["User"] = relationship(back_populates="orders", foreign_keys=[client_id])
@@ -506,51 +629,158 @@ class OrderHeader(Base):
 
 
     def __str__(self):
-        with Session(engine) as session:
-            session.add(self)
-            item_list = '\n'.join(['\t='.join(['\tx'.join([item.menu_item.name, str(item.quantity)]), str(item.menu_item.price * item.quantity)]) for item in self.items])
-            str_ = f"Замовлення {self.client.full_name} (@{self.client.username} №{self.id})\n" \
-                   f"заклад: {self.restaurant_location.restaurant.name} ({self.restaurant_location.location_description})\n" \
-                   f"Доставка до: {self.client_location.location_name}\n\n" \
-                   f"{item_list}"
-        return str_
+        # expects the header loaded with summary_options()
+        item_list = '\n'.join(['\t='.join(['\tx'.join([item.menu_item.name, str(item.quantity)]), str(item.menu_item.price * item.quantity)]) for item in self.items])
+        return f"Замовлення {self.client.full_name} (@{self.client.username} №{self.id})\n" \
+               f"заклад: {self.restaurant_location.restaurant.name} ({self.restaurant_location.location_description})\n" \
+               f"Доставка до: {self.client_location.location_name}\n\n" \
+               f"{item_list}"
+
+    @classmethod
+    def summary_options(cls):
+        # everything the receipt needs, joined into a single SELECT
+        return (joinedload(cls.client),
+                joinedload(cls.client_location),
+                joinedload(cls.restaurant_location).joinedload(RestaurantLocation.restaurant),
+                joinedload(cls.items).joinedload(OrderItem.menu_item))
 
     @classmethod
-    def create(cls, client_id, restaurant_location_id, client_location_id):
-        with Session(engine) as session:
+    async def get_summary(cls, order_id: int) -> "OrderHeader":
+        async with read_session() as session:
+            return (await session.scalars(select(cls).where(cls.id == order_id)
+                                          .options(*cls.summary_options()))).unique().first()
+
+    async def describe(self):
+        return str(await OrderHeader.get_summary(self.id))
+
+    @classmethod
+    async def create(cls, client_id, restaurant_location_id, client_location_id):
+        async with async_session() as session:
             order_header = cls(client_id=client_id,
                                restaurant_location_id=restaurant_location_id,
                                client_location_id=client_location_id)
             session.add(order_header)
-            session.commit()
+            await session.commit()
         return order_header
 
-    def list_items(self):
-        with Session(engine) as session:
+    @classmethod
+    async def place(cls, client_id: int, client_location_id: int, restaurant_location_id: int,
+                    items: dict) -> "OrderHeader":
+        """Writes a whole cart (menu item id -> quantity) as a published order in one transaction."""
+        async with async_session() as session:
+            order_header = cls(client_id=client_id,
+                               restaurant_location_id=restaurant_location_id,
+                               client_location_id=client_location_id)
+            session.add(order_header)
+            await session.flush()
+            session.add_all([OrderItem(order_header_id=order_header.id, menu_item_id=menu_item_id, quantity=quantity)
+                             for menu_item_id, quantity in items.items()])
+            session.add(OrderStatusUpdate(order_header_id=order_header.id,
+                                          status="CREATED",
+                                          status_ts=datetime.now()))
+            await session.commit()
+        order_header = await cls.get_summary(order_header.id)
+        # every worker process queues the order until one of them gives it to a courier
+        order = PendingOrder.of(order_header)
+        dispatcher.enqueue(order)
+        publish("dispatcher", "enqueue", order)
+        return order_header
+
+    async def list_items(self):
+        async with read_session() as session:
             session.add(self)
-            return self.items
+            return await self.awaitable_attrs.items
 
-    def has_item(self, item: "MenuItem"):
-        with Session(engine) as session:
+    async def has_item(self, item: "MenuItem"):
+        async with read_session() as session:
             session.add(self)
-            session.add(item)
-            for order_item in self.items:
-                if order_item.menu_item == item:
+            for order_item in await self.awaitable_attrs.items:
+                if order_item.menu_item_id == item.id:
                     return order_item
 
-    def publish(self):
-        with Session(engine) as session:
-            session.add(self)
-            order_status = OrderStatusUpdate(header=self,
+    async def publish(self):
+        async with async_session() as session:
+            order_status = OrderStatusUpdate(order_header_id=self.id,
                                              status="CREATED",
                                              status_ts=datetime.now())
             session.add(order_status)
-            session.commit()
+            await session.commit()
         return order_status
 
-    def update(self):
-        with Session(engine) as session:
-            return session.scalars(select(OrderHeader).where(OrderHeader.id == self.id)).first()
+    async def update(self):
+        return await OrderHeader.get_summary(self.id)
+
+    @classmethod
+    def _delivered(cls):
+        return select(OrderStatusUpdate.id).where(OrderStatusUpdate.order_header_id == cls.id,
+                                                  OrderStatusUpdate.status == "DELIVERED").exists()
+
+    @classmethod
+    async def courier_loads(cls, delivery_guy_id: int = None) -> dict:
+        """Number of undelivered orders of every courier that has any, or only of the given one."""
+        query = select(cls.delivery_guy_id, func.count(cls.id)).where(~cls._delivered())
+        if delivery_guy_id is None:
+            query = query.where(cls.delivery_guy_id.is_not(None))
+        else:
+            query = query.where(cls.delivery_guy_id == delivery_guy_id)
+        async with read_session() as session:
+            rows = await session.execute(query.group_by(cls.delivery_guy_id))
+            return dict(rows.all())
+
+    @classmethod
+    async def list_unassigned(cls):
+        """Published orders nobody delivers yet, oldest first."""
+        async with read_session() as session:
+            published = select(OrderStatusUpdate.id).where(OrderStatusUpdate.order_header_id == cls.id).exists()
+            return (await session.scalars(select(cls)
+                                          .where(cls.delivery_guy_id.is_(None), published, ~cls._delivered())
+                                          .options(joinedload(cls.restaurant_location),
+                                                   joinedload(cls.client_location))
+                                          .order_by(cls.id))).all()
+
+    @classmethod
+    async def assign(cls, order: PendingOrder, delivery_guy_id: int) -> bool:
+        """False if the order already has a courier (another worker process assigned it first)."""
+        async with async_session() as session:
+            result = await session.execute(update(cls)
+                                           .where(cls.id == order.id, cls.delivery_guy_id.is_(None))
+                                           .values(delivery_guy_id=delivery_guy_id))
+            await session.commit()
+        if not result.rowcount:
+            return False
+        dispatcher.book(order.id, delivery_guy_id, order.destination)
+        publish("dispatcher", "book", order.id, delivery_guy_id, order.destination)
+        return True
+
+    @classmethod
+    async def unassign(cls, order: PendingOrder, delivery_guy_id: int) -> bool:
+        """Takes an undelivered order back from the courier, it waits for the next free one at the head of the queue."""
+        async with async_session() as session:
+            result = await session.execute(update(cls)
+                                           .where(cls.id == order.id, cls.delivery_guy_id == delivery_guy_id,
+                                                  ~cls._delivered())
+                                           .values(delivery_guy_id=None))
+            await session.commit()
+        if not result.rowcount:
+            return False
+        dispatcher.release(delivery_guy_id)
+        publish("dispatcher", "release", delivery_guy_id)
+        dispatcher.requeue(order)
+        publish("dispatcher", "requeue", order)
+        return True
+
+    @classmethod
+    async def deliver(cls, order_id: int):
+        async with async_session() as session:
+            if await session.scalar(select(cls._delivered()).where(cls.id == order_id)):
+                return
+            session.add(OrderStatusUpdate(order_header_id=order_id,
+                                          status="DELIVERED",
+                                          status_ts=datetime.now()))
+            delivery_guy_id = await session.scalar(select(cls.delivery_guy_id).where(cls.id == order_id))
+            await session.commit()
+        dispatcher.release(delivery_guy_id)
+        publish("dispatcher", "release", delivery_guy_id)
 
 
 class OrderItem(Base):
@@ -561,29 +791,12 @@ class OrderItem(Base):
     quantity: Mapped[int] = mapped_column(nullable=False, default=1)
     header: Mapped["OrderHeader"] = relationship(back_populates="items")
     menu_item: Mapped["MenuItem"] = relationship(back_populates="orders")
+    __table_args__ = (Index("uq_order_items_order_header_id_menu_item_id", "order_header_id", "menu_item_id",
+                            unique=True),)
 
-    @classmethod
-    def create(cls, header, menu_item):
-        with Session(engine) as session:
-            session.add(header)
-            session.add(menu_item)
-            order_item = cls(header=header, menu_item=menu_item)
-            session.add(order_item)
-            session.commit()
-        return order_item
-
-    def change_quantity(self, amount_to_change: int):
-        with Session(engine) as session:
-            session.add(self)
-            self.quantity += amount_to_change
-            session.commit()
-            if self.quantity <= 0:
-                self.delete(session)
-        return self.quantity
-
-    def delete(self, session):
-        session.delete(self)
-        session.commit()
+    async def delete(self, session):
+        await session.delete(self)
+        await session.commit()
 
 
 class OrderStatusUpdate(Base):
@@ -594,3 +807,4 @@ class OrderStatusUpdate(Base):
                                                         "'PICKED BY DELIVERY GUY', 'DELIVERED')"))
     status_ts: Mapped[datetime] = mapped_column(nullable=False)
     header: Mapped["OrderHeader"] = relationship(back_populates="statuses")
+    __table_args__ = (Index("ix_order_status_updates_order_header_id_status", "order_header_id", "status"),)
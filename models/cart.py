@@ -0,0 +1,66 @@
+from dataclasses import dataclass, field
+from typing import Dict, Optional
+
+from models.catalog import catalog
+from models.geo import restaurant_locations
+
+
+class NoBranchError(LookupError):
+    """The restaurant of the cart closed its last branch while the client was choosing."""
+
+
+@dataclass(slots=True)
+class Cart:
+    """Order being built by a client. Lives in chat_data (so it survives restarts with the persistence) and
+    is written to the order tables only once, by checkout()."""
+    client_location_id: int
+    restaurant_id: int
+    latitude: float
+    longitude: float
+    items: Dict[int, int] = field(default_factory=dict)  # menu item id -> quantity
+
+    def add(self, item_id: int, amount: int = 1) -> int:
+        quantity = self.items.get(item_id, 0) + amount
+        if quantity > 0:
+            self.items[item_id] = quantity
+        else:
+            self.items.pop(item_id, None)
+        return max(quantity, 0)
+
+    def remove(self, item_id: int, amount: int = 1) -> int:
+        return self.add(item_id, -amount)
+
+    def quantity(self, item_id: int) -> int:
+        return self.items.get(item_id, 0)
+
+    async def describe(self) -> str:
+        menu = await catalog.menu(self.restaurant_id)
+        # same layout as the receipt of OrderHeader
+        lines = ['\t='.join(['\tx'.join([menu[item_id].name, str(quantity)]), str(menu[item_id].price * quantity)])
+                 for item_id, quantity in self.items.items() if item_id in menu]
+        total = sum(menu[item_id].price * quantity for item_id, quantity in self.items.items() if item_id in menu)
+        return "\n".join(lines + [f"Разом: {total}₴"]) if lines else "Кошик порожній"
+
+    async def branch(self) -> Optional[int]:
+        """Id of the restaurant location closest to the delivery address."""
+        await restaurant_locations.ensure_loaded()
+        nearest = restaurant_locations.nearest(self.latitude, self.longitude, restaurant_id=self.restaurant_id)
+        return nearest[0][0] if nearest else None
+
+    async def checkout(self, client_id: int):
+        """Places the order, or returns None if nothing in the cart is on the menu anymore. Raises NoBranchError
+        if the restaurant has no branch left to deliver from; nothing is written then."""
+        from models.base import OrderHeader
+        # items removed from the menu meanwhile are dropped
+        menu = await catalog.menu(self.restaurant_id)
+        for item_id in [item_id for item_id in self.items if item_id not in menu]:
+            del self.items[item_id]
+        if not self.items:
+            return None
+        branch = await self.branch()
+        if branch is None:
+            raise NoBranchError(self.restaurant_id)
+        return await OrderHeader.place(client_id=client_id,
+                                       client_location_id=self.client_location_id,
+                                       restaurant_location_id=branch,
+                                       items=dict(self.items))
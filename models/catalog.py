@@ -0,0 +1,146 @@
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, List, Tuple
+
+
+@dataclass(frozen=True, slots=True)
+class CatalogRestaurant:
+    id: int
+    name: str
+    text: str
+
+
+@dataclass(frozen=True, slots=True)
+class CatalogCategory:
+    id: int
+    restaurant_id: int
+    name: str
+
+    def __str__(self):
+        return self.name
+
+
+@dataclass(frozen=True, slots=True)
+class CatalogItem:
+    id: int
+    category_id: int
+    name: str
+    price: float
+    text: str
+
+    def __str__(self):
+        return self.text
+
+
+class Catalog:
+    """Process-wide cache of what clients browse while ordering: restaurants -> categories -> items.
+    Entries are plain frozen objects with pre-rendered text, so they can be shared between chats.
+    Model methods that change the menu invalidate the affected entries (see models.base)."""
+
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._restaurants: Tuple[CatalogRestaurant, ...] | None = None
+        self._entries: OrderedDict = OrderedDict()
+        self._generation = 0
+
+    @property
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self._entries),
+                "max_entries": self.max_entries}
+
+    def _get(self, key):
+        if key in self._entries:
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return self._entries[key]
+        self.misses += 1
+        return None
+
+    def _put(self, key, value, generation):
+        # a menu change while the rows were loading makes them stale
+        if generation != self._generation:
+            return
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def restaurants(self) -> Tuple[CatalogRestaurant, ...]:
+        if self._restaurants is not None:
+            self.hits += 1
+            return self._restaurants
+        self.misses += 1
+        from models.base import Restaurant
+        generation = self._generation
+        restaurants = tuple(CatalogRestaurant(id=x.id, name=x.name, text=str(x)) for x in await Restaurant.list_all())
+        if generation == self._generation:
+            self._restaurants = restaurants
+        return restaurants
+
+    async def categories(self, restaurant_id: int) -> Tuple[CatalogCategory, ...]:
+        restaurant_id = int(restaurant_id)
+        categories = self._get(("categories", restaurant_id))
+        if categories is None:
+            from models.base import Restaurant
+            generation = self._generation
+            restaurant = await Restaurant.get(restaurant_id=restaurant_id)
+            categories = tuple(CatalogCategory(id=x.id, restaurant_id=restaurant_id, name=x.name)
+                               for x in await restaurant.list_categories())
+            self._put(("categories", restaurant_id), categories, generation)
+        return categories
+
+    async def items(self, category_id: int) -> Tuple[CatalogItem, ...]:
+        category_id = int(category_id)
+        items = self._get(("items", category_id))
+        if items is None:
+            from models.base import MenuCategory
+            generation = self._generation
+            items = tuple(CatalogItem(id=x.id, category_id=category_id, name=x.name, price=x.price, text=str(x))
+                          for x in await MenuCategory.list_items(category_id=category_id))
+            self._put(("items", category_id), items, generation)
+        return items
+
+    async def menu(self, restaurant_id: int) -> Dict[int, CatalogItem]:
+        """All items of the restaurant by id, assembled from the cached categories and items."""
+        return {item.id: item
+                for category in await self.categories(restaurant_id)
+                for item in await self.items(category.id)}
+
+    def invalidate_restaurants(self):
+        self._generation += 1
+        self._restaurants = None
+
+    def invalidate_restaurant(self, restaurant_id: int):
+        self._generation += 1
+        self._restaurants = None
+        self._entries.pop(("categories", int(restaurant_id)), None)
+
+    def invalidate_categories(self, restaurant_id: int):
+        self._generation += 1
+        self._entries.pop(("categories", int(restaurant_id)), None)
+
+    def invalidate_items(self, category_id: int):
+        self._generation += 1
+        self._entries.pop(("items", int(category_id)), None)
+
+    def clear(self):
+        self._generation += 1
+        self._restaurants = None
+        self._entries.clear()
+
+    async def warm_up(self):
+        restaurants = await self.restaurants()
+        categories: List[CatalogCategory] = []
+        for restaurant in restaurants:
+            if len(self._entries) >= self.max_entries:
+                return
+            categories.extend(await self.categories(restaurant.id))
+        for category in categories:
+            if len(self._entries) >= self.max_entries:
+                return
+            await self.items(category.id)
+
+
+catalog = Catalog()
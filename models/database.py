@@ -0,0 +1,125 @@
+"""
+The database of the models: engine and session factory, created on first use.
+
+Importing the models neither reads config.yml nor connects. The bot configures the database from its config in
+main.configure; tests and benchmarks inject their own beforehand, e.g. an in-memory SQLite database:
+
+    database.configure("sqlite+aiosqlite://")
+
+or a ready engine with database.configure(engine=...). Scripts that configure nothing get the database of
+config.yml in the working directory, as before.
+
+Model methods that only read use read_session(), the others session(). With the default profile both are
+sessions of the same engine. The "sqlite_wal" profile, for a SQLite file in production, is chosen in config.yml:
+
+    database: "sqlite+aiosqlite:///bot.db"
+    database_profile: "sqlite_wal"
+    database_readers: 4
+
+It switches the database to WAL, so readers never wait for the writer, sets the PRAGMAs of PROFILES on every
+connection and splits the connections: writes queue for one writer connection, as SQLite only ever lets one
+connection write, instead of failing on a locked database; reads use a pool of `database_readers` connections.
+Both pools keep their connections open, aiosqlite pays for a thread and a connection on every checkout otherwise.
+"""
+import functools
+from typing import Optional
+
+import yaml
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+PROFILES = {
+    "sqlite_wal": {"journal_mode": "WAL",
+                   # a commit is durable once the WAL is synced at a checkpoint; a power loss may lose the last
+                   # commits but never corrupts the database
+                   "synchronous": "NORMAL",
+                   "mmap_size": 256 * 1024 * 1024,
+                   # negative is KiB: 64 MiB of page cache per connection
+                   "cache_size": -64 * 1024,
+                   "temp_store": "MEMORY",
+                   # milliseconds a connection waits for a lock, e.g. a checkpoint, before it fails
+                   "busy_timeout": 5000},
+}
+
+
+def _set_pragmas(pragmas: dict, dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    for name, value in pragmas.items():
+        cursor.execute(f"PRAGMA {name}={value}")
+    cursor.close()
+
+
+class Database:
+    def __init__(self):
+        self._engine: Optional[AsyncEngine] = None
+        self._reader: Optional[AsyncEngine] = None
+        self._sessions: Optional[async_sessionmaker] = None
+        self._read_sessions: Optional[async_sessionmaker] = None
+
+    def configure(self, url: str = None, *, engine: AsyncEngine = None, profile: str = None, readers: int = 4,
+                  **options):
+        """`url` must use an async driver, e.g. "sqlite+aiosqlite:///sample.db"; options are passed as is to
+        create_async_engine (pool_size, max_overflow, pool_timeout, pool_recycle, ...)."""
+        if self._engine is not None:
+            raise RuntimeError("The database is already in use, configure it before the first query")
+        if profile:
+            pragmas = PROFILES[profile]
+            self._engine = create_async_engine(url, **{**options, "poolclass": AsyncAdaptedQueuePool,
+                                                       "pool_size": 1, "max_overflow": 0})
+            self._reader = create_async_engine(url, **{**options, "poolclass": AsyncAdaptedQueuePool,
+                                                       "pool_size": readers, "max_overflow": 0})
+            for pool_engine in (self._engine, self._reader):
+                event.listen(pool_engine.sync_engine, "connect", functools.partial(_set_pragmas, pragmas))
+        else:
+            self._engine = self._reader = engine or create_async_engine(url, **options)
+        self._sessions = async_sessionmaker(self._engine, expire_on_commit=False)
+        self._read_sessions = async_sessionmaker(self._reader, expire_on_commit=False)
+
+    def configure_from(self, config: dict):
+        self.configure(config["database"], profile=config.get("database_profile"),
+                       readers=config.get("database_readers", 4), **config.get("database_pool", {}))
+
+    @property
+    def configured(self) -> bool:
+        return self._engine is not None
+
+    def _configure_from_file(self):
+        with open("config.yml", "r") as file:
+            self.configure_from(yaml.safe_load(file))
+
+    @property
+    def engine(self) -> AsyncEngine:
+        """The engine that writes, migrations and everything else that isn't a model read go through it."""
+        if self._engine is None:
+            self._configure_from_file()
+        return self._engine
+
+    @property
+    def reader_engine(self) -> AsyncEngine:
+        """The engine of read_session(), the same as `engine` unless the sqlite_wal profile splits them."""
+        if self._reader is None:
+            self._configure_from_file()
+        return self._reader
+
+    def session(self) -> AsyncSession:
+        if self._sessions is None:
+            self._configure_from_file()
+        return self._sessions()
+
+    def read_session(self) -> AsyncSession:
+        """A session for reads only; with the sqlite_wal profile it runs on a reader connection, which doesn't
+        see what an unfinished write session has not committed yet."""
+        if self._read_sessions is None:
+            self._configure_from_file()
+        return self._read_sessions()
+
+    async def dispose(self):
+        """Closes the pooled connections; the engines open new ones if they are used again."""
+        if self._engine is not None:
+            await self._engine.dispose()
+        if self._reader is not None and self._reader is not self._engine:
+            await self._reader.dispose()
+
+
+database = Database()
@@ -0,0 +1,159 @@
+import asyncio
+from collections import deque
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Deque, Dict, List, Optional, Tuple
+
+from models.geo import haversine
+
+# a courier is this many kilometers "worse" for every order already assigned to them ...
+LOAD_PENALTY_KM = 2.0
+# ... and for every hour on shift, so long shifts get fewer new orders
+SHIFT_PENALTY_KM = 0.5
+# distance assumed for couriers whose position is unknown (nothing delivered yet this shift)
+UNKNOWN_DISTANCE_KM = 3.0
+
+
+@dataclass(slots=True)
+class Courier:
+    id: int
+    shift_started: datetime
+    load: int = 0
+    latitude: Optional[float] = None
+    longitude: Optional[float] = None
+
+
+@dataclass(slots=True)
+class PendingOrder:
+    id: int
+    pickup: Tuple[float, float]
+    destination: Tuple[float, float]
+
+    @classmethod
+    def of(cls, header) -> "PendingOrder":
+        """From an OrderHeader loaded with its restaurant and client locations."""
+        return cls(id=header.id,
+                   pickup=(header.restaurant_location.latitude, header.restaurant_location.longitude),
+                   destination=(header.client_location.latitude, header.client_location.longitude))
+
+
+class Dispatcher:
+    """Process-wide pool of couriers on shift that assigns published orders.
+
+    Couriers are kept in memory, so choosing one is a pass over the active couriers, not a query. The model
+    keeps the pool in sync (see DeliveryGuyStatus.check_in and OrderHeader.place, assign, unassign and deliver)
+    and publishes every change, so the pools of other worker processes apply the same change instead of reading
+    everything again. Orders published while nobody can take them wait in a queue and are handed out as couriers
+    start their shifts or finish deliveries.
+    """
+
+    def __init__(self, max_load: int = 3):
+        self.max_load = max_load
+        self.loaded = False
+        self.couriers: Dict[int, Courier] = {}
+        self.pending: Deque[PendingOrder] = deque()
+        self._assigning = asyncio.Lock()
+
+    def check_in(self, courier_id: int, shift_started: datetime, load: int = 0):
+        self.couriers[courier_id] = Courier(id=courier_id, shift_started=shift_started, load=load)
+
+    def check_out(self, courier_id: int):
+        self.couriers.pop(courier_id, None)
+
+    @staticmethod
+    def penalty(courier: Courier, now: datetime) -> float:
+        hours = (now - courier.shift_started).total_seconds() / 3600
+        return LOAD_PENALTY_KM * courier.load + SHIFT_PENALTY_KM * hours
+
+    def score(self, courier: Courier, latitude: float, longitude: float, now: datetime) -> float:
+        """Lower is better."""
+        if courier.latitude is None:
+            distance = UNKNOWN_DISTANCE_KM
+        else:
+            distance = haversine(courier.latitude, courier.longitude, latitude, longitude)
+        return distance + self.penalty(courier, now)
+
+    def choose(self, latitude: float, longitude: float, now: datetime = None) -> Optional[Courier]:
+        now = now or datetime.now()
+        best, best_score = None, None
+        for courier in self.couriers.values():
+            if courier.load >= self.max_load:
+                continue
+            # distance only adds to the score, no need to compute it for couriers that already lose
+            penalty = self.penalty(courier, now)
+            if best is not None and penalty >= best_score:
+                continue
+            score = penalty + (UNKNOWN_DISTANCE_KM if courier.latitude is None
+                               else haversine(courier.latitude, courier.longitude, latitude, longitude))
+            if best is None or score < best_score:
+                best, best_score = courier, score
+        return best
+
+    def enqueue(self, order: PendingOrder):
+        self.pending.append(order)
+
+    def requeue(self, order: PendingOrder):
+        # an order taken back from a courier has waited longer than the queued ones
+        self.pending.appendleft(order)
+
+    def discard(self, order_id: int):
+        for order in self.pending:
+            if order.id == order_id:
+                self.pending.remove(order)
+                return
+
+    def book(self, order_id: int, courier_id: int, destination: Tuple[float, float]):
+        """Counts an order the database gave to the courier."""
+        self.discard(order_id)
+        courier = self.couriers.get(courier_id)
+        if courier is None:
+            return
+        courier.load += 1
+        # after this delivery the courier ends up at the client
+        courier.latitude, courier.longitude = destination
+
+    def release(self, courier_id: int):
+        courier = self.couriers.get(courier_id)
+        if courier and courier.load:
+            courier.load -= 1
+
+    async def assign_pending(self, now: datetime = None) -> List[Tuple[PendingOrder, int]]:
+        """Hands queued orders, oldest first, to the couriers that are free now: [(order, courier id)].
+
+        A courier is only chosen here, OrderHeader.assign books them once the database has the assignment. An
+        order another worker process assigned first is dropped from the queue. Assignments of one process run one
+        at a time, so two orders can't both take the last free place of a courier.
+        """
+        from models.base import OrderHeader
+        assigned = []
+        async with self._assigning:
+            for order in list(self.pending):
+                courier = self.choose(*order.pickup, now=now)
+                if courier is None:
+                    # nobody has a free place, whatever the pickup
+                    break
+                if await OrderHeader.assign(order, courier.id):
+                    assigned.append((order, courier.id))
+                else:
+                    self.discard(order.id)
+        return assigned
+
+    async def load(self):
+        from models.base import DeliveryGuyStatus, OrderHeader
+        self.couriers.clear()
+        self.pending.clear()
+        for status in await DeliveryGuyStatus.list_active():
+            self.check_in(status.delivery_guy_id, status.timestamp)
+        for courier_id, load in (await OrderHeader.courier_loads()).items():
+            if courier_id in self.couriers:
+                self.couriers[courier_id].load = load
+        for order in await OrderHeader.list_unassigned():
+            self.pending.append(PendingOrder.of(order))
+        self.loaded = True
+
+    async def ensure_loaded(self):
+        if not self.loaded:
+            await self.load()
+
+
+dispatcher = Dispatcher()
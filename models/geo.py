@@ -0,0 +1,164 @@
+import math
+from array import array
+from collections import defaultdict
+from typing import Dict, List, Optional, Set, Tuple
+
+EARTH_RADIUS_KM = 6371.0088
+# grid cell side in degrees, ~2.2 km north-south: a few branches per cell in a dense city center
+CELL_DEGREES = 0.02
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
+
+def haversine(latitude: float, longitude: float, other_latitude: float, other_longitude: float) -> float:
+    """Great-circle distance in kilometers."""
+    phi, other_phi = math.radians(latitude), math.radians(other_latitude)
+    a = math.sin((other_phi - phi) / 2) ** 2 + \
+        math.cos(phi) * math.cos(other_phi) * math.sin(math.radians(other_longitude - longitude) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(min(1.0, a)))
+
+
+class LocationIndex:
+    """Process-wide grid index over restaurant locations (branches).
+
+    Coordinates are kept in parallel arrays with radians and cos(latitude) precomputed, so distances to many
+    branches are computed in one pass without touching the database. Branches are bucketed into square grid
+    cells and the nearest ones are found by scanning rings of cells around the point. Model methods that add
+    or remove branches update the index (see models.base)."""
+
+    def __init__(self, cell_degrees: float = CELL_DEGREES):
+        self.cell_degrees = cell_degrees
+        self.loaded = False
+        self._ids = array("q")
+        self._restaurant_ids = array("q")
+        self._phi = array("d")
+        self._lambda = array("d")
+        self._cos_phi = array("d")
+        self._slots: Dict[int, int] = {}  # location id -> position in the arrays
+        self._free: List[int] = []
+        self._cell_of: Dict[int, Tuple[int, int]] = {}  # slot -> grid cell
+        self._cells: Dict[Tuple[int, int], Set[int]] = defaultdict(set)
+        self._by_restaurant: Dict[int, Set[int]] = defaultdict(set)
+        self._bounds: Optional[Tuple[int, int, int, int]] = None  # min/max cell row and column
+
+    def __len__(self):
+        return len(self._slots)
+
+    def _cell(self, latitude: float, longitude: float) -> Tuple[int, int]:
+        return math.floor(latitude / self.cell_degrees), math.floor(longitude / self.cell_degrees)
+
+    def add(self, location_id: int, restaurant_id: int, latitude: float, longitude: float):
+        self.remove(location_id)
+        phi = math.radians(latitude)
+        row = (location_id, restaurant_id, phi, math.radians(longitude), math.cos(phi))
+        if self._free:
+            slot = self._free.pop()
+            for column, value in zip(self._columns, row):
+                column[slot] = value
+        else:
+            slot = len(self._ids)
+            for column, value in zip(self._columns, row):
+                column.append(value)
+        self._slots[location_id] = slot
+        self._cell_of[slot] = self._cell(latitude, longitude)
+        self._cells[self._cell_of[slot]].add(slot)
+        self._by_restaurant[restaurant_id].add(slot)
+        self._bounds = None
+
+    def remove(self, location_id: int):
+        slot = self._slots.pop(location_id, None)
+        if slot is None:
+            return
+        cell = self._cell_of.pop(slot)
+        self._cells[cell].discard(slot)
+        if not self._cells[cell]:
+            del self._cells[cell]
+        restaurant_id = self._restaurant_ids[slot]
+        self._by_restaurant[restaurant_id].discard(slot)
+        if not self._by_restaurant[restaurant_id]:
+            del self._by_restaurant[restaurant_id]
+        self._free.append(slot)
+        self._bounds = None
+
+    def remove_restaurant(self, restaurant_id: int):
+        for slot in list(self._by_restaurant.get(restaurant_id, ())):
+            self.remove(self._ids[slot])
+
+    def clear(self):
+        self.__init__(self.cell_degrees)
+
+    @property
+    def _columns(self):
+        return self._ids, self._restaurant_ids, self._phi, self._lambda, self._cos_phi
+
+    def _distances(self, latitude: float, longitude: float, slots) -> List[Tuple[float, int]]:
+        # haversine over the precomputed columns, sorted by distance: [(km, slot), ...]
+        phi, lam = math.radians(latitude), math.radians(longitude)
+        cos_phi = math.cos(phi)
+        sin, asin, sqrt = math.sin, math.asin, math.sqrt
+        all_phi, all_lambda, all_cos_phi = self._phi, self._lambda, self._cos_phi
+        return sorted((2 * EARTH_RADIUS_KM * asin(sqrt(min(1.0, sin((all_phi[slot] - phi) / 2) ** 2 +
+                                                           cos_phi * all_cos_phi[slot] *
+                                                           sin((all_lambda[slot] - lam) / 2) ** 2))), slot)
+                      for slot in slots)
+
+    def _ring(self, center: Tuple[int, int], radius: int):
+        row, column = center
+        if radius == 0:
+            yield center
+            return
+        for i in range(-radius, radius + 1):
+            yield row - radius, column + i
+            yield row + radius, column + i
+        for i in range(-radius + 1, radius):
+            yield row + i, column - radius
+            yield row + i, column + radius
+
+    def nearest(self, latitude: float, longitude: float, k: int = 1,
+                restaurant_id: Optional[int] = None) -> List[Tuple[int, float]]:
+        """Up to k closest branches as [(location id, km), ...], optionally only of one restaurant."""
+        if restaurant_id is not None:
+            # a restaurant has a few branches, checking all of them is cheaper than any index
+            found = self._distances(latitude, longitude, self._by_restaurant.get(restaurant_id, ()))
+            return [(self._ids[slot], distance) for distance, slot in found[:k]]
+        if not self._slots:
+            return []
+        if self._bounds is None:
+            rows = [cell[0] for cell in self._cells]
+            columns = [cell[1] for cell in self._cells]
+            self._bounds = min(rows), max(rows), min(columns), max(columns)
+        center = self._cell(latitude, longitude)
+        min_row, max_row, min_column, max_column = self._bounds
+        max_radius = max(abs(center[0] - min_row), abs(center[0] - max_row),
+                         abs(center[1] - min_column), abs(center[1] - max_column))
+        # the narrowest cell side among the rings scanned so far bounds the distance to unscanned cells
+        found: List[Tuple[float, int]] = []
+        for radius in range(max_radius + 1):
+            slots = [slot for cell in self._ring(center, radius) for slot in self._cells.get(cell, ())]
+            found = sorted(found + self._distances(latitude, longitude, slots))[:k]
+            edge_latitude = min(89.9, abs(latitude) + (radius + 1) * self.cell_degrees)
+            unscanned = radius * self.cell_degrees * KM_PER_DEGREE * math.cos(math.radians(edge_latitude))
+            if len(found) == k and found[-1][0] <= unscanned:
+                break
+        return [(self._ids[slot], distance) for distance, slot in found]
+
+    def restaurants_near(self, latitude: float, longitude: float) -> List[Tuple[int, float]]:
+        """Every restaurant with its closest branch distance, closest first: [(restaurant id, km), ...]."""
+        closest: Dict[int, float] = {}
+        restaurant_ids = self._restaurant_ids
+        for distance, slot in self._distances(latitude, longitude, self._slots.values()):
+            closest.setdefault(restaurant_ids[slot], distance)
+        return list(closest.items())
+
+    async def load(self):
+        from models.base import RestaurantLocation
+        self.clear()
+        for location in await RestaurantLocation.list_active():
+            self.add(location.id, location.restaurant_id, location.latitude, location.longitude)
+        self.loaded = True
+
+    async def ensure_loaded(self):
+        if not self.loaded:
+            await self.load()
+
+
+restaurant_locations = LocationIndex()
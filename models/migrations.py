@@ -0,0 +1,119 @@
+"""
+Versioned schema changes for databases created by earlier versions of the models.
+
+create_all only creates missing tables, so everything added to existing tables (indexes, constraints, backfills)
+goes here as a numbered migration. Applied versions are recorded in schema_migrations; all pending migrations run
+in one transaction, so a failed upgrade leaves the database as it was. Every migration must also be harmless on
+a fresh database, where create_all has already created the tables with their indexes.
+
+Usage:
+    python -m models.migrations
+"""
+import asyncio
+import logging
+from datetime import datetime
+from typing import Callable, List, Tuple
+
+from sqlalchemy import Column, Connection, DateTime, Integer, MetaData, String, Table, insert, select, text
+
+from models.base import Base
+from models.database import database
+
+logger = logging.getLogger(__name__)
+
+schema_migrations = Table("schema_migrations", MetaData(),
+                          Column("version", Integer, primary_key=True),
+                          Column("description", String, nullable=False),
+                          Column("applied_at", DateTime, nullable=False))
+
+MIGRATIONS: List[Tuple[int, str, Callable[[Connection], None]]] = []
+
+
+def migration(version: int, description: str):
+    def register(function: Callable[[Connection], None]):
+        MIGRATIONS.append((version, description, function))
+        return function
+    return register
+
+
+def create_indexes(connection: Connection, *names: str):
+    """Creates indexes declared on the models, by name, unless they exist already."""
+    indexes = {index.name: index for table in Base.metadata.tables.values() for index in table.indexes}
+    for name in names:
+        indexes[name].create(connection, checkfirst=True)
+
+
+@migration(1, "Merge duplicate order items")
+def merge_duplicate_order_items(connection: Connection):
+    # the unique index of the next migration can't be created while an item is listed twice in one order
+    connection.execute(text("UPDATE order_items SET quantity = "
+                            "(SELECT sum(duplicate.quantity) FROM order_items AS duplicate "
+                            "WHERE duplicate.order_header_id = order_items.order_header_id "
+                            "AND duplicate.menu_item_id = order_items.menu_item_id) "
+                            "WHERE id IN (SELECT min(id) FROM order_items "
+                            "GROUP BY order_header_id, menu_item_id HAVING count(*) > 1)"))
+    connection.execute(text("DELETE FROM order_items WHERE id NOT IN "
+                            "(SELECT min(id) FROM order_items GROUP BY order_header_id, menu_item_id)"))
+
+
+@migration(2, "Indexes on foreign keys and lookup columns")
+def add_indexes(connection: Connection):
+    create_indexes(connection,
+                   "ix_users_role",
+                   "ix_client_saved_locations_user_id",
+                   "ix_delivery_guy_statuses_delivery_guy_id_id",
+                   "ix_user_promotion_applications_user_id",
+                   "ix_restaurants_owner_id",
+                   "ix_restaurant_tags_restaurant_id",
+                   "ix_restaurant_locations_restaurant_id",
+                   "ix_menu_categories_restaurant_id",
+                   "ix_menu_item_tags_restaurant_id",
+                   "ix_menu_item_tag_to_menu_items_item_id",
+                   "ix_menu_item_tag_to_menu_items_tag_id",
+                   "ix_menu_items_category_id",
+                   "ix_order_headers_client_id",
+                   "ix_order_headers_delivery_guy_id",
+                   "uq_order_items_order_header_id_menu_item_id",
+                   "ix_order_status_updates_order_header_id_status")
+
+
+@migration(3, "Current courier statuses from the status history")
+def backfill_current_courier_statuses(connection: Connection):
+    connection.execute(text("INSERT INTO delivery_guy_current_statuses (delivery_guy_id, status_id, active) "
+                            "SELECT delivery_guy_id, id, active FROM delivery_guy_statuses "
+                            "WHERE id IN (SELECT max(id) FROM delivery_guy_statuses GROUP BY delivery_guy_id) "
+                            "AND delivery_guy_id NOT IN (SELECT delivery_guy_id FROM delivery_guy_current_statuses)"))
+
+
+def upgrade(connection: Connection) -> List[int]:
+    Base.metadata.create_all(connection)
+    schema_migrations.create(connection, checkfirst=True)
+    applied = set(connection.scalars(select(schema_migrations.c.version)))
+    done = []
+    for version, description, function in sorted(MIGRATIONS, key=lambda x: x[0]):
+        if version in applied:
+            continue
+        logger.info("Applying migration %s: %s", version, description)
+        function(connection)
+        connection.execute(insert(schema_migrations).values(version=version,
+                                                            description=description,
+                                                            applied_at=datetime.now()))
+        done.append(version)
+    return done
+
+
+async def migrate(bind=None) -> List[int]:
+    """Brings the database up to date, returns the versions applied now."""
+    async with (bind or database.engine).begin() as connection:
+        return await connection.run_sync(upgrade)
+
+
+async def main():
+    applied = await migrate()
+    await database.dispose()
+    print(f"Applied migrations: {applied}" if applied else "Database is up to date")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(format="%(asctime)s - %(name)s - %(levelname)s - %(message)s", level=logging.INFO)
+    asyncio.run(main())
@@ -0,0 +1,28 @@
+"""
+Keeps the process-wide caches of worker processes in sync.
+
+Every process has its own catalog, restaurant location index and courier pool. With several worker processes
+(see utils.workers) a change made through one of them has to reach the copies in the others: model methods that
+update these caches after a commit also publish() the same call, the worker mode forwards it to the other
+workers and they apply() it to their copies. In a single process publisher is None and nothing is sent.
+"""
+from typing import Callable, Optional, Tuple
+
+Message = Tuple[str, str, tuple]
+
+# set by utils.workers in worker processes
+publisher: Optional[Callable[[Message], None]] = None
+
+
+def publish(target: str, method: str, *args):
+    if publisher is not None:
+        publisher((target, method, args))
+
+
+def apply(message: Message):
+    from models.catalog import catalog
+    from models.dispatch import dispatcher
+    from models.geo import restaurant_locations
+    target, method, args = message
+    targets = {"catalog": catalog, "restaurant_locations": restaurant_locations, "dispatcher": dispatcher}
+    getattr(targets[target], method)(*args)
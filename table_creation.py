@@ -1,13 +1,7 @@
-from sqlalchemy import create_engine, select
-from sqlalchemy.orm import Session
+import asyncio
 
-from models.base import Base, User
+from models.migrations import main
 
 if __name__ == "__main__":
-    engine = create_engine("sqlite:///sample.db", echo=True)
-
-    Base.metadata.create_all(bind=engine)
-
-    session = Session(bind=engine)
-
-    session.commit()
+    # creates missing tables and applies pending migrations to the database from config.yml
+    asyncio.run(main())
@@ -0,0 +1,146 @@
+import asyncio
+import logging
+import random
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from telegram import Bot, Message
+from telegram.error import BadRequest, NetworkError, RetryAfter, TelegramError
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(slots=True)
+class Delivery:
+    chat_id: int
+    message: Optional[Message] = None
+    error: Optional[TelegramError] = None
+    attempts: int = 0
+
+    @property
+    def ok(self) -> bool:
+        return self.message is not None
+
+
+class RequestPacer:
+    """Spaces the bot's requests to Telegram 1 / requests_per_second apart and holds them all while Telegram asks
+    the bot to wait.
+
+    Telegram counts all the bot's requests against one limit of about 30 a second, so everything that may send
+    many requests in a row takes its turn here: broadcasts (see Broadcaster) and deletions (see utils.messages).
+    Low priority requests only take a turn no other request is waiting for, so a long cleanup never delays a
+    message a user waits for.
+    """
+
+    def __init__(self, requests_per_second: float = 25):
+        self.requests_per_second = requests_per_second
+        # loop time of the next free slot and of the end of a flood wait
+        self._next_slot = 0.0
+        self._paused_until = 0.0
+        self._waiting = 0
+
+    async def wait_turn(self, not_before: Callable[[], float] = None, low_priority: bool = False):
+        """Returns when the request may go; `not_before` adds a loop time of the caller's own, e.g. of a chat."""
+        loop = asyncio.get_running_loop()
+        # a request counts as waiting only while the bot's limit holds it back, not while it waits for its chat
+        waiting = False
+        try:
+            while True:
+                now = loop.time()
+                own = not_before() if not_before else 0.0
+                if own > now:
+                    if waiting:
+                        self._waiting -= 1
+                        waiting = False
+                    await asyncio.sleep(own - now)
+                    continue
+                if not low_priority and not waiting:
+                    self._waiting += 1
+                    waiting = True
+                ready = max(self._next_slot, self._paused_until)
+                if ready <= now and not (low_priority and self._waiting):
+                    break
+                # a low priority request that lets the others go first tries again a slot later
+                await asyncio.sleep(ready - now if ready > now else 1 / self.requests_per_second)
+        finally:
+            if waiting:
+                self._waiting -= 1
+        # nothing is awaited between the check and the booking, so two requests can't take the same slot
+        self._next_slot = now + 1 / self.requests_per_second
+
+    def pause(self, seconds: float):
+        self._paused_until = max(self._paused_until, asyncio.get_running_loop().time() + seconds)
+
+
+# one per process, utils.workers gives every worker its part of the limit
+pacer = RequestPacer()
+
+
+class Broadcaster:
+    """Sends messages to many chats at once within Telegram's rate limits.
+
+    Telegram allows a bot about 30 messages a second overall and one a second per chat. Sends take their turns
+    from the bot's RequestPacer and are spaced `chat_interval` apart per chat, at most `max_concurrent` requests
+    are in flight, and a RetryAfter pauses all requests of the bot for the time Telegram asks. Network errors and timeouts are retried with exponential backoff; errors that won't
+    go away on retry (the user blocked the bot, the chat doesn't exist) fail the recipient at once. One failed
+    recipient never stops the others, every call returns what happened to each of them.
+    """
+
+    def __init__(self, max_concurrent: int = 16, chat_interval: float = 1.0, retries: int = 3, backoff: float = 1.0,
+                 pacer: RequestPacer = pacer):
+        self.pacer = pacer
+        self.chat_interval = chat_interval
+        self.retries = retries
+        self.backoff = backoff
+        self._running = asyncio.Semaphore(max_concurrent)
+        # loop time of the next free slot of a chat
+        self._chat_slots: Dict[int, float] = {}
+
+    async def _wait_turn(self, chat_id: int):
+        await self.pacer.wait_turn(lambda: self._chat_slots.get(chat_id, 0.0))
+        # booked right after the pacer's slot, with nothing awaited in between
+        self._chat_slots[chat_id] = asyncio.get_running_loop().time() + self.chat_interval
+
+    async def _deliver(self, bot: Bot, chat_id: int, kwargs: dict) -> Delivery:
+        delivery = Delivery(chat_id=chat_id)
+        while True:
+            delivery.attempts += 1
+            await self._wait_turn(chat_id)
+            try:
+                async with self._running:
+                    delivery.message = await bot.send_message(chat_id=chat_id, **kwargs)
+                delivery.error = None
+                return delivery
+            except RetryAfter as error:
+                # flood control is per bot, everybody waits
+                self.pacer.pause(error.retry_after)
+                delivery.error = error
+                delay = 0
+            except TelegramError as error:
+                delivery.error = error
+                if not isinstance(error, NetworkError) or isinstance(error, BadRequest):
+                    return delivery
+                delay = self.backoff * 2 ** (delivery.attempts - 1) * random.uniform(0.5, 1.5)
+            if delivery.attempts > self.retries:
+                return delivery
+            if delay:
+                await asyncio.sleep(delay)
+
+    async def send(self, bot: Bot, messages: Iterable[Tuple[int, dict]]) -> List[Delivery]:
+        """Sends every (chat id, send_message arguments) pair, returns the deliveries in the same order."""
+        deliveries = await asyncio.gather(*(self._deliver(bot, chat_id, kwargs) for chat_id, kwargs in messages))
+        now = asyncio.get_running_loop().time()
+        for chat_id in [chat_id for chat_id, ready in self._chat_slots.items() if ready <= now]:
+            del self._chat_slots[chat_id]
+        for delivery in deliveries:
+            if not delivery.ok:
+                logger.warning("Message to %s not delivered after %s attempt(s): %s",
+                               delivery.chat_id, delivery.attempts, delivery.error)
+        return deliveries
+
+    async def broadcast(self, bot: Bot, chat_ids: Iterable[int], text: str, **kwargs) -> List[Delivery]:
+        """Sends the same message to every chat."""
+        return await self.send(bot, ((chat_id, dict(text=text, **kwargs)) for chat_id in chat_ids))
+
+
+broadcaster = Broadcaster()
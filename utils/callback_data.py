@@ -0,0 +1,90 @@
+"""
+Short callback data for buttons with integer arguments.
+
+Telegram limits callback data to 64 bytes. "2_edit_menu_item_details_1375" spends 25 of them on the action name,
+so buttons are packed instead: a format marker, then base64url of the action id and the arguments as varints,
+e.g. pack("order_add_item_", 1375) == "~Ab4V". CallbackRouter unpacks them and calls the handler registered
+under the action name, exactly as for the plain "order_add_item_1375", which still works for buttons sent
+before packing was introduced.
+
+Action ids live in buttons already sent to users, which can be clicked days later: never change or reuse an id,
+only add new ones. An action whose arguments change gets a new id (and a new name), the old id keeps its old
+handler for as long as such buttons may exist.
+"""
+import base64
+import binascii
+from typing import Dict, Tuple
+
+# marker of the packed format, it never starts plain callback data; a new format gets a new marker
+MARKER = "~"
+MAX_LENGTH = 64
+
+ACTIONS: Dict[int, str] = {
+    1: "order_add_item_",
+    2: "order_remove_item_",
+    3: "order_items_page_",
+    4: "order_choose_category_",
+    5: "choose_restaurant_",
+    6: "order_choose_location_",
+    7: "order_restaurants_page_",
+    8: "order_delivered_",
+    9: "accept_promotion_",
+    10: "reject_promotion_",
+    11: "downgrade_",
+    12: "confirm_downgrade_",
+    13: "menu_item_category_",
+    14: "menu_category_delete_",
+    15: "confirm_category_delete_",
+    16: "1_edit_menu_item_",
+    17: "delete_menu_item_",
+    18: "confirm_item_delete_",
+    19: "2_edit_menu_item_details_",
+}
+ACTION_IDS: Dict[str, int] = {action: action_id for action_id, action in ACTIONS.items()}
+
+# base64url -> standard alphabet; "+", "/" and padding must not pass, so they become invalid characters
+_FROM_URLSAFE = str.maketrans({"-": "+", "_": "/", "+": "!", "/": "!", "=": "!"})
+
+
+def _write_varint(value: int, out: bytearray):
+    while value > 0x7F:
+        out.append(value & 0x7F | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def pack(action: str, *arguments: int) -> str:
+    out = bytearray()
+    _write_varint(ACTION_IDS[action], out)
+    for argument in arguments:
+        # zigzag, so small negative numbers stay short too
+        _write_varint(argument << 1 if argument >= 0 else (-argument << 1) - 1, out)
+    data = MARKER + base64.urlsafe_b64encode(out).rstrip(b"=").decode("ascii")
+    if len(data) > MAX_LENGTH:
+        raise ValueError(f"Callback data of {action} is longer than {MAX_LENGTH} bytes")
+    return data
+
+
+def unpack(data: str) -> Tuple[str, Tuple[int, ...]]:
+    """Action name and arguments of packed callback data, ValueError if it isn't valid."""
+    if not data.startswith(MARKER):
+        raise ValueError("Not packed callback data")
+    payload = data[len(MARKER):]
+    try:
+        raw = binascii.a2b_base64(payload.translate(_FROM_URLSAFE) + "=" * (-len(payload) % 4), strict_mode=True)
+    except binascii.Error as error:
+        raise ValueError("Malformed callback data") from error
+    values = []
+    value = shift = 0
+    for byte in raw:
+        value |= (byte & 0x7F) << shift
+        if byte & 0x80:
+            shift += 7
+            continue
+        values.append(value)
+        value = shift = 0
+    if shift or not values:
+        raise ValueError("Truncated callback data")
+    if values[0] not in ACTIONS:
+        raise ValueError(f"Unknown action {values[0]}")
+    return ACTIONS[values[0]], tuple([value >> 1 if not value & 1 else -((value + 1) >> 1) for value in values[1:]])
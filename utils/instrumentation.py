@@ -0,0 +1,90 @@
+"""
+SQL statements per handler.
+
+instrument() wraps every handler of the bot, the routes of CallbackRouter and the steps of conversations
+included, in models.base.measure_queries, reports latency and statements of every update to utils.metrics and
+logs a warning for each update whose handler ran more statements or took longer than the budget (query_budget
+in config.yml), with the slowest statement. assert_max_queries is the same measurement for tests and
+benchmarks: it fails when a block runs more statements than allowed, so an N+1 query shows up as soon as it is
+written.
+"""
+import functools
+import logging
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Iterator
+
+from telegram import Update
+from telegram.ext import Application, BaseHandler, CallbackContext, ConversationHandler
+
+from models.base import QueryStats, measure_queries
+from utils.metrics import observe_handler
+from utils.profiler import profiler
+from utils.router import CallbackRouter
+
+logger = logging.getLogger(__name__)
+
+Callback = Callable[..., Awaitable[Any]]
+
+
+@dataclass(slots=True)
+class QueryBudget:
+    queries: int = 20
+    milliseconds: float = 250
+
+
+def measured(callback: Callback, budget: QueryBudget) -> Callback:
+    @functools.wraps(callback)
+    async def wrapper(update: Update, context: CallbackContext, *arguments):
+        started = time.perf_counter()
+        with measure_queries(callback.__name__) as stats:
+            try:
+                return await callback(update, context, *arguments)
+            finally:
+                seconds = time.perf_counter() - started
+                observe_handler(stats.name, seconds, stats.count)
+                profiler.handler_called()
+                milliseconds = seconds * 1000
+                if stats.count > budget.queries or milliseconds > budget.milliseconds:
+                    logger.warning("%s ran %s SQL statements in %.1f ms (%.1f ms in the database), the budget is %s "
+                                   "statements and %s ms; the slowest took %.1f ms: %s",
+                                   stats.name, stats.count, milliseconds, stats.seconds * 1000, budget.queries,
+                                   budget.milliseconds, stats.slowest * 1000, " ".join(stats.slowest_statement.split()))
+    # code objects compare by value: named after the handler, the wrapper of every handler has a code object the
+    # profiler tells apart from the others by the running frame's code alone
+    wrapper.__code__ = wrapper.__code__.replace(co_name=callback.__name__)
+    profiler.register_handler(wrapper.__code__, callback.__name__)
+    return wrapper
+
+
+def _instrument(handler: BaseHandler, budget: QueryBudget):
+    if isinstance(handler, ConversationHandler):
+        for step in handler.entry_points + handler.fallbacks + [step for steps in handler.states.values()
+                                                                for step in steps]:
+            _instrument(step, budget)
+    elif isinstance(handler, CallbackRouter):
+        handler.wrap(lambda callback: measured(callback, budget))
+    else:
+        handler.callback = measured(handler.callback, budget)
+
+
+def instrument(application: Application, budget: QueryBudget):
+    """Call after all handlers are added, handlers added later are not measured."""
+    for handlers in application.handlers.values():
+        for handler in handlers:
+            _instrument(handler, budget)
+
+
+@contextmanager
+def assert_max_queries(limit: int, name: str = "block") -> Iterator[QueryStats]:
+    """For tests: AssertionError listing the statements if the block runs more than `limit` of them, e.g.
+
+        with assert_max_queries(2, "start_ordering"):
+            await application.process_update(update)
+    """
+    with measure_queries(name, record=True) as stats:
+        yield stats
+    if stats.count > limit:
+        raise AssertionError(f"{name} ran {stats.count} SQL statements, {limit} allowed:\n"
+                             + "\n".join(" ".join(statement.split()) for statement in stats.statements))
@@ -0,0 +1,82 @@
+import asyncio
+import logging
+from typing import Dict, Hashable, Iterable, List
+
+from telegram.error import BadRequest, RetryAfter, TelegramError
+from telegram.ext import CallbackContext
+
+from utils.broadcast import pacer
+
+logger = logging.getLogger(__name__)
+
+# throwaway messages (one per location, category, menu item, ...) are kept in chat_data as
+# {"ephemeral": {screen: {key: message_id}}}, so only ints are stored per chat
+EPHEMERAL_KEY = "ephemeral"
+# Bot API allows deleting up to 100 messages of a chat with one deleteMessages call
+DELETE_BATCH_SIZE = 100
+DELETE_ATTEMPTS = 3
+
+
+def remember(context: CallbackContext, screen: str, key: Hashable, message_id: int):
+    context.chat_data.setdefault(EPHEMERAL_KEY, {}).setdefault(screen, {})[key] = message_id
+
+
+def screen_messages(context: CallbackContext, screen: str) -> Dict[Hashable, int]:
+    return context.chat_data.get(EPHEMERAL_KEY, {}).get(screen, {})
+
+
+def forget_screen(context: CallbackContext, screen: str) -> Dict[Hashable, int]:
+    screens = context.chat_data.get(EPHEMERAL_KEY, {})
+    messages = screens.pop(screen, {})
+    if not screens:
+        context.chat_data.pop(EPHEMERAL_KEY, None)
+    return messages
+
+
+async def _delete_one(context: CallbackContext, chat_id: int, message_id: int):
+    for _ in range(DELETE_ATTEMPTS):
+        # deletions share the bot's limit with sends and go after them
+        await pacer.wait_turn(low_priority=True)
+        try:
+            await context.bot.delete_message(chat_id=chat_id, message_id=message_id)
+            return
+        except RetryAfter as error:
+            pacer.pause(error.retry_after)
+        except BadRequest as error:
+            # already deleted by the user or too old to delete
+            logger.debug("Message %s in chat %s was not deleted: %s", message_id, chat_id, error)
+            return
+    logger.warning("Message %s in chat %s was not deleted, flood control after %s attempts",
+                   message_id, chat_id, DELETE_ATTEMPTS)
+
+
+async def _delete_batch(bulk_delete, chat_id: int, message_ids: List[int]):
+    for _ in range(DELETE_ATTEMPTS):
+        await pacer.wait_turn(low_priority=True)
+        try:
+            await bulk_delete(chat_id=chat_id, message_ids=message_ids)
+            return
+        except RetryAfter as error:
+            pacer.pause(error.retry_after)
+        except TelegramError as error:
+            logger.debug("Bulk delete in chat %s failed: %s", chat_id, error)
+            return
+    logger.warning("%s messages in chat %s were not deleted, flood control after %s attempts",
+                   len(message_ids), chat_id, DELETE_ATTEMPTS)
+
+
+async def delete_messages(context: CallbackContext, chat_id: int, message_ids: Iterable[int]):
+    message_ids = list(message_ids)
+    bulk_delete = getattr(context.bot, "delete_messages", None)
+    if bulk_delete:
+        for i in range(0, len(message_ids), DELETE_BATCH_SIZE):
+            await _delete_batch(bulk_delete, chat_id, message_ids[i:i + DELETE_BATCH_SIZE])
+        return
+    await asyncio.gather(*(_delete_one(context, chat_id, message_id) for message_id in message_ids))
+
+
+async def clear_screen(context: CallbackContext, chat_id: int, screen: str, keep: Hashable = None):
+    """Deletes every message registered for the screen except the one stored under `keep`."""
+    messages = forget_screen(context, screen)
+    await delete_messages(context, chat_id, (message_id for key, message_id in messages.items() if key != keep))
+    return messages.get(keep)
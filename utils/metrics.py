@@ -0,0 +1,116 @@
+"""
+Prometheus metrics of the bot.
+
+Handler latency and SQL statements per update come from utils.instrumentation, which observes every handler
+under its name (for callback queries the name of the routed action's handler). Bot API requests are measured by
+MeasuredRequest around the HTTP client of the bot: count and latency per method, errors per method and type,
+RetryAfter included. The update queue, the updates waiting for an earlier update of their chat, the database
+connection pools (label engine="writer" or "reader" with the sqlite_wal profile), the menu catalog and the
+courier dispatcher are read when Prometheus scrapes, so they cost nothing in between.
+
+serve() exposes them in the Prometheus text format when config.yml has a metrics section:
+
+    metrics:
+      port: 9100            # worker processes (see utils.workers) serve on port + worker index
+      listen: "127.0.0.1"
+"""
+import time
+from typing import Iterator, Optional
+
+from prometheus_client import REGISTRY, Counter, Histogram, start_http_server
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily, Metric
+from prometheus_client.registry import Collector
+from telegram.error import TelegramError
+from telegram.ext import Application
+from telegram.request import BaseRequest, RequestData
+
+from models.catalog import catalog
+from models.database import database
+from models.dispatch import dispatcher
+from utils.update_processor import ChatOrderedUpdateProcessor
+
+HANDLER_SECONDS = Histogram("bot_handler_seconds", "Time a handler took to handle one update", ["handler"])
+HANDLER_STATEMENTS = Histogram("bot_handler_sql_statements", "SQL statements a handler ran for one update",
+                               ["handler"], buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, float("inf")))
+API_SECONDS = Histogram("bot_api_request_seconds", "Duration of Bot API requests", ["method"])
+API_ERRORS = Counter("bot_api_errors", "Failed Bot API requests", ["method", "error"])
+
+
+def observe_handler(name: str, seconds: float, statements: int):
+    HANDLER_SECONDS.labels(name).observe(seconds)
+    HANDLER_STATEMENTS.labels(name).observe(statements)
+
+
+class MeasuredRequest(BaseRequest):
+    """Wraps the HTTP client of the bot. The count of requests per method is the _count of the histogram."""
+
+    def __init__(self, request: BaseRequest):
+        self._request = request
+
+    @property
+    def read_timeout(self) -> Optional[float]:
+        return self._request.read_timeout
+
+    async def initialize(self):
+        await self._request.initialize()
+
+    async def shutdown(self):
+        await self._request.shutdown()
+
+    async def do_request(self, *args, **kwargs):
+        return await self._request.do_request(*args, **kwargs)
+
+    async def post(self, url: str, request_data: RequestData = None, *args, **kwargs):
+        method = url.rsplit("/", 1)[-1]
+        started = time.perf_counter()
+        try:
+            return await super().post(url, request_data, *args, **kwargs)
+        except TelegramError as error:
+            API_ERRORS.labels(method, type(error).__name__).inc()
+            raise
+        finally:
+            API_SECONDS.labels(method).observe(time.perf_counter() - started)
+
+
+class BotCollector(Collector):
+    def __init__(self, application: Application):
+        self.application = application
+
+    def collect(self) -> Iterator[Metric]:
+        yield GaugeMetricFamily("bot_update_queue_depth", "Updates waiting to be handled",
+                                value=self.application.update_queue.qsize())
+        processor = self.application.update_processor
+        if isinstance(processor, ChatOrderedUpdateProcessor):
+            yield GaugeMetricFamily("bot_updates_waiting_for_chat",
+                                    "Updates waiting for an earlier update of their chat to finish",
+                                    value=processor.waiting_updates)
+        in_use = GaugeMetricFamily("bot_db_connections_in_use", "Database connections checked out of the pool",
+                                   labels=["engine"])
+        size = GaugeMetricFamily("bot_db_pool_size", "Size of the database connection pool", labels=["engine"])
+        overflow = GaugeMetricFamily("bot_db_pool_overflow", "Connections opened over the pool size", labels=["engine"])
+        engines = {"writer": database.engine}
+        if database.reader_engine is not database.engine:
+            engines["reader"] = database.reader_engine
+        for name, engine in engines.items():
+            pool = engine.pool
+            if hasattr(pool, "checkedout"):
+                # queue pools only, SQLite in memory and NullPool have nothing to report
+                in_use.add_metric([name], pool.checkedout())
+                size.add_metric([name], pool.size())
+                overflow.add_metric([name], max(pool.overflow(), 0))
+        if in_use.samples:
+            yield from (in_use, size, overflow)
+        lookups = CounterMetricFamily("bot_catalog_lookups", "Menu catalog lookups", labels=["result"])
+        lookups.add_metric(["hit"], catalog.hits)
+        lookups.add_metric(["miss"], catalog.misses)
+        yield lookups
+        yield GaugeMetricFamily("bot_catalog_entries", "Entries in the menu catalog", value=catalog.stats["entries"])
+        yield GaugeMetricFamily("bot_couriers_on_shift", "Couriers on shift", value=len(dispatcher.couriers))
+        yield GaugeMetricFamily("bot_orders_waiting", "Published orders waiting for a courier",
+                                value=len(dispatcher.pending))
+
+
+def serve(application: Application, metrics: dict, worker: int = 0):
+    """Serves /metrics from a thread, one port per process."""
+    REGISTRY.register(BotCollector(application))
+    start_http_server(metrics.get("port", 9100) + worker, addr=metrics.get("listen", "127.0.0.1"))
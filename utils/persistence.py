@@ -0,0 +1,172 @@
+import asyncio
+import json
+import logging
+import pickle
+import sqlite3
+from collections import defaultdict
+from typing import Any, Dict, Optional, Tuple
+
+from telegram.ext import BasePersistence, PersistenceInput
+
+logger = logging.getLogger(__name__)
+
+# one row per chat/user, so a flush rewrites only the rows of chats that changed since the last one
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS data (
+    kind TEXT NOT NULL,
+    id INTEGER NOT NULL,
+    value BLOB NOT NULL,
+    PRIMARY KEY (kind, id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS conversations (
+    name TEXT NOT NULL,
+    key TEXT NOT NULL,
+    state BLOB NOT NULL,
+    PRIMARY KEY (name, key)
+) WITHOUT ROWID;
+"""
+
+# bot_data and callback_data are single objects, they are stored under this id
+SINGLETON_ID = 0
+
+
+class SQLitePersistence(BasePersistence):
+    """Keeps chat_data, user_data and conversation states in a SQLite file.
+
+    Application calls update_* only for the chats touched since the previous run of the update job (every
+    `update_interval` seconds), so every flush costs one transaction with one row per active chat, no matter how
+    many chats the bot knows. Values are pickled per chat and must hold only plain data: ids instead of ORM
+    objects or telegram Messages.
+
+    With `shard=(index, count)` only the chats with chat id % count == index are loaded, so worker processes
+    sharing the file (see utils.workers) each read and write the rows of their own chats only.
+    """
+
+    __slots__ = ("filepath", "shard", "_connection", "_lock", "_pending_data", "_pending_conversations",
+                 "_conversations")
+
+    def __init__(self, filepath: str, store_data: PersistenceInput = None, update_interval: float = 60,
+                 shard: Tuple[int, int] = (0, 1)):
+        super().__init__(store_data=store_data or PersistenceInput(bot_data=False, callback_data=False),
+                         update_interval=update_interval)
+        self.filepath = filepath
+        self.shard = shard
+        self._connection: Optional[sqlite3.Connection] = None
+        self._lock = asyncio.Lock()
+        self._pending_data: Dict[Tuple[str, int], Optional[bytes]] = {}
+        self._pending_conversations: Dict[Tuple[str, str], Optional[bytes]] = {}
+        self._conversations: Optional[Dict[str, Dict]] = None
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        if self._connection is None:
+            self._connection = sqlite3.connect(self.filepath, check_same_thread=False)
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("PRAGMA synchronous=NORMAL")
+            self._connection.executescript(SCHEMA)
+        return self._connection
+
+    def _owns(self, chat_id: int) -> bool:
+        index, count = self.shard
+        return chat_id % count == index
+
+    def _load(self, kind: str) -> Dict[int, Any]:
+        rows = self.connection.execute("SELECT id, value FROM data WHERE kind = ?", (kind,))
+        # users are sharded like chats: the bot only talks in private chats, where user id == chat id
+        return {row_id: pickle.loads(value) for row_id, value in rows
+                if row_id == SINGLETON_ID or self._owns(row_id)}
+
+    def _load_conversations(self) -> Dict[str, Dict]:
+        conversations = defaultdict(dict)
+        for name, key, state in self.connection.execute("SELECT name, key, state FROM conversations"):
+            key = tuple(json.loads(key))
+            # conversation keys start with the chat id
+            if self._owns(key[0]):
+                conversations[name][key] = pickle.loads(state)
+        return conversations
+
+    def _write(self, data: Dict[Tuple[str, int], Optional[bytes]],
+               conversations: Dict[Tuple[str, str], Optional[bytes]]):
+        with self.connection:
+            self.connection.executemany("INSERT OR REPLACE INTO data (kind, id, value) VALUES (?, ?, ?)",
+                                        ((kind, row_id, value) for (kind, row_id), value in data.items()
+                                         if value is not None))
+            self.connection.executemany("DELETE FROM data WHERE kind = ? AND id = ?",
+                                        (key for key, value in data.items() if value is None))
+            self.connection.executemany("INSERT OR REPLACE INTO conversations (name, key, state) VALUES (?, ?, ?)",
+                                        ((name, key, state) for (name, key), state in conversations.items()
+                                         if state is not None))
+            self.connection.executemany("DELETE FROM conversations WHERE name = ? AND key = ?",
+                                        (key for key, state in conversations.items() if state is None))
+
+    async def _commit(self):
+        # Application updates all dirty chats concurrently: the first call writes its own row, the next one
+        # picks up everything queued meanwhile, and the rest find nothing left to do
+        async with self._lock:
+            if not self._pending_data and not self._pending_conversations:
+                return
+            data, self._pending_data = self._pending_data, {}
+            conversations, self._pending_conversations = self._pending_conversations, {}
+            await asyncio.to_thread(self._write, data, conversations)
+
+    async def _store(self, kind: str, row_id: int, value: Any):
+        self._pending_data[(kind, row_id)] = None if value is None \
+            else pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        await self._commit()
+
+    async def get_chat_data(self) -> Dict[int, Dict]:
+        return await asyncio.to_thread(self._load, "chat")
+
+    async def get_user_data(self) -> Dict[int, Dict]:
+        return await asyncio.to_thread(self._load, "user")
+
+    async def get_bot_data(self) -> Dict:
+        return (await asyncio.to_thread(self._load, "bot")).get(SINGLETON_ID, {})
+
+    async def get_callback_data(self) -> Optional[Tuple]:
+        return (await asyncio.to_thread(self._load, "callback")).get(SINGLETON_ID)
+
+    async def get_conversations(self, name: str) -> Dict:
+        # every ConversationHandler asks for its states once on startup
+        if self._conversations is None:
+            self._conversations = await asyncio.to_thread(self._load_conversations)
+        return self._conversations.pop(name, {})
+
+    async def update_chat_data(self, chat_id: int, data: Dict):
+        await self._store("chat", chat_id, data)
+
+    async def update_user_data(self, user_id: int, data: Dict):
+        await self._store("user", user_id, data)
+
+    async def update_bot_data(self, data: Dict):
+        await self._store("bot", SINGLETON_ID, data)
+
+    async def update_callback_data(self, data: Tuple):
+        await self._store("callback", SINGLETON_ID, data)
+
+    async def update_conversation(self, name: str, key: Tuple[int, ...], new_state: Optional[object]):
+        self._pending_conversations[(name, json.dumps(key))] = None if new_state is None \
+            else pickle.dumps(new_state, protocol=pickle.HIGHEST_PROTOCOL)
+        await self._commit()
+
+    async def drop_chat_data(self, chat_id: int):
+        await self._store("chat", chat_id, None)
+
+    async def drop_user_data(self, user_id: int):
+        await self._store("user", user_id, None)
+
+    async def refresh_chat_data(self, chat_id: int, chat_data: Dict):
+        pass
+
+    async def refresh_user_data(self, user_id: int, user_data: Dict):
+        pass
+
+    async def refresh_bot_data(self, bot_data: Dict):
+        pass
+
+    async def flush(self):
+        await self._commit()
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+        logger.info("Persistence flushed to %s", self.filepath)
@@ -0,0 +1,137 @@
+"""
+Sampling profiler for a running bot, started by admins with /profile (see callbacks.admin_tools.profile).
+
+A thread looks at the stack of the event loop thread every `interval` seconds, so handlers run at full speed
+between samples and the overhead stays around a percent, unlike cProfile, which hooks every call. A sample is
+attributed to the handler it falls into: utils.instrumentation wraps every handler in a function with a code
+object of its own, registered here under the handler's name, and that function's frame is on the stack while the
+handler runs. The sampling thread only reads f_code and f_back of the frames: f_locals of a frame that is running
+in another thread is not safe to read. Samples outside handlers are the idle event loop or background work
+(persistence flushes, broadcasts).
+
+With worker processes (see utils.workers) only the worker that handles the admin's chat is profiled.
+"""
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from types import CodeType, FrameType
+from typing import Dict, Optional
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+IDLE = "(event loop idle)"
+OUTSIDE = "(outside handlers)"
+
+
+class SamplingProfiler:
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        # handlers called while profiling, an update that goes to several handlers counts for each of them
+        self.handler_calls = 0
+        self.started = 0.0
+        self.elapsed = 0.0
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._names: Dict[CodeType, str] = {}
+        self._handlers: Dict[CodeType, str] = {}
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None
+
+    def start(self):
+        """Profiles the thread it is called from, the one running the event loop."""
+        if self.running:
+            raise RuntimeError("The profiler is already running")
+        self.stacks.clear()
+        self.handler_calls = 0
+        self.started = time.perf_counter()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._sample, args=(threading.get_ident(),), name="profiler",
+                                        daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        self.elapsed = time.perf_counter() - self.started
+
+    def register_handler(self, code: CodeType, name: str):
+        """Samples with a frame of `code` on the stack are attributed to the handler `name`."""
+        self._handlers[code] = name
+
+    def handler_called(self):
+        # called by utils.instrumentation for every handler call, cheap enough to stay there when not profiling
+        self.handler_calls += 1
+
+    def _name(self, code: CodeType) -> str:
+        name = self._names.get(code)
+        if name is None:
+            path = code.co_filename
+            if path.startswith(ROOT):
+                path = os.path.relpath(path, ROOT)
+            elif "site-packages" in path:
+                path = path.split("site-packages" + os.sep, 1)[1]
+            else:
+                path = os.path.basename(path)
+            name = self._names[code] = f"{code.co_name} ({path}:{code.co_firstlineno})"
+        return name
+
+    def _sample(self, thread_id: int):
+        while not self._stop.wait(self.interval):
+            frame: Optional[FrameType] = sys._current_frames().get(thread_id)
+            frames = []
+            handler = None
+            while frame is not None:
+                code = frame.f_code
+                handler = self._handlers.get(code)
+                if handler is not None:
+                    break
+                frames.append(code)
+                frame = frame.f_back
+            if handler is None and frames and frames[0].co_name in ("select", "poll"):
+                self.stacks[(IDLE,)] += 1
+                continue
+            self.stacks[(handler or OUTSIDE,) + tuple(self._name(code) for code in reversed(frames))] += 1
+
+    def collapsed(self) -> str:
+        """Folded stacks ("handler;outer;...;inner count"), the input of flamegraph.pl and speedscope."""
+        return "".join(f"{';'.join(stack)} {count}\n" for stack, count in self.stacks.most_common())
+
+    def report(self, top: int = 25) -> str:
+        total = sum(self.stacks.values()) or 1
+        per_handler: Counter = Counter()
+        own: Counter = Counter()
+        inclusive: Counter = Counter()
+        handler_functions: Dict[str, Counter] = {}
+        for stack, count in self.stacks.items():
+            handler, frames = stack[0], stack[1:]
+            per_handler[handler] += count
+            if handler in (IDLE, OUTSIDE):
+                continue
+            if frames:
+                own[frames[-1]] += count
+            for function in set(frames):
+                inclusive[function] += count
+                handler_functions.setdefault(handler, Counter())[function] += count
+        busy = sum(count for handler, count in per_handler.items() if handler not in (IDLE, OUTSIDE)) or 1
+
+        lines = [f"{self.elapsed:.1f} s, {total} samples every {self.interval * 1000:.0f} ms, "
+                 f"{self.handler_calls} handler calls", "",
+                 "Samples per handler (% of all samples):"]
+        lines += [f"{count:8} {count / total:6.1%}  {handler}" for handler, count in per_handler.most_common()]
+        lines += ["", "Functions by own time in handlers (% of handler samples):"]
+        lines += [f"{count:8} {count / busy:6.1%}  {function}" for function, count in own.most_common(top)]
+        lines += ["", "Functions by total time in handlers, callees included:"]
+        lines += [f"{count:8} {count / busy:6.1%}  {function}" for function, count in inclusive.most_common(top)]
+        for handler, functions in sorted(handler_functions.items(), key=lambda item: -per_handler[item[0]]):
+            lines += ["", f"{handler}, {per_handler[handler]} samples, by total time:"]
+            lines += [f"{count:8} {count / per_handler[handler]:6.1%}  {function}"
+                      for function, count in functions.most_common(10)]
+        return "\n".join(lines) + "\n"
+
+
+profiler = SamplingProfiler()
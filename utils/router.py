@@ -0,0 +1,103 @@
+from typing import Any, Awaitable, Callable, Dict, Optional, Sequence, Tuple
+
+from telegram import Update
+from telegram.ext import Application, BaseHandler, CallbackContext
+
+from utils.callback_data import MARKER, unpack
+
+Callback = Callable[..., Awaitable[Any]]
+Route = Tuple[Callback, Sequence[Callable[[str], Any]]]
+
+
+class CallbackRouter(BaseHandler[Update, CallbackContext]):
+    """One handler for all plain callback queries of the bot.
+
+    Actions without arguments are looked up in a dict. Actions with arguments are registered by prefix, e.g.
+    add("order_items_page_", order_items_page, int, int) for "order_items_page_{category_id}_{page}": the
+    callback data is matched against a prefix trie, one step per character, the longest registered prefix wins,
+    and the rest is split by "_" and converted by the given types (the last argument takes whatever is left).
+    The handler is then called as handler(update, context, *arguments), so handlers don't parse callback data.
+
+    Packed callback data (see utils.callback_data) is unpacked and goes to the route of the packed action name.
+
+    Data that matches no route, or whose arguments don't convert, is left to the handlers registered after the
+    router (conversation entry points).
+    """
+
+    __slots__ = ("_exact", "_trie", "_prefixes")
+
+    def __init__(self):
+        super().__init__(self._dispatch)
+        self._exact: Dict[str, Callback] = {}
+        # node: {character: node}, a node that ends a registered prefix has its route under None
+        self._trie: Dict[Optional[str], Any] = {}
+        self._prefixes: Dict[str, Route] = {}
+
+    @staticmethod
+    async def _dispatch(update: Update, context: CallbackContext):
+        handler, arguments = context.route
+        return await handler(update, context, *arguments)
+
+    def add(self, action: str, handler: Callback, *types: Callable[[str], Any]):
+        if not types:
+            self._exact[action] = handler
+            return
+        node = self._trie
+        for character in action:
+            node = node.setdefault(character, {})
+        node[None] = self._prefixes[action] = (handler, types)
+
+    def wrap(self, decorator: Callable[[Callback], Callback]):
+        """Replaces the handler of every route by decorator(handler), e.g. to measure them."""
+        routes = [(action, handler, ()) for action, handler in self._exact.items()]
+        routes += [(action, handler, types) for action, (handler, types) in self._prefixes.items()]
+        self._exact, self._trie, self._prefixes = {}, {}, {}
+        for action, handler, types in routes:
+            self.add(action, decorator(handler), *types)
+
+    def match(self, data: str) -> Optional[Tuple[Callback, tuple]]:
+        handler = self._exact.get(data)
+        if handler is not None:
+            return handler, ()
+        if data.startswith(MARKER):
+            return self._match_packed(data)
+        node = self._trie
+        route: Optional[Route] = None
+        end = 0
+        for position, character in enumerate(data):
+            node = node.get(character)
+            if node is None:
+                break
+            if None in node:
+                route, end = node[None], position + 1
+        if route is None or end == len(data):
+            return None
+        handler, types = route
+        parts = data[end:].split("_", len(types) - 1)
+        if len(parts) != len(types):
+            return None
+        try:
+            return handler, tuple(convert(part) for convert, part in zip(types, parts))
+        except ValueError:
+            return None
+
+    def _match_packed(self, data: str) -> Optional[Tuple[Callback, tuple]]:
+        try:
+            action, arguments = unpack(data)
+        except ValueError:
+            return None
+        route = self._prefixes.get(action)
+        if route is None or len(route[1]) != len(arguments):
+            return None
+        handler, types = route
+        return handler, tuple(convert(argument) for convert, argument in zip(types, arguments))
+
+    def check_update(self, update: object) -> Optional[Tuple[Callback, tuple]]:
+        if isinstance(update, Update) and update.callback_query and isinstance(update.callback_query.data, str):
+            return self.match(update.callback_query.data)
+        return None
+
+    def collect_additional_context(self, context: CallbackContext, update: Update, application: Application,
+                                   check_result: Tuple[Callback, tuple]):
+        # the route check_update matched, _dispatch calls it
+        context.route = check_result
@@ -0,0 +1,62 @@
+import asyncio
+from typing import Any, Awaitable, Dict, List
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+
+class ChatOrderedUpdateProcessor(BaseUpdateProcessor):
+    """Processes updates of different chats concurrently, but updates of one chat strictly one after another,
+    because handlers keep the state of a chat (order, order_message, ...) in chat_data."""
+    __slots__ = ("_running", "_running_limit", "_chat_locks")
+
+    def __init__(self, max_concurrent_updates: int, max_pending_updates: int = 4096):
+        self._running_limit = max_concurrent_updates
+        super().__init__(max_concurrent_updates)
+        # the base semaphore only limits updates taken from the queue; updates waiting for their chat
+        # don't hold a running slot, so one busy chat can't starve the others. The base class sized it by
+        # max_concurrent_updates, which is the running limit here
+        self._semaphore = asyncio.BoundedSemaphore(max(max_pending_updates, max_concurrent_updates))
+        self._running = asyncio.BoundedSemaphore(max_concurrent_updates)
+        self._chat_locks: Dict[int, List[Any]] = {}
+
+    @property
+    def max_concurrent_updates(self) -> int:
+        return self._running_limit
+
+    @staticmethod
+    def chat_key(update: object):
+        if isinstance(update, Update):
+            if update.effective_chat:
+                return update.effective_chat.id
+            if update.effective_user:
+                return update.effective_user.id
+        return None
+
+    @property
+    def waiting_updates(self) -> int:
+        """Updates waiting for an earlier update of their chat to finish."""
+        return sum(count - int(lock.locked()) for lock, count in self._chat_locks.values())
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        key = self.chat_key(update)
+        if key is None:
+            async with self._running:
+                await coroutine
+            return
+        entry = self._chat_locks.setdefault(key, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                async with self._running:
+                    await coroutine
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                self._chat_locks.pop(key, None)
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        self._chat_locks.clear()
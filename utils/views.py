@@ -0,0 +1,61 @@
+import hashlib
+from typing import Dict, Iterable, Sequence, Tuple
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.error import BadRequest
+from telegram.ext import CallbackContext
+
+# last rendered state of the few most recently edited messages of a chat
+VIEW_KEY = "views"
+VIEW_HISTORY = 8
+
+# keyboards of static menus by id of the menu, kept together with the menu so that its id can't be reused
+_static_keyboards: Dict[int, Tuple[Sequence[dict], InlineKeyboardMarkup]] = {}
+
+
+def keyboard(buttons: Iterable[dict]) -> InlineKeyboardMarkup:
+    """One button per row, built from {"text": ..., "callback_data": ...} dicts.
+    Markups are immutable, so keyboards of static menus can be built once and shared."""
+    return InlineKeyboardMarkup([[InlineKeyboardButton(**x)] for x in buttons])
+
+
+def view_state(text: str, reply_markup: InlineKeyboardMarkup = None) -> bytes:
+    """Digest of a screen. chat_data is persisted and shared by worker processes, so it must not be hash(),
+    which differs from one interpreter to the next."""
+    digest = hashlib.blake2b(text.encode(), digest_size=16)
+    if reply_markup is not None:
+        # the separator keeps a text that ends like a keyboard apart from that text with the keyboard
+        digest.update(b"\0" + reply_markup.to_json().encode())
+    return digest.digest()
+
+
+def static_keyboard(buttons: Sequence[dict]) -> InlineKeyboardMarkup:
+    """keyboard() of a menu that never changes (a module constant), built once and shared by all chats.
+    main.load_caches builds them on startup, so the first click on a menu doesn't pay for it."""
+    entry = _static_keyboards.get(id(buttons))
+    if entry is None:
+        entry = _static_keyboards[id(buttons)] = (buttons, keyboard(buttons))
+    return entry[1]
+
+
+async def render(context: CallbackContext, chat_id: int, message_id: int, text: str,
+                 reply_markup: InlineKeyboardMarkup = None) -> bool:
+    """Shows text and keyboard in the message with one API call. Nothing is sent if the message already shows
+    exactly this screen, so every edit of a tracked message has to go through here."""
+    state = view_state(text, reply_markup)
+    views = context.chat_data.setdefault(VIEW_KEY, {})
+    if views.get(message_id) == state:
+        return False
+    try:
+        await context.bot.edit_message_text(chat_id=chat_id,
+                                            message_id=message_id,
+                                            text=text,
+                                            reply_markup=reply_markup)
+    except BadRequest as error:
+        if "not modified" not in str(error):
+            raise
+    views.pop(message_id, None)
+    views[message_id] = state
+    while len(views) > VIEW_HISTORY:
+        views.pop(next(iter(views)))
+    return True
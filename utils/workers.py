@@ -0,0 +1,122 @@
+"""
+Runs the bot as one front process and several worker processes.
+
+The front process only receives updates (polling or webhook, as configured) and hands each one to a worker
+chosen by chat id, so all updates of a chat go to the same worker, in order, and its chat_data and
+conversations stay in that process (SQLitePersistence loads only the worker's shard of chats). Workers run the
+usual Application with all handlers. Everything shared lives in the database; the in-memory caches (catalog,
+restaurant locations, courier pool) are kept in sync by models.sync messages, which the front relays from the
+worker that made a change to all the others.
+"""
+import asyncio
+import json
+import logging
+import multiprocessing
+import signal
+import threading
+from typing import Awaitable, Callable, List, Tuple
+
+from telegram import Bot, Update
+from telegram.ext import Application, Updater
+
+from utils.update_processor import ChatOrderedUpdateProcessor
+
+logger = logging.getLogger(__name__)
+
+UPDATE = "update"
+SYNC = "sync"
+
+# build(config, shard=(index, count)) -> Application without an updater
+ApplicationFactory = Callable[..., Application]
+# start_updater(updater, config) starts polling or the webhook
+UpdaterStarter = Callable[[Updater, dict], Awaitable]
+
+
+def shard_of(update: object, count: int) -> int:
+    key = ChatOrderedUpdateProcessor.chat_key(update)
+    return 0 if key is None else key % count
+
+
+async def serve(index: int, count: int, config: dict, inbox, outbox, build: ApplicationFactory):
+    from models import sync
+    from utils.broadcast import pacer
+
+    sync.publisher = lambda message: outbox.put((index, message))
+    # Telegram's limit is per bot, every worker gets its part of it
+    pacer.requests_per_second /= count
+    application = build(config, shard=(index, count))
+    async with application:
+        if application.post_init:
+            await application.post_init(application)
+        await application.start()
+        logger.info("Worker %s of %s started", index, count)
+        while True:
+            message = await asyncio.to_thread(inbox.get)
+            if message is None:
+                break
+            kind, payload = message
+            if kind == UPDATE:
+                await application.update_queue.put(Update.de_json(json.loads(payload), application.bot))
+            else:
+                sync.apply(payload)
+        await application.stop()
+        if application.post_stop:
+            await application.post_stop(application)
+
+
+def worker_main(index: int, count: int, config: dict, inbox, outbox, build: ApplicationFactory):
+    # Ctrl-C reaches the whole process group, the front stops the workers once it has stopped receiving
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    asyncio.run(serve(index, count, config, inbox, outbox, build))
+
+
+def relay(inboxes: List, outbox):
+    """Forwards cache changes published by one worker to all the others."""
+    while True:
+        message: Tuple[int, tuple] = outbox.get()
+        if message is None:
+            return
+        sender, payload = message
+        for index, inbox in enumerate(inboxes):
+            if index != sender:
+                inbox.put((SYNC, payload))
+
+
+async def front(config: dict, inboxes: List, start_updater: UpdaterStarter):
+    queue: asyncio.Queue = asyncio.Queue()
+    updater = Updater(Bot(config["token"]), queue)
+    async with updater:
+        await start_updater(updater, config)
+        logger.info("Receiving updates for %s workers", len(inboxes))
+        try:
+            while True:
+                update = await queue.get()
+                inboxes[shard_of(update, len(inboxes))].put((UPDATE, update.to_json()))
+        finally:
+            await updater.stop()
+
+
+def run_workers(config: dict, count: int, build: ApplicationFactory, start_updater: UpdaterStarter):
+    # workers are spawned, not forked: the parent may already hold database connections and event loop state
+    context = multiprocessing.get_context("spawn")
+    inboxes = [context.Queue() for _ in range(count)]
+    outbox = context.Queue()
+    workers = [context.Process(target=worker_main, name=f"worker-{index}",
+                               args=(index, count, config, inboxes[index], outbox, build))
+               for index in range(count)]
+    for worker in workers:
+        worker.start()
+    relay_thread = threading.Thread(target=relay, args=(inboxes, outbox), daemon=True)
+    relay_thread.start()
+    try:
+        asyncio.run(front(config, inboxes, start_updater))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        # updates already handed out are processed before the workers exit
+        for inbox in inboxes:
+            inbox.put(None)
+        for worker in workers:
+            worker.join()
+        outbox.put(None)
+        relay_thread.join()